@@ -0,0 +1,184 @@
+"""
+Admission control for PomodoroFlow API
+
+Tracks the requests in flight in this worker and, when the proxy sends
+``X-Request-Start``, how long each request queued before reaching it. Once
+either passes a threshold, low-priority reads (history, stats, exports) are
+turned away with 503 before they touch the database; at higher thresholds
+normal requests are too. Critical endpoints (auth and starting or completing
+a timer) are always admitted, so the parts of the app users are actively
+waiting on stay responsive while the worker sheds load.
+
+Thresholds come from ADMISSION_* config. Current load, thresholds and shed
+counts are exported through the metrics registry.
+"""
+
+import threading
+import time
+from collections import Counter
+
+from flask import g, jsonify, request
+
+import metrics
+
+CRITICAL = 'critical'
+NORMAL = 'normal'
+LOW = 'low'
+
+ENDPOINT_PRIORITIES = {
+    'login': CRITICAL,
+    'register': CRITICAL,
+    'logout': CRITICAL,
+    'get_current_user': CRITICAL,
+    'create_timer_session': CRITICAL,
+    'complete_timer_session': CRITICAL,
+    'get_timer_sessions': LOW,
+    'get_user_stats': LOW,
+    'export_timer_sessions': LOW,
+    'get_analytics': LOW,
+}
+
+DEFAULT_MAX_INFLIGHT = 32
+DEFAULT_MAX_QUEUE_MS = 2000
+DEFAULT_LOW_MAX_INFLIGHT = 8
+DEFAULT_LOW_MAX_QUEUE_MS = 500
+
+RETRY_AFTER_SECONDS = 1
+
+# Admin and metrics paths are always admitted so overload stays observable
+EXEMPT_PREFIXES = ('/api/_',)
+
+
+def endpoint_priority(endpoint):
+    return ENDPOINT_PRIORITIES.get(endpoint, NORMAL)
+
+
+def queue_wait(header, now):
+    """Seconds since the proxy received the request, from X-Request-Start.
+
+    Accepts ``t=<seconds>`` or a bare number in seconds, milliseconds or
+    microseconds (as sent by nginx, Heroku and others). Returns 0.0 when the
+    header is missing or unusable.
+    """
+    if not header:
+        return 0.0
+    value = header.strip()
+    if value.startswith('t='):
+        value = value[2:]
+    try:
+        start = float(value)
+    except ValueError:
+        return 0.0
+    # Scale milli/microsecond timestamps down to seconds
+    while start > now * 100:
+        start /= 1000
+    return max(0.0, now - start)
+
+
+class AdmissionController:
+    """before/teardown request hooks that count in-flight work and shed load"""
+
+    def __init__(self, app):
+        self.limits = {
+            NORMAL: (app.config['ADMISSION_MAX_INFLIGHT'], app.config['ADMISSION_MAX_QUEUE_MS'] / 1000),
+            LOW: (app.config['ADMISSION_LOW_MAX_INFLIGHT'], app.config['ADMISSION_LOW_MAX_QUEUE_MS'] / 1000),
+        }
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.shed = Counter()  # (priority, reason) -> requests rejected
+        self._lock = threading.Lock()
+
+        app.before_request(self.before_request)
+        app.teardown_request(self.teardown_request)
+
+        metrics.registry.register_gauge(
+            'pomodoro_inflight_requests', 'Requests currently being served by this worker',
+            lambda: {(): self.in_flight}
+        )
+        metrics.registry.register_gauge(
+            'pomodoro_inflight_requests_peak', 'Most requests served at once by this worker',
+            lambda: {(): self.peak_in_flight}
+        )
+        metrics.registry.register_gauge(
+            'pomodoro_admission_shed_requests', 'Requests rejected by admission control',
+            self._shed_counts
+        )
+        metrics.registry.register_gauge(
+            'pomodoro_admission_threshold', 'Admission thresholds by priority',
+            self._thresholds
+        )
+
+    def _shed_counts(self):
+        with self._lock:
+            return {(('priority', priority), ('reason', reason)): count
+                    for (priority, reason), count in self.shed.items()}
+
+    def _thresholds(self):
+        values = {}
+        for priority, (max_inflight, max_queue) in self.limits.items():
+            values[(('priority', priority), ('limit', 'inflight'))] = max_inflight
+            values[(('priority', priority), ('limit', 'queue_seconds'))] = max_queue
+        return values
+
+    def _reject(self, priority, reason):
+        with self._lock:
+            self.shed[(priority, reason)] += 1
+        response = jsonify({'error': 'Server is busy, please retry shortly'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+        return response
+
+    def before_request(self):
+        if request.method == 'OPTIONS':
+            return None
+
+        wait = queue_wait(request.headers.get('X-Request-Start'), time.time())
+        if wait:
+            metrics.registry.observe_phase('queue_wait', wait)
+
+        priority = endpoint_priority(request.endpoint)
+        if request.path.startswith(EXEMPT_PREFIXES):
+            priority = CRITICAL
+
+        reason = None
+        with self._lock:
+            limit = self.limits.get(priority)
+            if limit is not None:
+                max_inflight, max_queue = limit
+                if self.in_flight >= max_inflight:
+                    reason = 'inflight'
+                elif wait > max_queue:
+                    reason = 'queue'
+            if reason is None:
+                self.in_flight += 1
+                self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+                g._admitted = True
+
+        if reason is not None:
+            return self._reject(priority, reason)
+        return None
+
+    def teardown_request(self, exc):
+        if g.pop('_admitted', False):
+            self.release()
+
+    def release(self):
+        """Stop counting one admitted request as in flight"""
+        with self._lock:
+            self.in_flight -= 1
+
+
+def init_app(app):
+    """Enable admission control unless ADMISSION_ENABLED is false; returns the controller or None"""
+    app.config.setdefault('ADMISSION_ENABLED', True)
+    app.config.setdefault('ADMISSION_MAX_INFLIGHT', DEFAULT_MAX_INFLIGHT)
+    app.config.setdefault('ADMISSION_MAX_QUEUE_MS', DEFAULT_MAX_QUEUE_MS)
+    app.config.setdefault('ADMISSION_LOW_MAX_INFLIGHT', DEFAULT_LOW_MAX_INFLIGHT)
+    app.config.setdefault('ADMISSION_LOW_MAX_QUEUE_MS', DEFAULT_LOW_MAX_QUEUE_MS)
+
+    if not app.config['ADMISSION_ENABLED']:
+        return None
+
+    controller = AdmissionController(app)
+    app.extensions['admission'] = controller
+    return controller
@@ -0,0 +1,301 @@
+"""
+Focus analytics for PomodoroFlow API
+
+Heatmaps, streaks and hour-of-day distributions are served from two rollup
+tables instead of scanning ``timer_sessions``:
+
+- ``focus_daily``: per user and day, sessions started, completed and the
+  completed focus (work) and break minutes
+- ``focus_hourly``: the same per user, day and hour of day
+
+Days and hours are in the user's own time zone. The rollups are updated
+incrementally from Python as sessions are started and completed, in the
+same transaction as the write, so a one-year heatmap reads at most 366
+rows. Changing a user's time zone rebuilds their rows. ``backfill``
+rebuilds them from the hot table and every archive partition. Time per
+subject comes from the user's timetables, which are already small and
+indexed by date.
+"""
+
+import argparse
+import sqlite3
+from datetime import date, timedelta
+
+import archive
+import timestamps
+
+DEFAULT_RANGE_DAYS = 365
+MAX_RANGE_DAYS = 366 * 5
+
+ROLLUP_TABLES = ('focus_daily', 'focus_hourly')
+
+
+def init_analytics_schema(conn):
+    """Create the rollup tables; backfills them when they are new"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'focus_daily'"
+    ).fetchone()
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS focus_daily (
+        user_id INTEGER NOT NULL,
+        day DATE NOT NULL,
+        sessions INTEGER NOT NULL DEFAULT 0,
+        completed_sessions INTEGER NOT NULL DEFAULT 0,
+        focus_minutes INTEGER NOT NULL DEFAULT 0,
+        break_minutes INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day)
+    ) WITHOUT ROWID''')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS focus_hourly (
+        user_id INTEGER NOT NULL,
+        day DATE NOT NULL,
+        hour INTEGER NOT NULL,
+        completed_sessions INTEGER NOT NULL DEFAULT 0,
+        focus_minutes INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day, hour)
+    ) WITHOUT ROWID''')
+
+    if not exists:
+        backfill(conn)
+
+
+def record_start(conn, user_id, started_at, tz):
+    """Count a newly started session. Call inside the INSERT's transaction."""
+    day = timestamps.local_day(started_at, tz)
+    conn.execute(
+        '''INSERT INTO focus_daily (user_id, day, sessions) VALUES (?, ?, 1)
+           ON CONFLICT (user_id, day) DO UPDATE SET sessions = sessions + 1''',
+        (user_id, day)
+    )
+
+
+def record_completion(conn, user_id, tz, started_at, session_type, duration):
+    """Count a session that was just completed. Call inside the UPDATE's transaction."""
+    day, hour = timestamps.local_day_hour(started_at, tz)
+    focus = duration if session_type == 'work' else 0
+    rest = 0 if session_type == 'work' else duration
+    conn.execute(
+        '''INSERT INTO focus_daily (user_id, day, completed_sessions, focus_minutes, break_minutes)
+           VALUES (?, ?, 1, ?, ?)
+           ON CONFLICT (user_id, day) DO UPDATE SET
+               completed_sessions = completed_sessions + 1,
+               focus_minutes = focus_minutes + excluded.focus_minutes,
+               break_minutes = break_minutes + excluded.break_minutes''',
+        (user_id, day, focus, rest)
+    )
+    conn.execute(
+        '''INSERT INTO focus_hourly (user_id, day, hour, completed_sessions, focus_minutes)
+           VALUES (?, ?, ?, 1, ?)
+           ON CONFLICT (user_id, day, hour) DO UPDATE SET
+               completed_sessions = completed_sessions + 1,
+               focus_minutes = focus_minutes + excluded.focus_minutes''',
+        (user_id, day, hour, focus)
+    )
+
+
+# Local day and hour of s.started_at for the session's user; UTC users skip
+# the Python functions
+_LOCAL_DAY = '''CASE WHEN u.timezone = 'UTC' THEN date(s.started_at / 1000, 'unixepoch')
+                    ELSE local_day(s.started_at, u.timezone) END'''
+_LOCAL_HOUR = '''CASE WHEN u.timezone = 'UTC' THEN CAST(strftime('%H', s.started_at / 1000, 'unixepoch') AS INTEGER)
+                     ELSE local_hour(s.started_at, u.timezone) END'''
+
+
+def _backfill_table(conn, table, user_filter, params):
+    conn.execute(
+        f'''INSERT INTO focus_daily
+                (user_id, day, sessions, completed_sessions, focus_minutes, break_minutes)
+            SELECT s.user_id, {_LOCAL_DAY} AS local, COUNT(*),
+                   SUM(CASE WHEN completed THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN completed AND session_type = 'work' THEN duration ELSE 0 END),
+                   SUM(CASE WHEN completed AND session_type != 'work' THEN duration ELSE 0 END)
+            FROM {table} s JOIN users u ON u.id = s.user_id
+            WHERE {user_filter}
+            GROUP BY s.user_id, local
+            ON CONFLICT (user_id, day) DO UPDATE SET
+                sessions = sessions + excluded.sessions,
+                completed_sessions = completed_sessions + excluded.completed_sessions,
+                focus_minutes = focus_minutes + excluded.focus_minutes,
+                break_minutes = break_minutes + excluded.break_minutes''',
+        params
+    )
+    conn.execute(
+        f'''INSERT INTO focus_hourly (user_id, day, hour, completed_sessions, focus_minutes)
+            SELECT s.user_id, {_LOCAL_DAY} AS local, {_LOCAL_HOUR} AS local_hour,
+                   COUNT(*), SUM(CASE WHEN session_type = 'work' THEN duration ELSE 0 END)
+            FROM {table} s JOIN users u ON u.id = s.user_id
+            WHERE completed AND {user_filter}
+            GROUP BY s.user_id, local, local_hour
+            ON CONFLICT (user_id, day, hour) DO UPDATE SET
+                completed_sessions = completed_sessions + excluded.completed_sessions,
+                focus_minutes = focus_minutes + excluded.focus_minutes''',
+        params
+    )
+
+
+def backfill(conn, user_id=None):
+    """Rebuild the rollups (for one user, or everyone) from hot and archived sessions"""
+    params = (user_id,) if user_id is not None else ()
+    for table in ROLLUP_TABLES:
+        conn.execute(f'DELETE FROM {table} WHERE {"user_id = ?" if params else "1"}', params)
+
+    timestamps.register_functions(conn)
+    user_filter = 's.user_id = ?' if params else '1'
+    _backfill_table(conn, 'main.timer_sessions', user_filter, params)
+    for _, table in archive.partition_tables(conn):
+        _backfill_table(conn, table, user_filter, params)
+    conn.commit()
+
+
+def delete_rollups(conn, user_id=None, before=None):
+    """Drop rollups for purged sessions: a user's (or everyone's), optionally only days before ``before``
+
+    ``before`` is a 'YYYY-MM-DD' local day.
+    """
+    conditions, params = [], []
+    if user_id is not None:
+        conditions.append('user_id = ?')
+        params.append(user_id)
+    if before is not None:
+        conditions.append('day < ?')
+        params.append(before)
+    where = ' AND '.join(conditions) or '1'
+    for table in ROLLUP_TABLES:
+        conn.execute(f'DELETE FROM {table} WHERE {where}', params)
+    conn.commit()
+
+
+def parse_range(start, end, today):
+    """Validate an inclusive [start, end] day range given as 'YYYY-MM-DD' strings"""
+    end = date.fromisoformat(end) if end else today
+    start = date.fromisoformat(start) if start else end - timedelta(days=DEFAULT_RANGE_DAYS - 1)
+    if start > end:
+        raise ValueError('from must not be after to')
+    if (end - start).days >= MAX_RANGE_DAYS:
+        raise ValueError(f'Range must be at most {MAX_RANGE_DAYS} days')
+    return start, end
+
+
+def heatmap(conn, user_id, start, end):
+    """Daily rows with any activity in [start, end]"""
+    return conn.execute(
+        '''SELECT day, sessions, completed_sessions, focus_minutes, break_minutes
+           FROM focus_daily WHERE user_id = ? AND day BETWEEN ? AND ?
+           ORDER BY day''',
+        (user_id, start.isoformat(), end.isoformat())
+    ).fetchall()
+
+
+def longest_streak(days):
+    """Longest run of consecutive dates in an ascending list of 'YYYY-MM-DD'"""
+    longest = current = 0
+    previous = None
+    for value in days:
+        day = date.fromisoformat(value)
+        current = current + 1 if previous is not None and day - previous == timedelta(days=1) else 1
+        longest = max(longest, current)
+        previous = day
+    return longest
+
+
+def current_streak(conn, user_id, today):
+    """Consecutive focus days ending today, or yesterday if today has none yet"""
+    cursor = conn.execute(
+        '''SELECT day FROM focus_daily
+           WHERE user_id = ? AND day <= ? AND focus_minutes > 0
+           ORDER BY day DESC''',
+        (user_id, today.isoformat())
+    )
+    streak = 0
+    expected = today
+    for (value,) in cursor:
+        day = date.fromisoformat(value)
+        if streak == 0 and day == today - timedelta(days=1):
+            expected = day
+        if day != expected:
+            break
+        streak += 1
+        expected = day - timedelta(days=1)
+    cursor.close()
+    return streak
+
+
+def hour_distribution(conn, user_id, start, end):
+    """Completed sessions and focus minutes for each hour of the day"""
+    hours = [{'hour': hour, 'completed_sessions': 0, 'focus_minutes': 0} for hour in range(24)]
+    rows = conn.execute(
+        '''SELECT hour, SUM(completed_sessions), SUM(focus_minutes)
+           FROM focus_hourly WHERE user_id = ? AND day BETWEEN ? AND ?
+           GROUP BY hour''',
+        (user_id, start.isoformat(), end.isoformat())
+    ).fetchall()
+    for hour, completed, minutes in rows:
+        hours[hour]['completed_sessions'] = completed
+        hours[hour]['focus_minutes'] = minutes
+    return hours
+
+
+def subject_minutes(conn, user_id, start, end):
+    """Planned minutes per subject across the user's timetables in [start, end]"""
+    rows = conn.execute(
+        '''SELECT te.subject,
+                  SUM((CAST(substr(te.end_time, 1, 2) AS INTEGER) * 60 + CAST(substr(te.end_time, 4, 2) AS INTEGER))
+                    - (CAST(substr(te.start_time, 1, 2) AS INTEGER) * 60 + CAST(substr(te.start_time, 4, 2) AS INTEGER))),
+                  COUNT(*)
+           FROM timetables t
+           JOIN timetable_entries te ON te.timetable_id = t.id
+           WHERE t.user_id = ? AND t.date BETWEEN ? AND ? AND NOT te.is_break
+           GROUP BY te.subject
+           ORDER BY 2 DESC''',
+        (user_id, start.isoformat(), end.isoformat())
+    ).fetchall()
+    return [{'subject': subject, 'minutes': minutes, 'blocks': blocks}
+            for subject, minutes, blocks in rows]
+
+
+def summary(conn, user_id, start, end, today):
+    """Everything the analytics endpoint returns for one user and range.
+
+    ``today`` is the user's local date, for the current streak.
+    """
+    days = heatmap(conn, user_id, start, end)
+    return {
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'heatmap': [
+            {'day': day, 'sessions': sessions, 'completed_sessions': completed,
+             'focus_minutes': focus, 'break_minutes': rest}
+            for day, sessions, completed, focus, rest in days
+        ],
+        'totals': {
+            'completed_sessions': sum(row[2] for row in days),
+            'focus_minutes': sum(row[3] for row in days),
+            'active_days': sum(1 for row in days if row[3] > 0),
+        },
+        'streaks': {
+            'current': current_streak(conn, user_id, today),
+            'longest': longest_streak([row[0] for row in days if row[3] > 0]),
+        },
+        'hours': hour_distribution(conn, user_id, start, end),
+        'subjects': subject_minutes(conn, user_id, start, end),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild focus analytics rollups')
+    parser.add_argument('--db', default='pomodoro.db', help='Path to the SQLite database')
+    parser.add_argument('--user-id', type=int, default=None, help='Only rebuild this user')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        init_analytics_schema(conn)
+        backfill(conn, args.user_id)
+        days = conn.execute('SELECT COUNT(*) FROM focus_daily').fetchone()[0]
+    finally:
+        conn.close()
+    print(f'Rebuilt analytics rollups: {days} user-days')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,93 @@
 from flask import Flask, request, jsonify, session
 from flask_cors import CORS
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta
 import sqlite3
 import os
+import hmac
 from functools import wraps
+import admission
+import analytics
+import archive
+import compression
+import idempotency
+import metrics
+import profiler
+import purge
+import ratelimit
+import serialization
+import singleflight
+import slowlog
+import startup
+import timestamps
+import timetable_cache
+from serialization import body_response, json_response, row_dicts, rows_body, rows_response
 
 app = Flask(__name__)
+
+# Copy a setting from the environment when it is set; otherwise the
+# subsystem's init_app supplies the default
+def env_config(key, convert=str):
+    if key in os.environ:
+        app.config[key] = convert(os.environ[key])
+
 app.config['SECRET_KEY'] = 'your-secret-key-change-in-production'
+app.config['DATABASE'] = os.environ.get('POMODORO_DB', 'pomodoro.db')
+app.config['ARCHIVE_HORIZON_DAYS'] = int(os.environ.get('ARCHIVE_HORIZON_DAYS', archive.DEFAULT_HORIZON_DAYS))
+app.config['ARCHIVE_DIR'] = os.environ.get('ARCHIVE_DIR')
+app.config['ADMIN_TOKEN'] = os.environ.get('ADMIN_TOKEN')
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', slowlog.DEFAULT_THRESHOLD_MS))
+app.config['SLOW_QUERY_LOG'] = os.environ.get('SLOW_QUERY_LOG')
+app.config['PROFILING_ENABLED'] = os.environ.get('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes')
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+app.config['PROFILE_MODE'] = os.environ.get('PROFILE_MODE', 'sample')
+app.config['PURGE_CHUNK_SIZE'] = int(os.environ.get('PURGE_CHUNK_SIZE', purge.DEFAULT_CHUNK_SIZE))
+app.config['PURGE_PAUSE_MS'] = float(os.environ.get('PURGE_PAUSE_MS', purge.DEFAULT_PAUSE_MS))
+app.config['ADMISSION_ENABLED'] = os.environ.get('ADMISSION_ENABLED', '1').lower() in ('1', 'true', 'yes')
+app.config['ADMISSION_MAX_INFLIGHT'] = int(os.environ.get('ADMISSION_MAX_INFLIGHT', admission.DEFAULT_MAX_INFLIGHT))
+app.config['ADMISSION_MAX_QUEUE_MS'] = float(os.environ.get('ADMISSION_MAX_QUEUE_MS', admission.DEFAULT_MAX_QUEUE_MS))
+app.config['ADMISSION_LOW_MAX_INFLIGHT'] = int(os.environ.get('ADMISSION_LOW_MAX_INFLIGHT', admission.DEFAULT_LOW_MAX_INFLIGHT))
+app.config['ADMISSION_LOW_MAX_QUEUE_MS'] = float(os.environ.get('ADMISSION_LOW_MAX_QUEUE_MS', admission.DEFAULT_LOW_MAX_QUEUE_MS))
+app.config['RATELIMIT_ENABLED'] = os.environ.get('RATELIMIT_ENABLED', '1').lower() in ('1', 'true', 'yes')
+app.config['RATELIMIT_STORAGE'] = os.environ.get('RATELIMIT_STORAGE', 'memory')
+app.config['RATELIMIT_DB'] = os.environ.get('RATELIMIT_DB', 'ratelimit.db')
+app.config['IDEMPOTENCY_TTL'] = int(os.environ.get('IDEMPOTENCY_TTL', idempotency.DEFAULT_TTL_SECONDS))
+app.config['REPLICA_ENABLED'] = os.environ.get('REPLICA_ENABLED', '').lower() in ('1', 'true', 'yes')
+app.config['REPLICA_PATH'] = os.environ.get('REPLICA_PATH')
+env_config('REPLICA_REFRESH_SECONDS', float)
+env_config('REPLICA_MAX_STALENESS_SECONDS', float)
+app.config['SHARD_COUNT'] = int(os.environ.get('SHARD_COUNT', 0))
+app.config['SHARD_DIR'] = os.environ.get('SHARD_DIR')
+app.config['BACKUP_ENABLED'] = os.environ.get('BACKUP_ENABLED', '').lower() in ('1', 'true', 'yes')
+app.config['BACKUP_DIR'] = os.environ.get('BACKUP_DIR')
+env_config('BACKUP_INTERVAL_SECONDS', float)
+env_config('BACKUP_KEEP', int)
+env_config('BACKUP_KEEP_DAILY', int)
+app.config['SINGLEFLIGHT_ENABLED'] = os.environ.get('SINGLEFLIGHT_ENABLED', '1').lower() in ('1', 'true', 'yes')
 CORS(app, supports_credentials=True, origins=['*'])
+metrics.init_app(app)
+serialization.init_app(app)
+compression.init_app(app)
+slowlog.init_app(app)
+profiler.init_app(app)
+idempotency.init_app(app)
+singleflight.init_app(app)
+# Optional subsystems are imported only when their config turns them on, so
+# a default worker doesn't pay for them at startup
+if app.config['REPLICA_ENABLED']:
+    import replica
+    replica.init_app(app)
+if app.config['SHARD_COUNT'] > 0:
+    import sharding
+    sharding.init_app(app)
+if app.config['BACKUP_ENABLED']:
+    import backup
+    backup.init_app(app)
+# Shed load before the rate limiter or any view touches a database
+admission.init_app(app)
+ratelimit.init_app(app)
 
 # Database setup
-def init_db():
-    conn = sqlite3.connect('pomodoro.db')
+def create_schema(conn):
     c = conn.cursor()
     
     # Users table
@@ -21,18 +96,19 @@ def init_db():
         username TEXT UNIQUE NOT NULL,
         email TEXT UNIQUE NOT NULL,
         password_hash TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        timezone TEXT NOT NULL DEFAULT 'UTC' -- IANA name, for day/hour bucketing
     )''')
     
     # Timer sessions table
-    c.execute('''CREATE TABLE IF NOT EXISTS timer_sessions (
+    c.execute(f'''CREATE TABLE IF NOT EXISTS timer_sessions (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         user_id INTEGER NOT NULL,
         session_type TEXT NOT NULL, -- 'work' or 'break'
         duration INTEGER NOT NULL, -- in minutes
         completed BOOLEAN DEFAULT FALSE,
-        started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        completed_at TIMESTAMP,
+        started_at INTEGER DEFAULT {timestamps.SQL_NOW_MS}, -- epoch milliseconds (UTC)
+        completed_at INTEGER, -- epoch milliseconds (UTC)
         FOREIGN KEY (user_id) REFERENCES users (id)
     )''')
     
@@ -58,8 +134,41 @@ def init_db():
         FOREIGN KEY (timetable_id) REFERENCES timetables (id)
     )''')
     
-    conn.commit()
-    conn.close()
+    # Serves the per-user history listing and keeps the hot table's index narrow
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_timer_sessions_user_started
+                 ON timer_sessions(user_id, started_at)''')
+    
+    # Rollups and catalog for archived sessions
+    archive.init_archive_schema(conn)
+    
+    # Integer epoch timestamps and users.timezone for databases that predate them
+    timestamps.init_timestamp_schema(conn)
+    
+    # Entry counts/time span on timetables and the cached listing versions
+    timetable_cache.init_timetable_summary_schema(conn)
+    
+    # Daily and hourly focus rollups behind /api/analytics
+    analytics.init_analytics_schema(conn)
+    
+    # Which shard each user's data lives on
+    import sharding
+    sharding.init_directory_schema(conn)
+    
+    # Stored responses for Idempotency-Key retries
+    idempotency.init_idempotency_schema(conn)
+    
+    # Timetables cascade to entries, users to everything they own
+    purge.init_cascade_schema(conn)
+
+# Create or upgrade the schema now (see startup.py for the version stamp)
+def init_db():
+    startup.init_schema(app.config['DATABASE'], create_schema)
+
+# Importing the app touches no database; each process checks the schema
+# version once, on its first request
+@app.before_request
+def ensure_schema():
+    startup.ensure_schema(app.config['DATABASE'], create_schema)
 
 # Authentication decorator
 def login_required(f):
@@ -70,9 +179,58 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# Admin check: X-Admin-Token when ADMIN_TOKEN is set, otherwise localhost.
+# Returns None for admin requests, else the status to refuse with
+def admin_refusal():
+    token = app.config['ADMIN_TOKEN']
+    if token:
+        if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token):
+            return 401
+    elif request.remote_addr not in ('127.0.0.1', '::1'):
+        return 403
+    return None
+
+# Admin decorator
+def admin_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        status = admin_refusal()
+        if status is not None:
+            return jsonify({'error': 'Admin access required'}), status
+        return f(*args, **kwargs)
+    return decorated_function
+
+# Only admin requests may force profiling with the X-Profile header
+if 'profiler' in app.extensions:
+    app.extensions['profiler'].authorize = lambda: admin_refusal() is None
+
 # Database helper
 def get_db():
-    conn = sqlite3.connect('pomodoro.db')
+    conn = metrics.connect(app.config['DATABASE'])
+    conn.row_factory = sqlite3.Row
+    return conn
+
+# Sessions and timetables live on the user's shard when sharding is on
+def get_user_db(user_id=None):
+    if 'sharding' not in app.extensions:
+        return get_db()
+    import sharding
+    conn = sharding.connect_for_request(user_id)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+# Heavy reads use the user's shard, else the read replica when it is fresh
+# enough, else the primary
+def get_read_db():
+    conn = None
+    if 'sharding' in app.extensions:
+        import sharding
+        conn = sharding.connect_for_request()
+    if conn is None and 'replica' in app.extensions:
+        import replica
+        conn = replica.connect_for_request()
+    if conn is None:
+        return get_db()
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -81,24 +239,124 @@ def get_db():
 def test():
     return jsonify({'message': 'Backend is working!'}), 200
 
+# Metrics endpoint (Prometheus text format)
+@app.route('/api/_metrics', methods=['GET'])
+@admin_required
+def get_metrics():
+    return app.response_class(
+        metrics.render_prometheus(), mimetype='text/plain; version=0.0.4'
+    )
+
+@app.route('/api/_admin/slow-queries', methods=['GET'])
+@admin_required
+def get_slow_queries():
+    limit = request.args.get('limit', 20, type=int)
+    return jsonify(app.extensions['slow_query_log'].summary(limit)), 200
+
+@app.route('/api/_admin/singleflight', methods=['GET'])
+@admin_required
+def get_singleflight():
+    group = app.extensions.get('singleflight')
+    if group is None:
+        return jsonify({'error': 'Request coalescing is disabled'}), 404
+    limit = request.args.get('limit', 20, type=int)
+    return jsonify(group.summary(limit)), 200
+
+@app.route('/api/_admin/profiles', methods=['GET'])
+@admin_required
+def get_profiles():
+    request_profiler = app.extensions.get('profiler')
+    if request_profiler is None:
+        return jsonify({'error': 'Profiling is disabled'}), 404
+    
+    endpoint = request.args.get('endpoint')
+    if request.args.get('format') == 'folded':
+        folded = request_profiler.folded(endpoint)
+        if folded is None:
+            return jsonify({'error': 'Folded stacks need PROFILE_MODE=sample'}), 400
+        return app.response_class(folded, mimetype='text/plain')
+    
+    limit = request.args.get('limit', 30, type=int)
+    return jsonify(request_profiler.report(endpoint, limit)), 200
+
+@app.route('/api/_admin/backups', methods=['GET'])
+@admin_required
+def get_backups():
+    import backup
+    import sharding
+    backup_dir = app.config['BACKUP_DIR']
+    backups = [
+        {'path': path, 'taken_at': taken_at, 'bytes': os.path.getsize(path)}
+        for db_path in sharding.database_files(app.config['DATABASE'], app.config['SHARD_DIR'])
+        for taken_at, path in backup.list_backups(db_path, backup_dir)
+    ]
+    return jsonify({'backups': backups}), 200
+
+@app.route('/api/_admin/backups', methods=['POST'])
+@admin_required
+def create_backup():
+    import backup
+    scheduler = app.extensions.get('backup')
+    try:
+        if scheduler is None:
+            result = backup.create_all(app.config['DATABASE'], app.config['BACKUP_DIR'], app.config['SHARD_DIR'])
+        else:
+            scheduler.bind(app.config['DATABASE'])
+            result = scheduler.run_once(force=True)
+            if result is None:
+                return jsonify({'error': 'A backup is already running'}), 409
+        return jsonify({'backups': result}), 201
+    except (sqlite3.Error, OSError) as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/_admin/archive', methods=['POST'])
+@admin_required
+def archive_cold_sessions():
+    import sharding
+    db_path = app.config['DATABASE']
+    archived = {}
+    try:
+        for path in sharding.database_files(db_path, app.config['SHARD_DIR']):
+            archive_dir = app.config['ARCHIVE_DIR']
+            if archive_dir and path != db_path:
+                # Shards number their sessions independently; keep their months apart
+                archive_dir = os.path.join(archive_dir, os.path.splitext(os.path.basename(path))[0])
+            conn = metrics.connect(path, isolation_level=None)
+            try:
+                archived[path] = archive.archive_sessions(conn, app.config['ARCHIVE_HORIZON_DAYS'], archive_dir)
+            finally:
+                conn.close()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except (sqlite3.Error, OSError) as e:
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'horizon_days': app.config['ARCHIVE_HORIZON_DAYS'], 'archived': archived}), 200
+
+@app.route('/api/_admin/shards', methods=['GET'])
+@admin_required
+def get_shards():
+    import sharding
+    try:
+        return jsonify({'shards': sharding.status(app.config['DATABASE'], app.config['SHARD_DIR'])}), 200
+    except sqlite3.Error as e:
+        return jsonify({'error': str(e)}), 500
+
 # Authentication routes
 @app.route('/api/auth/register', methods=['POST'])
 def register():
-    print("DEBUG: Registration endpoint called")
     data = request.json
     username = data.get('username')
     email = data.get('email')
     password = data.get('password')
-    
-    print(f"DEBUG: Received data - username: {username}, email: {email}")
+    timezone = data.get('timezone') or timestamps.DEFAULT_TIMEZONE
     
     if not username or not email or not password:
         return jsonify({'error': 'All fields are required'}), 400
+    if not timestamps.is_valid_timezone(timezone):
+        return jsonify({'error': 'Unknown time zone'}), 400
     
-    print("DEBUG: About to connect to database")
     conn = get_db()
     try:
-        print("DEBUG: Checking if user exists")
         # Check if user exists
         existing_user = conn.execute(
             'SELECT id FROM users WHERE username = ? OR email = ?',
@@ -108,27 +366,26 @@ def register():
         if existing_user:
             return jsonify({'error': 'User already exists'}), 400
         
-        print("DEBUG: Creating new user")
         # Create new user
-        password_hash = generate_password_hash(password)
+        with metrics.timing('hash'):
+            password_hash = generate_password_hash(password)
         cursor = conn.execute(
-            'INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
-            (username, email, password_hash)
+            'INSERT INTO users (username, email, password_hash, timezone) VALUES (?, ?, ?, ?)',
+            (username, email, password_hash, timezone)
         )
-        print("DEBUG: Committing transaction")
+        if 'sharding' in app.extensions:
+            import sharding
+            sharding.place_new_user(conn, cursor.lastrowid)
         conn.commit()
         
-        print("DEBUG: Registration successful (without session)")
         return jsonify({
             'message': 'Registration successful',
             'user': {'id': cursor.lastrowid, 'username': username, 'email': email}
         }), 201
         
     except Exception as e:
-        print(f"DEBUG: Exception occurred: {str(e)}")
         return jsonify({'error': str(e)}), 500
     finally:
-        print("DEBUG: Closing database connection")
         conn.close()
 
 @app.route('/api/auth/login', methods=['POST'])
@@ -147,10 +404,24 @@ def login():
             (username,)
         ).fetchone()
         
-        if user and check_password_hash(user['password_hash'], password):
+        with metrics.timing('hash'):
+            valid = user is not None and check_password_hash(user['password_hash'], password)
+        
+        if valid:
             session['user_id'] = user['id']
             session['username'] = user['username']
             
+            # Follow the browser's time zone; the user's rollups are rebucketed
+            timezone = data.get('timezone')
+            if timezone != user['timezone'] and timestamps.is_valid_timezone(timezone):
+                conn.execute('UPDATE users SET timezone = ? WHERE id = ?', (timezone, user['id']))
+                conn.commit()
+                user_conn = get_user_db(user['id'])
+                try:
+                    analytics.backfill(user_conn, user['id'])
+                finally:
+                    user_conn.close()
+            
             return jsonify({
                 'message': 'Login successful',
                 'user': {'id': user['id'], 'username': user['username'], 'email': user['email']}
@@ -170,6 +441,7 @@ def logout():
 
 @app.route('/api/auth/me', methods=['GET'])
 @login_required
+@singleflight.coalesce
 def get_current_user():
     conn = get_db()
     try:
@@ -190,23 +462,110 @@ def get_current_user():
     finally:
         conn.close()
 
+@app.route('/api/auth/me', methods=['DELETE'])
+@login_required
+def delete_current_user():
+    data = request.json or {}
+    password = data.get('password')
+    
+    if not password:
+        return jsonify({'error': 'Password is required to delete the account'}), 400
+    
+    conn = get_db()
+    try:
+        user = conn.execute(
+            'SELECT password_hash FROM users WHERE id = ?',
+            (session['user_id'],)
+        ).fetchone()
+        
+        with metrics.timing('hash'):
+            valid = user is not None and check_password_hash(user['password_hash'], password)
+        
+        if not valid:
+            return jsonify({'error': 'Invalid password'}), 401
+        
+        user_conn = get_user_db()
+        try:
+            deleted = purge.delete_account(
+                conn, session['user_id'], app.config['DATABASE'],
+                app.config['PURGE_CHUNK_SIZE'], app.config['PURGE_PAUSE_MS'], user_conn
+            )
+        finally:
+            user_conn.close()
+        session.clear()
+        
+        return jsonify({'message': 'Account deleted', 'deleted': deleted}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
 # Timer routes
 @app.route('/api/timer/sessions', methods=['GET'])
 @login_required
+@singleflight.coalesce
 def get_timer_sessions():
-    conn = get_db()
+    conn = get_read_db()
     try:
-        sessions = conn.execute(
+        cursor = conn.execute(
             '''SELECT * FROM timer_sessions 
                WHERE user_id = ? 
                ORDER BY started_at DESC 
                LIMIT 50''',
             (session['user_id'],)
-        ).fetchall()
+        )
         
-        return jsonify({
-            'sessions': [dict(session) for session in sessions]
-        }), 200
+        return rows_response('sessions', cursor)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/timer/sessions/export', methods=['GET'])
+@login_required
+def export_timer_sessions():
+    include_archived = request.args.get('include_archived', '').lower() in ('1', 'true', 'yes')
+    
+    conn = get_read_db()
+    try:
+        sessions = archive.export_user_sessions(
+            conn, session['user_id'], include_archived=include_archived
+        )
+        
+        return json_response({
+            'sessions': row_dicts(archive.SESSION_FIELDS, sessions),
+            'include_archived': include_archived
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/timer/sessions', methods=['DELETE'])
+@login_required
+def delete_timer_sessions():
+    before = request.args.get('before')
+    include_archived = request.args.get('include_archived', '1').lower() in ('1', 'true', 'yes')
+    
+    if not before:
+        return jsonify({'error': 'before is required (YYYY-MM-DD)'}), 400
+    
+    conn = get_user_db()
+    try:
+        try:
+            before = purge.parse_before(before, timestamps.user_timezone(conn, session['user_id']))
+        except ValueError:
+            return jsonify({'error': 'before must be a date (YYYY-MM-DD) or ISO datetime'}), 400
+        
+        deleted = purge.delete_sessions_before(
+            conn, session['user_id'], before, include_archived,
+            app.config['PURGE_CHUNK_SIZE'], app.config['PURGE_PAUSE_MS']
+        )
+        
+        return jsonify({'message': 'Sessions deleted', 'deleted': deleted}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -215,18 +574,24 @@ def get_timer_sessions():
 
 @app.route('/api/timer/sessions', methods=['POST'])
 @login_required
+@idempotency.idempotent
 def create_timer_session():
     data = request.json
     session_type = data.get('session_type', 'work')
     duration = data.get('duration', 25)
     
-    conn = get_db()
+    started_at = timestamps.now_ms()
+    
+    conn = get_user_db()
     try:
         cursor = conn.execute(
             '''INSERT INTO timer_sessions 
                (user_id, session_type, duration, started_at) 
                VALUES (?, ?, ?, ?)''',
-            (session['user_id'], session_type, duration, datetime.now())
+            (session['user_id'], session_type, duration, started_at)
+        )
+        analytics.record_start(
+            conn, session['user_id'], started_at, timestamps.user_timezone(conn, session['user_id'])
         )
         conn.commit()
         
@@ -243,14 +608,20 @@ def create_timer_session():
 @app.route('/api/timer/sessions/<int:session_id>/complete', methods=['PUT'])
 @login_required
 def complete_timer_session(session_id):
-    conn = get_db()
+    conn = get_user_db()
     try:
-        conn.execute(
+        # Only the first completion counts towards the analytics rollups
+        completed = conn.execute(
             '''UPDATE timer_sessions 
                SET completed = TRUE, completed_at = ? 
-               WHERE id = ? AND user_id = ?''',
-            (datetime.now(), session_id, session['user_id'])
-        )
+               WHERE id = ? AND user_id = ? AND NOT completed
+               RETURNING started_at, session_type, duration''',
+            (timestamps.now_ms(), session_id, session['user_id'])
+        ).fetchone()
+        if completed:
+            analytics.record_completion(
+                conn, session['user_id'], timestamps.user_timezone(conn, session['user_id']), *completed
+            )
         conn.commit()
         
         return jsonify({'message': 'Session completed'}), 200
@@ -264,21 +635,19 @@ def complete_timer_session(session_id):
 @app.route('/api/timetables', methods=['GET'])
 @login_required
 def get_timetables():
-    conn = get_db()
+    user_id = session['user_id']
+    conn = get_user_db()
     try:
-        timetables = conn.execute(
-            '''SELECT t.*, COUNT(te.id) as entry_count
-               FROM timetables t 
-               LEFT JOIN timetable_entries te ON t.id = te.timetable_id
-               WHERE t.user_id = ? 
-               GROUP BY t.id
-               ORDER BY t.date DESC''',
-            (session['user_id'],)
-        ).fetchall()
+        # entry_count, first_start and last_end are kept on timetables by triggers
+        body = timetable_cache.cached_list(
+            conn, app.config['DATABASE'], user_id, 'response',
+            lambda: rows_body('timetables', conn.execute(
+                'SELECT * FROM timetables WHERE user_id = ? ORDER BY date DESC',
+                (user_id,)
+            ))
+        )
         
-        return jsonify({
-            'timetables': [dict(timetable) for timetable in timetables]
-        }), 200
+        return body_response(body)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -287,6 +656,7 @@ def get_timetables():
 
 @app.route('/api/timetables', methods=['POST'])
 @login_required
+@idempotency.idempotent
 def create_timetable():
     data = request.json
     title = data.get('title')
@@ -297,7 +667,7 @@ def create_timetable():
     if not title or not date:
         return jsonify({'error': 'Title and date are required'}), 400
     
-    conn = get_db()
+    conn = get_user_db()
     try:
         # Create timetable
         cursor = conn.execute(
@@ -318,6 +688,7 @@ def create_timetable():
             )
         
         conn.commit()
+        timetable_cache.cache.invalidate(app.config['DATABASE'], session['user_id'])
         
         return jsonify({
             'message': 'Timetable created successfully',
@@ -329,10 +700,28 @@ def create_timetable():
     finally:
         conn.close()
 
+@app.route('/api/timetables', methods=['DELETE'])
+@login_required
+def delete_timetables():
+    conn = get_user_db()
+    try:
+        deleted = purge.delete_all_timetables(
+            conn, session['user_id'],
+            app.config['PURGE_CHUNK_SIZE'], app.config['PURGE_PAUSE_MS']
+        )
+        timetable_cache.cache.invalidate(app.config['DATABASE'], session['user_id'])
+        
+        return jsonify({'message': 'Timetables deleted', 'deleted': deleted}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
 @app.route('/api/timetables/<int:timetable_id>', methods=['GET'])
 @login_required
 def get_timetable_details(timetable_id):
-    conn = get_db()
+    conn = get_user_db()
     try:
         # Get timetable
         timetable = conn.execute(
@@ -344,17 +733,33 @@ def get_timetable_details(timetable_id):
             return jsonify({'error': 'Timetable not found'}), 404
         
         # Get entries
-        entries = conn.execute(
+        cursor = conn.execute(
             '''SELECT * FROM timetable_entries 
                WHERE timetable_id = ? 
                ORDER BY start_time''',
             (timetable_id,)
-        ).fetchall()
+        )
         
-        return jsonify({
-            'timetable': dict(timetable),
-            'entries': [dict(entry) for entry in entries]
-        }), 200
+        return rows_response('entries', cursor, timetable=dict(timetable))
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+# Analytics route
+@app.route('/api/analytics', methods=['GET'])
+@login_required
+def get_analytics():
+    conn = get_read_db()
+    try:
+        today = timestamps.local_today(timestamps.user_timezone(conn, session['user_id']))
+        try:
+            start, end = analytics.parse_range(request.args.get('from'), request.args.get('to'), today)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return json_response(analytics.summary(conn, session['user_id'], start, end, today))
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -364,8 +769,9 @@ def get_timetable_details(timetable_id):
 # Statistics route
 @app.route('/api/stats', methods=['GET'])
 @login_required
+@singleflight.coalesce
 def get_user_stats():
-    conn = get_db()
+    conn = get_read_db()
     try:
         # Total completed sessions
         total_sessions = conn.execute(
@@ -380,12 +786,17 @@ def get_user_stats():
             (session['user_id'],)
         ).fetchone()['total'] or 0
         
-        # Sessions this week
-        week_ago = datetime.now() - timedelta(days=7)
+        # Sessions moved to the archive only survive as rollups
+        archived_sessions, archived_time = archive.rollup_totals(conn, session['user_id'])
+        total_sessions += archived_sessions
+        total_time += archived_time
+        
+        # Sessions in the last seven days of the user's calendar, today included
+        week_start = timestamps.week_start_ms(timestamps.user_timezone(conn, session['user_id']))
         weekly_sessions = conn.execute(
             '''SELECT COUNT(*) as count FROM timer_sessions 
-               WHERE user_id = ? AND completed = TRUE AND started_at > ?''',
-            (session['user_id'], week_ago)
+               WHERE user_id = ? AND completed = TRUE AND started_at >= ?''',
+            (session['user_id'], week_start)
         ).fetchone()['count']
         
         return jsonify({
@@ -400,5 +811,4 @@ def get_user_stats():
         conn.close()
 
 if __name__ == '__main__':
-    init_db()
     app.run(debug=True, port=8000)
\ No newline at end of file
@@ -0,0 +1,272 @@
+"""
+Cold storage archival for PomodoroFlow timer sessions
+
+Sessions older than a configurable horizon are moved out of the hot
+``timer_sessions`` table into one partition per calendar month, either a
+``timer_sessions_archive_YYYY_MM`` table in the main database or a separate
+``sessions_YYYY_MM.db`` file. Months and rollup days are UTC. Per
+user/day/type rollups of everything that was archived stay in the main
+database so totals never need the cold data.
+"""
+
+import argparse
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import timestamps
+
+DEFAULT_HORIZON_DAYS = 90
+
+# /api/stats counts "this week" from the hot table alone
+MIN_HORIZON_DAYS = 7
+
+SESSION_FIELDS = ('id', 'user_id', 'session_type', 'duration', 'completed', 'started_at', 'completed_at')
+ARCHIVE_COLUMNS = ', '.join(SESSION_FIELDS)
+
+
+def init_archive_schema(conn):
+    """Create the rollup and partition catalog tables if they don't exist"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS session_rollups (
+        user_id INTEGER NOT NULL,
+        day DATE NOT NULL,
+        session_type TEXT NOT NULL,
+        sessions INTEGER NOT NULL DEFAULT 0,
+        completed_sessions INTEGER NOT NULL DEFAULT 0,
+        completed_minutes INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day, session_type)
+    ) WITHOUT ROWID''')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS session_archive_partitions (
+        month TEXT PRIMARY KEY, -- 'YYYY-MM'
+        storage TEXT NOT NULL, -- 'table' or 'file'
+        location TEXT NOT NULL, -- table name or database file path
+        row_count INTEGER NOT NULL DEFAULT 0,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+
+def month_bounds(month):
+    """Return the [start, end) epoch milliseconds of a 'YYYY-MM' UTC month"""
+    start = datetime.strptime(month, '%Y-%m')
+    end = (start + timedelta(days=32)).replace(day=1)
+    return timestamps.parse_ms(start), timestamps.parse_ms(end)
+
+
+def create_partition_table(conn, table):
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        session_type TEXT NOT NULL,
+        duration INTEGER NOT NULL,
+        completed BOOLEAN DEFAULT FALSE,
+        started_at INTEGER, -- epoch milliseconds (UTC)
+        completed_at INTEGER
+    )''')
+    schema, _, name = table.rpartition('.')
+    prefix = f'{schema}.' if schema else ''
+    conn.execute(
+        f'CREATE INDEX IF NOT EXISTS {prefix}idx_{name}_user_started '
+        f'ON {name}(user_id, started_at)'
+    )
+
+
+def _partition_location(month, archive_dir):
+    suffix = month.replace('-', '_')
+    if archive_dir:
+        return 'file', os.path.join(archive_dir, f'sessions_{suffix}.db')
+    return 'table', f'timer_sessions_archive_{suffix}'
+
+
+def _archive_month(conn, month, cutoff, archive_dir):
+    """Move one month's cold rows into its partition in a single transaction"""
+    month_start, month_end = month_bounds(month)
+    upper = min(month_end, cutoff)
+    storage, location = _partition_location(month, archive_dir)
+
+    if storage == 'file':
+        # ATTACH is not allowed inside a transaction
+        conn.execute('ATTACH DATABASE ? AS cold', (location,))
+        target = 'cold.timer_sessions'
+    else:
+        target = location
+
+    try:
+        create_partition_table(conn, target)
+        conn.execute('BEGIN IMMEDIATE')
+
+        moved = conn.execute(
+            f'''INSERT INTO {target} ({ARCHIVE_COLUMNS})
+                SELECT {ARCHIVE_COLUMNS} FROM main.timer_sessions
+                WHERE started_at >= ? AND started_at < ?''',
+            (month_start, upper)
+        ).rowcount
+
+        conn.execute(
+            '''INSERT INTO session_rollups
+               (user_id, day, session_type, sessions, completed_sessions, completed_minutes)
+               SELECT user_id, date(started_at / 1000, 'unixepoch'), session_type, COUNT(*),
+                      SUM(CASE WHEN completed THEN 1 ELSE 0 END),
+                      SUM(CASE WHEN completed THEN duration ELSE 0 END)
+               FROM main.timer_sessions
+               WHERE started_at >= ? AND started_at < ?
+               GROUP BY user_id, date(started_at / 1000, 'unixepoch'), session_type
+               ON CONFLICT (user_id, day, session_type) DO UPDATE SET
+                   sessions = sessions + excluded.sessions,
+                   completed_sessions = completed_sessions + excluded.completed_sessions,
+                   completed_minutes = completed_minutes + excluded.completed_minutes''',
+            (month_start, upper)
+        )
+
+        conn.execute(
+            'DELETE FROM main.timer_sessions WHERE started_at >= ? AND started_at < ?',
+            (month_start, upper)
+        )
+
+        conn.execute(
+            '''INSERT INTO session_archive_partitions (month, storage, location, row_count)
+               VALUES (?, ?, ?, ?)
+               ON CONFLICT (month) DO UPDATE SET
+                   row_count = row_count + excluded.row_count,
+                   archived_at = CURRENT_TIMESTAMP''',
+            (month, storage, location, moved)
+        )
+        conn.commit()
+        return moved
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if storage == 'file':
+            conn.execute('DETACH DATABASE cold')
+
+
+def archive_sessions(conn, horizon_days=DEFAULT_HORIZON_DAYS, archive_dir=None, now=None):
+    """Archive every session that started more than ``horizon_days`` ago.
+
+    ``now`` is epoch milliseconds (default: the current time). Returns a
+    dict of month -> number of rows moved.
+    """
+    if horizon_days < MIN_HORIZON_DAYS:
+        raise ValueError(f'Archive horizon must be at least {MIN_HORIZON_DAYS} days')
+
+    if archive_dir:
+        os.makedirs(archive_dir, exist_ok=True)
+
+    init_archive_schema(conn)
+    cutoff = (now or timestamps.now_ms()) - horizon_days * timestamps.DAY_MS
+
+    months = [row[0] for row in conn.execute(
+        '''SELECT DISTINCT strftime('%Y-%m', started_at / 1000, 'unixepoch') FROM timer_sessions
+           WHERE started_at < ? ORDER BY 1''',
+        (cutoff,)
+    ).fetchall()]
+
+    moved = {}
+    for month in months:
+        moved[month] = _archive_month(conn, month, cutoff, archive_dir)
+
+    if moved:
+        if not archive_dir:
+            import purge  # purge imports this module
+
+            # New partition tables join the account deletion cascade
+            purge.refresh_user_cascade(conn)
+            conn.commit()
+        conn.execute('PRAGMA optimize')
+    return moved
+
+
+def rollup_totals(conn, user_id):
+    """Return (completed sessions, completed work minutes) for archived sessions"""
+    row = conn.execute(
+        '''SELECT COALESCE(SUM(completed_sessions), 0),
+                  COALESCE(SUM(CASE WHEN session_type = 'work' THEN completed_minutes ELSE 0 END), 0)
+           FROM session_rollups WHERE user_id = ?''',
+        (user_id,)
+    ).fetchone()
+    return row[0], row[1]
+
+
+def get_partitions(conn):
+    """List archive partitions, newest month first"""
+    return conn.execute(
+        '''SELECT month, storage, location, row_count
+           FROM session_archive_partitions ORDER BY month DESC'''
+    ).fetchall()
+
+
+def partition_tables(conn):
+    """Yield (month, table name) for each archive partition, newest first.
+
+    File partitions are attached one at a time, only while the consumer is
+    working on them, so a long history never runs into SQLite's limit on
+    attached databases. Finish with each table before asking for the next.
+    """
+    for month, storage, location, _ in get_partitions(conn):
+        if storage != 'file':
+            yield month, location
+            continue
+        if not os.path.exists(location):
+            continue
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute('ATTACH DATABASE ? AS cold', (location,))
+        try:
+            yield month, 'cold.timer_sessions'
+        finally:
+            if conn.in_transaction:
+                conn.commit()
+            conn.execute('DETACH DATABASE cold')
+
+
+def iter_archived_sessions(conn, user_id):
+    """Yield a user's archived sessions, newest first, one partition at a time"""
+    for _, table in partition_tables(conn):
+        rows = conn.execute(
+            f'''SELECT {ARCHIVE_COLUMNS} FROM {table}
+                WHERE user_id = ? ORDER BY started_at DESC''',
+            (user_id,)
+        ).fetchall()
+        yield from rows
+
+
+def export_user_sessions(conn, user_id, include_archived=False):
+    """Return a user's full session history, newest first.
+
+    Archived rows are always older than the hot ones, so the merge is a plain
+    concatenation of the hot table followed by each partition.
+    """
+    sessions = conn.execute(
+        f'''SELECT {ARCHIVE_COLUMNS} FROM timer_sessions
+            WHERE user_id = ? ORDER BY started_at DESC''',
+        (user_id,)
+    ).fetchall()
+
+    if include_archived:
+        sessions.extend(iter_archived_sessions(conn, user_id))
+    return sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Archive cold timer sessions')
+    parser.add_argument('--db', default='pomodoro.db', help='Path to the SQLite database')
+    parser.add_argument('--horizon-days', type=int, default=DEFAULT_HORIZON_DAYS,
+                        help='Archive sessions that started more than this many days ago')
+    parser.add_argument('--archive-dir', default=None,
+                        help='Write per-month archive files here instead of archive tables')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    try:
+        moved = archive_sessions(conn, args.horizon_days, args.archive_dir)
+    finally:
+        conn.close()
+
+    for month, count in moved.items():
+        print(f'{month}: archived {count} sessions')
+    print(f'Archived {sum(moved.values())} sessions across {len(moved)} months')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,615 @@
+"""
+ASGI serving mode for PomodoroFlow API
+
+``application`` serves the whole Flask app over ASGI. Ordinary requests run
+the app unchanged on a bounded thread pool (ASGI_MAX_WORKERS threads), so
+SQLite work never blocks the event loop and never runs more than the pool
+size at a time. Long-lived responses run on the event loop instead and only
+borrow a pool thread for each database read:
+
+- ``GET /api/timer/stream``: server-sent events with the user's latest timer
+  session. Timer writes handled by this process wake the stream at once;
+  writes in other worker processes are picked up by re-reading every
+  ASGI_STREAM_POLL_SECONDS (0 turns polling off). A comment line goes out
+  every ASGI_HEARTBEAT_SECONDS so proxies keep idle streams open. An idle
+  stream holds no thread and no connection, so one process can hold
+  thousands.
+- ``GET /api/timer/sessions/export``: the same JSON as the Flask view,
+  streamed in chunks of EXPORT_CHUNK_ROWS sessions (keyset pagination over
+  the hot table, then one archive partition at a time) instead of being built
+  in memory first.
+
+These two bypass Flask's request hooks, so before starting they make the
+rate limit check (at the cost the Flask view would pay) and the admission
+check those hooks would; an export then counts as in flight until it ends.
+One process holds at most ASGI_MAX_STREAMS of them open and one user at most
+ASGI_MAX_USER_STREAMS. They are not compressed, authenticate from the Flask
+session cookie and answer CORS the way app.py configures it.
+
+    python asgi.py --port 8000                 # uvicorn when installed
+    uvicorn asgi:application --workers 4
+
+Without uvicorn, ``python asgi.py`` falls back to a small built-in asyncio
+HTTP/1.1 server meant for development and tests.
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote
+
+from flask import g, request, session
+
+import app as pomodoro
+import archive
+import metrics
+import serialization
+import startup
+
+try:
+    import uvicorn
+except ImportError:
+    uvicorn = None
+
+DEFAULT_MAX_WORKERS = 16
+DEFAULT_HEARTBEAT_SECONDS = 15
+DEFAULT_STREAM_POLL_SECONDS = 30
+DEFAULT_MAX_STREAMS = 10000
+DEFAULT_MAX_USER_STREAMS = 5
+EXPORT_CHUNK_ROWS = 1000
+
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+TIMER_PATH_PREFIX = '/api/timer/'
+
+SSE_HEADERS = [
+    (b'content-type', b'text/event-stream'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),
+]
+
+
+def build_environ(scope, body):
+    """PEP 3333 environ for an ASGI HTTP scope and its full request body"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin-1').lower()
+        value = value.decode('latin-1')
+        if name == 'content-length':
+            continue
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+            continue
+        key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+class StreamHub:
+    """Wakes a user's open streams when this process handles one of their timer writes"""
+
+    def __init__(self):
+        self.loop = None
+        self.subscribers = {}  # user_id -> set of asyncio.Event
+        self.open_streams = {'timer': 0, 'export': 0}
+        self.user_streams = Counter()  # user_id -> open long-lived responses
+
+    def subscribe(self, user_id):
+        self.loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        self.subscribers.setdefault(user_id, set()).add(event)
+        return event
+
+    def unsubscribe(self, user_id, event):
+        events = self.subscribers.get(user_id)
+        if events is not None:
+            events.discard(event)
+            if not events:
+                del self.subscribers[user_id]
+
+    def _wake(self, user_id):
+        for event in self.subscribers.get(user_id, ()):
+            event.set()
+
+    def publish(self, user_id):
+        """Called from any thread"""
+        loop = self.loop
+        if loop is not None and user_id in self.subscribers:
+            loop.call_soon_threadsafe(self._wake, user_id)
+
+
+class AsgiAdapter:
+    """ASGI application running a Flask app on a bounded thread pool"""
+
+    def __init__(self, flask_app, max_workers=DEFAULT_MAX_WORKERS,
+                 heartbeat_seconds=DEFAULT_HEARTBEAT_SECONDS,
+                 poll_seconds=DEFAULT_STREAM_POLL_SECONDS,
+                 max_streams=DEFAULT_MAX_STREAMS,
+                 max_user_streams=DEFAULT_MAX_USER_STREAMS):
+        self.app = flask_app
+        self.max_workers = max_workers
+        self.heartbeat_seconds = heartbeat_seconds
+        self.poll_seconds = poll_seconds
+        self.max_streams = max_streams
+        self.max_user_streams = max_user_streams
+        self.refused_streams = Counter()  # reason -> long-lived responses refused
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='asgi')
+        self.hub = StreamHub()
+        self.busy = 0
+        self._lock = threading.Lock()
+        self.routes = {
+            ('GET', '/api/timer/stream'): self.timer_stream,
+            ('GET', '/api/timer/sessions/export'): self.export_sessions,
+        }
+
+        flask_app.after_request(self._publish_write)
+        metrics.registry.register_gauge(
+            'pomodoro_asgi_streams', 'Open long-lived ASGI responses by kind',
+            lambda: {(('kind', kind),): count for kind, count in self.hub.open_streams.items()}
+        )
+        metrics.registry.register_gauge(
+            'pomodoro_asgi_streams_refused', 'Long-lived ASGI responses refused by reason',
+            lambda: {(('reason', reason),): count for reason, count in self.refused_streams.items()}
+        )
+        metrics.registry.register_gauge(
+            'pomodoro_asgi_pool_threads', 'ASGI worker pool threads by state',
+            lambda: {(('state', 'busy'),): self.busy, (('state', 'max'),): self.max_workers}
+        )
+
+    def _publish_write(self, response):
+        if (request.method in WRITE_METHODS and request.path.startswith(TIMER_PATH_PREFIX)
+                and response.status_code < 400 and 'user_id' in session):
+            self.hub.publish(session['user_id'])
+        return response
+
+    def _call(self, fn, *args):
+        with self._lock:
+            self.busy += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.busy -= 1
+
+    async def run_in_pool(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._call, fn, *args)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise RuntimeError(f"Unsupported ASGI scope type {scope['type']!r}")
+
+        body = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        environ = build_environ(scope, b''.join(body))
+
+        handler = self.routes.get((scope['method'], scope['path']))
+        if handler is not None:
+            await handler(environ, receive, send)
+            return
+
+        status, headers, chunks = await self.run_in_pool(self._run_wsgi, environ)
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': b''.join(chunks)})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _run_wsgi(self, environ):
+        started = {}
+        chunks = []
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                  for name, value in headers]
+            return chunks.append
+
+        result = self.app(environ, start_response)
+        try:
+            chunks.extend(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return started['status'], started['headers'], chunks
+
+    # Long-lived responses
+
+    def _cors_headers(self, environ):
+        origin = environ.get('HTTP_ORIGIN')
+        if not origin:
+            return []
+        return [(b'access-control-allow-origin', origin.encode('latin-1')),
+                (b'access-control-allow-credentials', b'true'),
+                (b'vary', b'Origin')]
+
+    def _session_user(self, environ):
+        with self.app.request_context(environ):
+            return session.get('user_id')
+
+    async def _unauthorized(self, environ, send):
+        await send({
+            'type': 'http.response.start', 'status': 401,
+            'headers': [(b'content-type', b'application/json')] + self._cors_headers(environ),
+        })
+        await send({'type': 'http.response.body',
+                    'body': serialization.dumps_bytes({'error': 'Authentication required'})})
+
+    def _admit(self, environ, hold):
+        """The rate limit and admission checks Flask's before_request hooks would make.
+
+        Returns the Flask response refusing the request, or None. With ``hold``
+        an admitted request stays in flight until ``_release_admission``.
+        """
+        with self.app.request_context(environ):
+            limiter = self.app.extensions.get('rate_limiter')
+            if limiter is not None:
+                refusal = limiter.before_request()
+                if refusal is not None:
+                    return limiter.after_request(refusal)
+            controller = self.app.extensions.get('admission')
+            if controller is not None:
+                refusal = controller.before_request()
+                if refusal is not None:
+                    return refusal
+                # Taken out of the context's teardown: an export stays in
+                # flight until it ends, an idle timer stream costs nothing
+                if g.pop('_admitted', False) and not hold:
+                    controller.release()
+            return None
+
+    def _release_admission(self):
+        controller = self.app.extensions.get('admission')
+        if controller is not None:
+            controller.release()
+
+    async def _open_stream(self, environ, send, user_id, kind):
+        """Take a stream slot for ``user_id`` or answer with the refusal; returns whether it was taken"""
+        streams = self.hub.user_streams
+        # Slots are taken before the checks run in the pool, so concurrent
+        # requests can't all slip under the limits
+        self.hub.open_streams[kind] += 1
+        streams[user_id] += 1
+        if sum(self.hub.open_streams.values()) > self.max_streams:
+            reason, status, message = 'streams', 503, 'Server is busy, please retry shortly'
+        elif streams[user_id] > self.max_user_streams:
+            reason, status, message = 'user_streams', 429, 'Too many open streams, please close one first'
+        else:
+            refusal = await self.run_in_pool(self._admit, environ, kind == 'export')
+            if refusal is None:
+                return True
+            reason = 'ratelimit' if refusal.status_code == 429 else 'admission'
+            status, message = refusal.status_code, None
+
+        self._close_stream(user_id, kind)
+        self.refused_streams[reason] += 1
+        if message is None:
+            headers = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                       for name, value in refusal.headers.items()]
+            body = refusal.get_data()
+        else:
+            headers = [(b'content-type', b'application/json'), (b'retry-after', b'1')]
+            body = serialization.dumps_bytes({'error': message})
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': headers + self._cors_headers(environ)})
+        await send({'type': 'http.response.body', 'body': body})
+        return False
+
+    def _close_stream(self, user_id, kind):
+        self.hub.open_streams[kind] -= 1
+        self.hub.user_streams[user_id] -= 1
+        if not self.hub.user_streams[user_id]:
+            del self.hub.user_streams[user_id]
+
+    def _with_db(self, environ, read, fn):
+        """Run ``fn(conn)`` on the request's database, in the request's Flask context"""
+        with self.app.request_context(environ):
+            startup.ensure_schema(self.app.config['DATABASE'], pomodoro.create_schema)
+            conn = pomodoro.get_read_db() if read else pomodoro.get_user_db()
+            try:
+                return fn(conn)
+            finally:
+                conn.close()
+
+    def _latest_session(self, environ, user_id):
+        row = self._with_db(environ, False, lambda conn: conn.execute(
+            f'''SELECT {archive.ARCHIVE_COLUMNS} FROM timer_sessions
+                WHERE user_id = ? ORDER BY started_at DESC LIMIT 1''',
+            (user_id,)
+        ).fetchone())
+        return serialization.dumps_bytes({'session': dict(zip(archive.SESSION_FIELDS, row)) if row else None})
+
+    async def _wait_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def timer_stream(self, environ, receive, send):
+        user_id = self._session_user(environ)
+        if user_id is None:
+            await self._unauthorized(environ, send)
+            return
+
+        if not await self._open_stream(environ, send, user_id, 'timer'):
+            return
+
+        event = self.hub.subscribe(user_id)
+        disconnected = asyncio.ensure_future(self._wait_disconnect(receive))
+        try:
+            await send({'type': 'http.response.start', 'status': 200,
+                        'headers': SSE_HEADERS + self._cors_headers(environ)})
+            last = await self.run_in_pool(self._latest_session, environ, user_id)
+            await send({'type': 'http.response.body', 'more_body': True,
+                        'body': b'retry: 5000\nevent: session\ndata: ' + last + b'\n\n'})
+            polled_at = time.monotonic()
+
+            while True:
+                woken = asyncio.ensure_future(event.wait())
+                done, _ = await asyncio.wait({woken, disconnected}, timeout=self.heartbeat_seconds,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if disconnected in done:
+                    woken.cancel()
+                    return
+                if woken in done:
+                    event.clear()
+                elif self.poll_seconds and time.monotonic() - polled_at >= self.poll_seconds:
+                    woken.cancel()
+                else:
+                    woken.cancel()
+                    await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+                    continue
+
+                polled_at = time.monotonic()
+                current = await self.run_in_pool(self._latest_session, environ, user_id)
+                if current != last:
+                    last = current
+                    await send({'type': 'http.response.body', 'more_body': True,
+                                'body': b'event: session\ndata: ' + current + b'\n\n'})
+        finally:
+            self._close_stream(user_id, 'timer')
+            self.hub.unsubscribe(user_id, event)
+            disconnected.cancel()
+
+    def _hot_chunk(self, environ, user_id, after):
+        """Next chunk of hot sessions, newest first, after the (started_at, id) key ``after``"""
+        def fetch(conn):
+            if after is None:
+                return conn.execute(
+                    f'''SELECT {archive.ARCHIVE_COLUMNS} FROM timer_sessions WHERE user_id = ?
+                        ORDER BY started_at DESC, id DESC LIMIT ?''',
+                    (user_id, EXPORT_CHUNK_ROWS)
+                ).fetchall()
+            started_at, session_id = after
+            return conn.execute(
+                f'''SELECT {archive.ARCHIVE_COLUMNS} FROM timer_sessions
+                    WHERE user_id = ? AND started_at <= ? AND (started_at < ? OR id < ?)
+                    ORDER BY started_at DESC, id DESC LIMIT ?''',
+                (user_id, started_at, started_at, session_id, EXPORT_CHUNK_ROWS)
+            ).fetchall()
+        return [tuple(row) for row in self._with_db(environ, True, fetch)]
+
+    def _archive_months(self, environ):
+        return self._with_db(environ, True, lambda conn: [row[0] for row in archive.get_partitions(conn)])
+
+    def _archived_chunk(self, environ, user_id, month):
+        """One archive partition's sessions for the user"""
+        def fetch(conn):
+            partitions = archive.partition_tables(conn)
+            try:
+                for partition_month, table in partitions:
+                    if partition_month == month:
+                        return [tuple(row) for row in conn.execute(
+                            f'''SELECT {archive.ARCHIVE_COLUMNS} FROM {table}
+                                WHERE user_id = ? ORDER BY started_at DESC''',
+                            (user_id,)
+                        )]
+                return []
+            finally:
+                partitions.close()
+        return self._with_db(environ, True, fetch)
+
+    async def export_sessions(self, environ, receive, send):
+        user_id = self._session_user(environ)
+        if user_id is None:
+            await self._unauthorized(environ, send)
+            return
+        params = parse_qs(environ['QUERY_STRING'])
+        include_archived = params.get('include_archived', [''])[0].lower() in ('1', 'true', 'yes')
+
+        async def send_rows(rows, first):
+            body = b','.join(serialization.dumps_bytes(dict(zip(archive.SESSION_FIELDS, row))) for row in rows)
+            await send({'type': 'http.response.body', 'more_body': True,
+                        'body': body if first else b',' + body})
+
+        if not await self._open_stream(environ, send, user_id, 'export'):
+            return
+        try:
+            await send({'type': 'http.response.start', 'status': 200,
+                        'headers': [(b'content-type', b'application/json')] + self._cors_headers(environ)})
+            await send({'type': 'http.response.body', 'body': b'{"sessions":[', 'more_body': True})
+
+            empty = True
+            after = None
+            while True:
+                rows = await self.run_in_pool(self._hot_chunk, environ, user_id, after)
+                if rows:
+                    await send_rows(rows, empty)
+                    empty = False
+                    after = (rows[-1][5], rows[-1][0])
+                if len(rows) < EXPORT_CHUNK_ROWS:
+                    break
+
+            if include_archived:
+                for month in await self.run_in_pool(self._archive_months, environ):
+                    rows = await self.run_in_pool(self._archived_chunk, environ, user_id, month)
+                    if rows:
+                        await send_rows(rows, empty)
+                        empty = False
+
+            await send({'type': 'http.response.body',
+                        'body': b'],"include_archived":' + (b'true' if include_archived else b'false') + b'}'})
+        finally:
+            self._close_stream(user_id, 'export')
+            self._release_admission()
+
+
+application = AsgiAdapter(
+    pomodoro.app,
+    max_workers=int(os.environ.get('ASGI_MAX_WORKERS', DEFAULT_MAX_WORKERS)),
+    heartbeat_seconds=float(os.environ.get('ASGI_HEARTBEAT_SECONDS', DEFAULT_HEARTBEAT_SECONDS)),
+    poll_seconds=float(os.environ.get('ASGI_STREAM_POLL_SECONDS', DEFAULT_STREAM_POLL_SECONDS)),
+    max_streams=int(os.environ.get('ASGI_MAX_STREAMS', DEFAULT_MAX_STREAMS)),
+    max_user_streams=int(os.environ.get('ASGI_MAX_USER_STREAMS', DEFAULT_MAX_USER_STREAMS)),
+)
+
+
+# Built-in fallback server
+
+async def _serve_connection(app, reader, writer):
+    server = writer.get_extra_info('sockname')[:2]
+    client = (writer.get_extra_info('peername') or ('', 0))[:2]
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line.strip():
+                return
+            method, target, version = request_line.decode('latin-1').split()
+            headers = []
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.partition(b':')
+                headers.append((name.strip().lower(), value.strip()))
+            header_map = dict(headers)
+            body = await reader.readexactly(int(header_map.get(b'content-length', 0)))
+            keep_alive = version == 'HTTP/1.1' and header_map.get(b'connection', b'').lower() != b'close'
+
+            path, _, query = target.partition('?')
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': version.split('/')[1],
+                'method': method, 'scheme': 'http', 'path': unquote(path), 'raw_path': path.encode('latin-1'),
+                'query_string': query.encode('latin-1'), 'root_path': '', 'headers': headers,
+                'client': client, 'server': server,
+            }
+            state = {'body_sent': False, 'chunked': False}
+
+            async def receive():
+                if not state['body_sent']:
+                    state['body_sent'] = True
+                    return {'type': 'http.request', 'body': body, 'more_body': False}
+                # Only long-lived responses ask again: wait for the client to go away
+                await reader.read()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    state['start'] = message
+                    return
+                more = message.get('more_body', False)
+                data = message.get('body', b'')
+                if 'start' in state:
+                    start = state.pop('start')
+                    names = {name.lower() for name, _ in start['headers']}
+                    status = start['status']
+                    reason = HTTPStatus(status).phrase if status in HTTPStatus._value2member_map_ else ''
+                    lines = [f'HTTP/1.1 {status} {reason}\r\n'.encode('latin-1')]
+                    lines += [name + b': ' + value + b'\r\n' for name, value in start['headers']]
+                    if more:
+                        state['chunked'] = True
+                        lines.append(b'transfer-encoding: chunked\r\n')
+                    elif b'content-length' not in names:
+                        lines.append(f'content-length: {len(data)}\r\n'.encode('latin-1'))
+                    if not keep_alive:
+                        lines.append(b'connection: close\r\n')
+                    writer.write(b''.join(lines) + b'\r\n')
+                if state['chunked']:
+                    if data:
+                        writer.write(f'{len(data):x}\r\n'.encode('latin-1') + data + b'\r\n')
+                    if not more:
+                        writer.write(b'0\r\n\r\n')
+                else:
+                    writer.write(data)
+                await writer.drain()
+
+            await app(scope, receive, send)
+            if not keep_alive:
+                return
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(app, host='127.0.0.1', port=8000):
+    """Serve ``app`` with the built-in HTTP/1.1 server until cancelled"""
+    server = await asyncio.start_server(lambda r, w: _serve_connection(app, r, w), host, port,
+                                        limit=2 ** 20, backlog=1024)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the PomodoroFlow API over ASGI')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes (uvicorn only)')
+    parser.add_argument('--builtin', action='store_true', help='Use the built-in server even if uvicorn is installed')
+    args = parser.parse_args()
+
+    if uvicorn is not None and not args.builtin:
+        uvicorn.run('asgi:application', host=args.host, port=args.port, workers=args.workers,
+                    log_level='warning')
+        return
+
+    if args.workers != 1:
+        print('The built-in server runs one process; install uvicorn for --workers', file=sys.stderr)
+    print(f'Serving on http://{args.host}:{args.port} (built-in ASGI server)')
+    try:
+        asyncio.run(serve(application, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,413 @@
+"""
+Online backups for PomodoroFlow API
+
+Backups are taken while the server runs with the SQLite online backup API,
+a few pages per step with a pause in between, so writers get the database
+between steps instead of waiting for the whole copy. Each backup is written
+to a temporary file, checked, and then renamed into the backup directory
+(``backups/`` next to the database by default) as
+``<name>-YYYYMMDDTHHMMSSmmmZ.db``, so a directory listing only ever shows
+complete backups.
+
+Old backups are pruned after every run: the newest BACKUP_KEEP are kept,
+plus the newest of each UTC day for the last BACKUP_KEEP_DAILY days.
+
+Restoring copies a backup back into the live database with the same API,
+in one step, so other connections see either the old or the restored data.
+The current database is backed up first. Restores go back to a backup, not
+to an arbitrary moment: pick the newest backup at or before a time with
+``--at``.
+
+Shard files (see sharding.py) are backed up with the main database, one
+after the other, each under its own name. Archive partitions stored as
+separate ``sessions_YYYY_MM.db`` files are written once, when their month
+is archived, and should be copied alongside.
+
+    python backup.py --db pomodoro.db create
+    python backup.py --db pomodoro.db list
+    python backup.py --db pomodoro.db restore --at 2026-10-19T08:00
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from flask import current_app
+
+import metrics
+import sharding
+import timestamps
+import timetable_cache
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+DEFAULT_INTERVAL_SECONDS = 3600
+DEFAULT_KEEP = 24
+DEFAULT_KEEP_DAILY = 7
+
+# Pages copied per backup step and the pause between steps, so writers on
+# the primary get the lock between steps
+DEFAULT_PAGES_PER_STEP = 1024
+DEFAULT_STEP_SLEEP_SECONDS = 0.005
+
+# A write to the primary between steps restarts the copy, so under steady
+# writes a stepped copy may never finish. After this many restarts the rest
+# is copied in one step, holding off writers for the length of the copy.
+MAX_RESTARTS = 2
+
+_NAME_PATTERN = re.compile(r'^(?P<name>.+)-(?P<stamp>\d{8}T\d{9})Z\.db$')
+_STAMP_FORMAT = '%Y%m%dT%H%M%S'
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def copy_database(source, target, pages=DEFAULT_PAGES_PER_STEP, sleep=DEFAULT_STEP_SLEEP_SECONDS):
+    """Back up connection ``source`` into ``target`` in steps, or in one once it keeps restarting"""
+    state = {'remaining': None, 'restarts': 0}
+
+    def progress(status, remaining, total):
+        if state['remaining'] is not None and remaining > state['remaining']:
+            state['restarts'] += 1
+            if state['restarts'] > MAX_RESTARTS:
+                raise _TooManyRestarts()
+        state['remaining'] = remaining
+
+    try:
+        source.backup(target, pages=pages, sleep=sleep, progress=progress)
+    except _TooManyRestarts:
+        source.backup(target, pages=-1)
+    return state['restarts']
+
+
+def default_backup_dir(db_path):
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), 'backups')
+
+
+def _database_name(db_path):
+    return os.path.splitext(os.path.basename(db_path))[0]
+
+
+def backup_filename(db_path, taken_at):
+    """``<name>-YYYYMMDDTHHMMSSmmmZ.db`` for a backup started at ``taken_at`` (epoch ms)"""
+    moment = datetime.fromtimestamp(taken_at / 1000, timezone.utc)
+    return f'{_database_name(db_path)}-{moment.strftime(_STAMP_FORMAT)}{taken_at % 1000:03d}Z.db'
+
+
+def list_backups(db_path, backup_dir=None):
+    """(taken_at epoch ms, path) of every backup of ``db_path``, oldest first"""
+    backup_dir = backup_dir or default_backup_dir(db_path)
+    try:
+        names = os.listdir(backup_dir)
+    except FileNotFoundError:
+        return []
+
+    backups = []
+    for filename in names:
+        match = _NAME_PATTERN.match(filename)
+        if match is None or match.group('name') != _database_name(db_path):
+            continue
+        stamp = match.group('stamp')
+        moment = datetime.strptime(stamp[:-3], _STAMP_FORMAT).replace(tzinfo=timezone.utc)
+        taken_at = int(moment.timestamp()) * 1000 + int(stamp[-3:])
+        backups.append((taken_at, os.path.join(backup_dir, filename)))
+    backups.sort()
+    return backups
+
+
+def check_backup(path):
+    """Raise sqlite3.DatabaseError unless ``path`` is an intact database"""
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        result = conn.execute('PRAGMA quick_check').fetchone()[0]
+    finally:
+        conn.close()
+    if result != 'ok':
+        raise sqlite3.DatabaseError(f'{path} failed quick_check: {result}')
+
+
+def prune(db_path, backup_dir=None, keep=DEFAULT_KEEP, keep_daily=DEFAULT_KEEP_DAILY, now=None):
+    """Delete backups outside the retention policy; returns the removed paths"""
+    backups = list_backups(db_path, backup_dir)
+    now = now if now is not None else timestamps.now_ms()
+    oldest_daily = now - keep_daily * timestamps.DAY_MS
+
+    kept = {path for _, path in backups[-keep:]} if keep > 0 else set()
+    newest_of_day = {}
+    for taken_at, path in backups:
+        if taken_at >= oldest_daily:
+            newest_of_day[timestamps.local_day(taken_at)] = path
+    kept.update(newest_of_day.values())
+
+    removed = []
+    for _, path in backups:
+        if path not in kept:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed.append(path)
+    return removed
+
+
+def create(db_path, backup_dir=None, pages=DEFAULT_PAGES_PER_STEP, sleep=DEFAULT_STEP_SLEEP_SECONDS,
+           keep=DEFAULT_KEEP, keep_daily=DEFAULT_KEEP_DAILY, verify=True):
+    """Back up ``db_path`` into ``backup_dir``; returns details of the backup.
+
+    Old backups are pruned afterwards unless ``keep`` is None.
+    """
+    backup_dir = backup_dir or default_backup_dir(db_path)
+    os.makedirs(backup_dir, exist_ok=True)
+
+    taken_at = timestamps.now_ms()
+    path = os.path.join(backup_dir, backup_filename(db_path, taken_at))
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    start = time.perf_counter()
+
+    source = sqlite3.connect(db_path, timeout=30)
+    target = sqlite3.connect(tmp_path)
+    try:
+        restarts = copy_database(source, target, pages, sleep)
+        target.execute('PRAGMA journal_mode = DELETE')
+        target.close()
+        if verify:
+            check_backup(tmp_path)
+    except Exception:
+        target.close()
+        os.remove(tmp_path)
+        raise
+    finally:
+        source.close()
+    os.replace(tmp_path, path)
+
+    return {
+        'path': path,
+        'taken_at': taken_at,
+        'bytes': os.path.getsize(path),
+        'seconds': round(time.perf_counter() - start, 3),
+        'restarts': restarts,
+        'pruned': len(prune(db_path, backup_dir, keep, keep_daily)) if keep is not None else 0,
+    }
+
+
+def create_all(db_path, backup_dir=None, shard_dir=None, **options):
+    """Back up the main database and every shard; returns the details of each backup"""
+    return [create(path, backup_dir, **options) for path in sharding.database_files(db_path, shard_dir)]
+
+
+def find_backup(db_path, backup_dir=None, at=None):
+    """Path of the newest backup taken at or before ``at`` (epoch ms; None for the newest)"""
+    candidates = [path for taken_at, path in list_backups(db_path, backup_dir)
+                  if at is None or taken_at <= at]
+    return candidates[-1] if candidates else None
+
+
+def restore(backup_path, db_path, backup_dir=None, backup_current=True):
+    """Copy ``backup_path`` over the live database ``db_path``.
+
+    The copy is one step, so it holds the database for its whole length and
+    readers never see a mix. Timetable list versions are moved past every
+    version the old data had, so listings cached in running workers are not
+    served for the restored data.
+    """
+    check_backup(backup_path)
+    result = {'restored': backup_path, 'previous': None}
+    if backup_current and os.path.exists(db_path):
+        result['previous'] = create(db_path, backup_dir, keep=None)['path']
+
+    source = sqlite3.connect(f'file:{backup_path}?mode=ro', uri=True)
+    target = sqlite3.connect(db_path, timeout=30)
+    try:
+        floor = timetable_cache.max_list_version(target)
+        source.backup(target, pages=-1)
+        timetable_cache.advance_list_versions(target, floor)
+        target.commit()
+    finally:
+        source.close()
+        target.close()
+    timetable_cache.cache.clear()
+    return result
+
+
+class BackupScheduler:
+    """Takes a backup whenever the newest one is older than the interval"""
+
+    def __init__(self, backup_dir=None, interval=DEFAULT_INTERVAL_SECONDS, keep=DEFAULT_KEEP,
+                 keep_daily=DEFAULT_KEEP_DAILY, shard_dir=None):
+        self.backup_dir = backup_dir
+        self.shard_dir = shard_dir
+        self.db_path = None
+        self.interval = interval
+        self.keep = keep
+        self.keep_daily = keep_daily
+        self.runs = Counter()  # outcome -> backups attempted
+        self.last = None
+        self._run_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._thread = None
+
+        metrics.registry.register_gauge(
+            'pomodoro_backup_age_seconds', 'Age of the newest backup',
+            lambda: {(): self.age() or 0.0}
+        )
+        metrics.registry.register_gauge(
+            'pomodoro_backups', 'Backups taken by this worker by outcome',
+            lambda: {(('outcome', outcome),): count for outcome, count in self.runs.items()}
+        )
+
+    def bind(self, db_path):
+        """Set the database on first use (it may change after init_app)"""
+        if self.db_path is None:
+            self.db_path = db_path
+            self.backup_dir = self.backup_dir or default_backup_dir(db_path)
+
+    def age(self):
+        backups = list_backups(self.db_path, self.backup_dir) if self.db_path else []
+        if not backups:
+            return None
+        return max(0.0, (timestamps.now_ms() - backups[-1][0]) / 1000)
+
+    def _due(self):
+        age = self.age()
+        return age is None or age >= self.interval
+
+    def run_once(self, force=False):
+        """Take backups if they are due (or ``force``); returns their details or None.
+
+        With several worker processes only the one holding the backup
+        directory's lock file runs it.
+        """
+        if not self._run_lock.acquire(blocking=False):
+            return None
+        try:
+            os.makedirs(self.backup_dir, exist_ok=True)
+            with open(os.path.join(self.backup_dir, '.lock'), 'a') as lock_file:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except OSError:
+                        return None
+                if not force and not self._due():
+                    return None
+                start = time.perf_counter()
+                self.last = create_all(self.db_path, self.backup_dir, self.shard_dir,
+                                       keep=self.keep, keep_daily=self.keep_daily)
+                metrics.registry.observe_phase('backup', time.perf_counter() - start)
+                self.runs['ok'] += 1
+                return self.last
+        except (sqlite3.Error, OSError):
+            self.runs['failed'] += 1
+            if force:
+                raise
+            return None
+        finally:
+            self._run_lock.release()
+
+    def _run(self):
+        while True:
+            self.run_once()
+            time.sleep(min(self.interval, 60))
+
+    def start(self):
+        """Start the background scheduler once per process"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='backup-scheduler', daemon=True)
+                self._thread.start()
+
+
+def _start_scheduler():
+    scheduler = current_app.extensions['backup']
+    scheduler.bind(current_app.config['DATABASE'])
+    scheduler.start()
+
+
+def init_app(app):
+    """Schedule backups when BACKUP_ENABLED is true; returns the BackupScheduler or None"""
+    app.config.setdefault('BACKUP_ENABLED', False)
+    app.config.setdefault('BACKUP_DIR', None)
+    app.config.setdefault('BACKUP_INTERVAL_SECONDS', DEFAULT_INTERVAL_SECONDS)
+    app.config.setdefault('BACKUP_KEEP', DEFAULT_KEEP)
+    app.config.setdefault('BACKUP_KEEP_DAILY', DEFAULT_KEEP_DAILY)
+
+    if not app.config['BACKUP_ENABLED']:
+        return None
+
+    scheduler = BackupScheduler(
+        app.config['BACKUP_DIR'],
+        app.config['BACKUP_INTERVAL_SECONDS'],
+        app.config['BACKUP_KEEP'],
+        app.config['BACKUP_KEEP_DAILY'],
+        app.config.get('SHARD_DIR'),
+    )
+    app.before_request(_start_scheduler)
+    app.extensions['backup'] = scheduler
+    return scheduler
+
+
+def _parse_time(value):
+    """Epoch ms for an ISO datetime or date, UTC unless it says otherwise"""
+    return timestamps.parse_ms(value) if value else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Back up and restore the PomodoroFlow database')
+    parser.add_argument('--db', default='pomodoro.db', help='Path to the SQLite database')
+    parser.add_argument('--backup-dir', default=None, help='Backup directory (default: backups/ next to --db)')
+    parser.add_argument('--shard-dir', default=None, help='Shard directory (default: next to --db)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    create_cmd = commands.add_parser('create', help='Back up the database and its shards now and prune')
+    create_cmd.add_argument('--pages', type=int, default=DEFAULT_PAGES_PER_STEP, help='Pages per backup step')
+    create_cmd.add_argument('--sleep', type=float, default=DEFAULT_STEP_SLEEP_SECONDS,
+                            help='Seconds to pause between steps')
+    create_cmd.add_argument('--keep', type=int, default=DEFAULT_KEEP, help='Newest backups to keep')
+    create_cmd.add_argument('--keep-daily', type=int, default=DEFAULT_KEEP_DAILY,
+                            help='Days to keep the newest backup of')
+
+    commands.add_parser('list', help='List backups, oldest first')
+
+    restore_cmd = commands.add_parser('restore', help='Restore the database and its shards from backups')
+    restore_cmd.add_argument('--at', default=None,
+                             help='Restore the newest backups taken at or before this ISO time (UTC)')
+    restore_cmd.add_argument('--file', default=None, help='Restore only --db, from this backup file')
+    restore_cmd.add_argument('--no-backup-current', action='store_true',
+                             help="Don't back up the current database first")
+    args = parser.parse_args()
+
+    files = sharding.database_files(args.db, args.shard_dir)
+    if args.command == 'create':
+        for result in create_all(args.db, args.backup_dir, args.shard_dir, pages=args.pages, sleep=args.sleep,
+                                 keep=args.keep, keep_daily=args.keep_daily):
+            print(f"Backed up to {result['path']} ({result['bytes']} bytes) in {result['seconds']}s, "
+                  f"pruned {result['pruned']}")
+    elif args.command == 'list':
+        for db_path in files:
+            for taken_at, path in list_backups(db_path, args.backup_dir):
+                print(f'{timestamps.to_datetime(taken_at).isoformat()}  {os.path.getsize(path):>12}  {path}')
+    else:
+        if args.file:
+            plan = [(args.file, args.db)]
+        else:
+            plan = [(find_backup(path, args.backup_dir, _parse_time(args.at)), path) for path in files]
+            missing = [path for backup_path, path in plan if backup_path is None]
+            if missing:
+                parser.error(f"no backup of {', '.join(missing)} taken at or before that time")
+        for backup_path, db_path in plan:
+            result = restore(backup_path, db_path, args.backup_dir, not args.no_backup_current)
+            if result['previous']:
+                print(f"Backed up the current {db_path} to {result['previous']}")
+            print(f'Restored {db_path} from {backup_path}')
+
+
+if __name__ == '__main__':
+    main()
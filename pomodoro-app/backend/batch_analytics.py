@@ -0,0 +1,296 @@
+"""
+Batch cohort analytics for PomodoroFlow
+
+Builds reports across every user from the full session history (the hot
+table and all archive partitions, of the main database and every shard):
+
+- ``cohort_daily_focus``: per UTC day, sessions started and completed and
+  the completed focus and break minutes of all users together
+- ``session_completion_rates``: per session type and planned duration, how
+  many sessions were started and how many completed
+
+Sessions are read a chunk of rows at a time, so memory stays bounded by
+the chunk size and the number of groups however long the history is. With
+NumPy installed each chunk becomes one structured array, grouped with
+``unique``/``bincount`` instead of a Python loop per row; otherwise the
+chunk is summed in a plain loop. Sessions without a start time have no day
+and are left out. Results replace the summary tables in one transaction,
+so readers see either the previous run or this one.
+
+Run it from cron, e.g. ``python batch_analytics.py --db pomodoro.db``, but
+not at the same time as ``archive.py``: sessions being moved between tables
+could be counted twice or missed.
+"""
+
+import argparse
+import sqlite3
+import time
+from datetime import date, timedelta
+
+import archive
+import sharding
+import timestamps
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DEFAULT_CHUNK_SIZE = 100000
+
+EPOCH = date(1970, 1, 1)
+
+# UTC day number (days since 1970-01-01), whether it is a work session,
+# type, planned duration and whether it was completed
+SESSION_COLUMNS = f'''started_at / {timestamps.DAY_MS}, session_type = 'work', session_type,
+                     duration, COALESCE(completed, 0)'''
+SESSION_FILTER = 'started_at IS NOT NULL'
+
+# The same columns as one NumPy record per row
+SESSION_DTYPE = [('day', 'i8'), ('work', '?'), ('type', 'O'), ('duration', 'i8'), ('completed', '?')]
+
+DAILY_FIELDS = ('sessions', 'completed_sessions', 'focus_minutes', 'break_minutes')
+RATE_FIELDS = ('sessions', 'completed_sessions')
+
+
+def init_batch_analytics_schema(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS cohort_daily_focus (
+        day DATE PRIMARY KEY,
+        sessions INTEGER NOT NULL,
+        completed_sessions INTEGER NOT NULL,
+        focus_minutes INTEGER NOT NULL,
+        break_minutes INTEGER NOT NULL
+    ) WITHOUT ROWID''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS session_completion_rates (
+        session_type TEXT NOT NULL,
+        duration INTEGER NOT NULL, -- planned, in minutes
+        sessions INTEGER NOT NULL,
+        completed_sessions INTEGER NOT NULL,
+        completion_rate REAL NOT NULL,
+        PRIMARY KEY (session_type, duration)
+    ) WITHOUT ROWID''')
+
+
+def _accumulate(totals, keys, sums):
+    """Add per-group ``sums`` (one row of field sums per key) into ``totals``"""
+    for key, values in zip(keys, sums):
+        current = totals.get(key)
+        if current is None:
+            totals[key] = list(values)
+        else:
+            for i, value in enumerate(values):
+                current[i] += value
+
+
+def _group_sums(keys, columns):
+    """Sum each of ``columns`` per distinct value of the int64 array ``keys``.
+
+    Returns (distinct keys, one row of sums per key). Dense key ranges are
+    counted straight into bins; sparse ones are sorted with ``unique``.
+    """
+    low = int(keys.min())
+    span = int(keys.max()) - low + 1
+    if span <= 4 * len(keys):
+        index = keys - low
+        counts = np.bincount(index, minlength=span)
+        present = np.flatnonzero(counts)
+        distinct = present + low
+    else:
+        distinct, index = np.unique(keys, return_inverse=True)
+        span = len(distinct)
+        counts = np.bincount(index, minlength=span)
+        present = slice(None)
+    sums = [counts[present]]
+    sums.extend(np.bincount(index, weights=column, minlength=span)[present] for column in columns)
+    return distinct.tolist(), np.column_stack(sums).astype(np.int64).tolist()
+
+
+class NumpyAggregator:
+    """Groups each chunk with NumPy"""
+
+    name = 'numpy'
+
+    def __init__(self):
+        self.daily = {}  # day number -> [sessions, completed, focus, break]
+        self.rates = {}  # (session type, duration) -> [sessions, completed]
+        self.type_codes = {}
+
+    def add(self, rows):
+        # The cursor's rows convert to columns in one step, without a Python
+        # loop or a transposed copy
+        columns = np.array(rows, dtype=SESSION_DTYPE)
+        days = columns['day']
+        is_work = columns['work']
+        durations = columns['duration']
+        completed = columns['completed']
+        done_minutes = np.where(completed, durations, 0)
+
+        keys, sums = _group_sums(days, [
+            completed,
+            np.where(is_work, done_minutes, 0),
+            np.where(is_work, 0, done_minutes),
+        ])
+        _accumulate(self.daily, keys, sums)
+
+        # Session types are free text but few: code them, then pack
+        # (type, duration) into one integer key
+        types = columns['type']
+        for session_type in set(types).difference(self.type_codes):
+            self.type_codes[session_type] = len(self.type_codes)
+        codes = np.fromiter(map(self.type_codes.__getitem__, types), np.int64, len(types))
+        low = int(durations.min())
+        span = int(durations.max()) - low + 1
+        keys, sums = _group_sums(codes * span + (durations - low), [completed])
+        names = list(self.type_codes)
+        _accumulate(self.rates, [(names[key // span], key % span + low) for key in keys], sums)
+
+
+class ArrayAggregator:
+    """Fallback without NumPy: one pass per chunk in Python"""
+
+    name = 'array'
+
+    def __init__(self):
+        self.daily = {}
+        self.rates = {}
+
+    def add(self, rows):
+        daily = {}
+        rates = {}
+        for day, work, session_type, duration, done in rows:
+            sums = daily.get(day)
+            if sums is None:
+                sums = daily[day] = [0, 0, 0, 0]
+            sums[0] += 1
+            if done:
+                sums[1] += 1
+                sums[2 if work else 3] += duration
+
+            key = (session_type, duration)
+            counts = rates.get(key)
+            if counts is None:
+                counts = rates[key] = [0, 0]
+            counts[0] += 1
+            counts[1] += done
+
+        _accumulate(self.daily, daily.keys(), daily.values())
+        _accumulate(self.rates, rates.keys(), rates.values())
+
+
+def make_aggregator(backend='auto'):
+    if backend == 'numpy' or (backend == 'auto' and np is not None):
+        if np is None:
+            raise RuntimeError('NumPy is not installed')
+        return NumpyAggregator()
+    return ArrayAggregator()
+
+
+def scan_sessions(conn, aggregator, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Feed every hot and archived session to ``aggregator``; returns rows read"""
+    total = _scan_table(conn, 'main.timer_sessions', aggregator, chunk_size)
+    for _, table in archive.partition_tables(conn):
+        total += _scan_table(conn, table, aggregator, chunk_size)
+    return total
+
+
+def _scan_table(conn, table, aggregator, chunk_size):
+    cursor = conn.execute(f'SELECT {SESSION_COLUMNS} FROM {table} WHERE {SESSION_FILTER}')
+    total = 0
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return total
+            aggregator.add(rows)
+            total += len(rows)
+    finally:
+        cursor.close()
+
+
+def write_results(conn, aggregator):
+    """Replace the summary tables with the aggregator's results in one transaction"""
+    daily = [
+        ((EPOCH + timedelta(days=day)).isoformat(), *sums)
+        for day, sums in sorted(aggregator.daily.items())
+    ]
+    rates = [
+        (session_type, duration, started, done, done / started if started else 0.0)
+        for (session_type, duration), (started, done) in sorted(aggregator.rates.items())
+    ]
+
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('DELETE FROM cohort_daily_focus')
+        conn.executemany(
+            f'''INSERT INTO cohort_daily_focus (day, {', '.join(DAILY_FIELDS)})
+                VALUES (?, ?, ?, ?, ?)''',
+            daily
+        )
+        conn.execute('DELETE FROM session_completion_rates')
+        conn.executemany(
+            f'''INSERT INTO session_completion_rates
+                (session_type, duration, {', '.join(RATE_FIELDS)}, completion_rate)
+                VALUES (?, ?, ?, ?, ?)''',
+            rates
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {'days': len(daily), 'duration_groups': len(rates)}
+
+
+def run(conn, chunk_size=DEFAULT_CHUNK_SIZE, backend='auto', shard_paths=()):
+    """Rebuild both reports from ``conn`` and the shards at ``shard_paths``; returns counts and timings"""
+    init_batch_analytics_schema(conn)
+    aggregator = make_aggregator(backend)
+
+    start = time.perf_counter()
+    rows = scan_sessions(conn, aggregator, chunk_size)
+    for path in shard_paths:
+        shard = sqlite3.connect(path)
+        try:
+            rows += scan_sessions(shard, aggregator, chunk_size)
+        finally:
+            shard.close()
+    scanned = time.perf_counter()
+    result = write_results(conn, aggregator)
+    finished = time.perf_counter()
+
+    result.update({
+        'backend': aggregator.name,
+        'rows': rows,
+        'scan_seconds': round(scanned - start, 3),
+        'write_seconds': round(finished - scanned, 3),
+        'rows_per_second': round(rows / (scanned - start)) if scanned > start else 0,
+    })
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build cohort analytics from all timer sessions')
+    parser.add_argument('--db', default='pomodoro.db', help='Path to the SQLite database')
+    parser.add_argument('--shard-dir', default=None, help='Shard directory (default: next to --db)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='Rows read and grouped at a time')
+    parser.add_argument('--backend', choices=('auto', 'numpy', 'array'), default='auto',
+                        help='Column arrays to group with (default: NumPy when installed)')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        result = run(conn, args.chunk_size, args.backend,
+                     sharding.database_files(args.db, args.shard_dir)[1:])
+    finally:
+        conn.close()
+
+    print(f"Read {result['rows']} sessions in {result['scan_seconds']}s "
+          f"({result['rows_per_second']} rows/s, {result['backend']})")
+    print(f"Wrote {result['days']} days and {result['duration_groups']} duration groups "
+          f"in {result['write_seconds']}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,6 @@
+"""
+Benchmarks for the PomodoroFlow backend
+
+Run individual benchmarks from the backend directory, e.g.
+``python -m benchmarks.bench_serialization``.
+"""
@@ -0,0 +1,65 @@
+"""
+Compression benchmark: CPU time spent versus bytes saved
+
+Compresses session-history payloads of increasing size with each available
+codec and level, and compares that with the cost of a compressed-body cache
+hit (hashing the body).
+"""
+
+import argparse
+import json
+import time
+
+import compression
+import serialization
+
+from benchmarks.bench_serialization import SESSION_ROW
+
+
+def history_payload(rows):
+    fields = ('id', 'user_id', 'session_type', 'duration', 'completed', 'started_at', 'completed_at')
+    sessions = [dict(zip(fields, (i,) + SESSION_ROW)) for i in range(rows)]
+    return serialization.dumps_bytes({'sessions': sessions})
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10, 50, 500, 5000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    codecs = [('gzip', level) for level in (1, 6, 9)]
+    if compression.brotli is not None:
+        codecs += [('br', quality) for quality in (1, 5, 9)]
+
+    results = []
+    for rows in args.rows:
+        body = serialization.dumps_bytes({'sessions': []}) if rows == 0 else history_payload(rows)
+        digest_seconds, _ = timed(lambda: compression.body_digest(body), args.repeat)
+        for encoding, level in codecs:
+            seconds, compressed = timed(
+                lambda: compression.compress(body, encoding, level), args.repeat
+            )
+            results.append({
+                'rows': rows,
+                'encoding': encoding,
+                'level': level,
+                'raw_bytes': len(body),
+                'compressed_bytes': len(compressed),
+                'bytes_saved': len(body) - len(compressed),
+                'compress_ms': round(seconds * 1000, 3),
+                'cache_hit_ms': round(digest_seconds * 1000, 3),
+                'bytes_saved_per_cpu_ms': round((len(body) - len(compressed)) / max(seconds * 1000, 1e-6)),
+            })
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Endpoint benchmarks: the bench_models.py reads behind a minimal Flask app
+
+Each read is served through the Flask test client by a small app that does
+nothing but call the storage backend and serialize the result the way app.py
+does, so the difference from the matching bench_models.py number is the
+request, session and JSON overhead. With ``--bench-storage memory`` storage
+costs next to nothing and the number is close to Flask's overhead alone.
+
+    python -m pytest benchmarks/bench_endpoints.py -q --bench-storage sqlite,memory
+"""
+
+import pytest
+from flask import Flask, jsonify, session
+
+import serialization
+
+
+def storage_app(storage):
+    """A Flask app serving the read endpoints from ``storage``"""
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'bench'
+    serialization.init_app(app)
+
+    @app.route('/api/auth/me')
+    def me():
+        return jsonify({'user': storage.users.get_by_id(session['user_id'])})
+
+    @app.route('/api/timer/sessions')
+    def sessions():
+        return jsonify({'sessions': storage.sessions.get_user_sessions(session['user_id'])})
+
+    @app.route('/api/timer/stats')
+    def stats():
+        return jsonify(storage.sessions.get_user_stats(session['user_id']))
+
+    @app.route('/api/timetables')
+    def timetables():
+        return jsonify({'timetables': storage.timetables.get_user_timetables(session['user_id'])})
+
+    @app.route('/api/timetables/<int:timetable_id>')
+    def timetable(timetable_id):
+        return jsonify(storage.timetables.get_timetable_with_entries(timetable_id, session['user_id']))
+
+    return app
+
+
+@pytest.fixture(scope='session')
+def client(dataset, storage):
+    client = storage_app(storage).test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['user_id'] = dataset.user_id
+    return client
+
+
+def get_ok(client, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    return response.data
+
+
+def test_endpoint_me(bench, client):
+    assert bench(get_ok, client, '/api/auth/me')['ops_per_sec']
+
+
+def test_endpoint_sessions(bench, client):
+    assert bench(get_ok, client, '/api/timer/sessions')['ops_per_sec']
+
+
+def test_endpoint_stats(bench, client):
+    assert bench(get_ok, client, '/api/timer/stats')['ops_per_sec']
+
+
+def test_endpoint_timetables(bench, client):
+    assert bench(get_ok, client, '/api/timetables')['ops_per_sec']
+
+
+def test_endpoint_timetable(bench, dataset, client):
+    assert bench(get_ok, client, f'/api/timetables/{dataset.timetable_id}')['ops_per_sec']
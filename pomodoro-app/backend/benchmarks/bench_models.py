@@ -0,0 +1,56 @@
+"""
+Micro-benchmarks for the models.py data-access methods
+
+Each method runs against every selected dataset size and storage backend
+for the heaviest user in the dataset. Run with pytest (the file is
+collected because it is named explicitly); results land in
+benchmarks/results/ and can be compared between commits with
+``python -m benchmarks.compare``.
+
+    python -m pytest benchmarks/bench_models.py -q
+    python -m pytest benchmarks/bench_models.py -q --bench-storage sqlite,memory
+"""
+
+import pytest
+
+from benchmarks import seed as seeding
+
+
+@pytest.fixture(scope='session')
+def models(storage):
+    return storage.users, storage.sessions, storage.timetables
+
+
+def test_exists_username(bench, dataset, models):
+    user, _, _ = models
+    assert bench(user.exists, dataset.username)['ops_per_sec']
+
+
+def test_exists_username_or_email(bench, dataset, models):
+    user, _, _ = models
+    assert bench(user.exists, dataset.username, dataset.email)['ops_per_sec']
+
+
+def test_authenticate(bench, dataset, models):
+    user, _, _ = models
+    assert bench(user.authenticate, dataset.username, seeding.SEED_PASSWORD)['ops_per_sec']
+
+
+def test_get_user_sessions(bench, dataset, models):
+    _, timer_session, _ = models
+    assert bench(timer_session.get_user_sessions, dataset.user_id)['ops_per_sec']
+
+
+def test_get_user_stats(bench, dataset, models):
+    _, timer_session, _ = models
+    assert bench(timer_session.get_user_stats, dataset.user_id)['ops_per_sec']
+
+
+def test_get_user_timetables(bench, dataset, models):
+    _, _, timetable = models
+    assert bench(timetable.get_user_timetables, dataset.user_id)['ops_per_sec']
+
+
+def test_get_timetable_with_entries(bench, dataset, models):
+    _, _, timetable = models
+    assert bench(timetable.get_timetable_with_entries, dataset.timetable_id, dataset.user_id)['ops_per_sec']
@@ -0,0 +1,87 @@
+"""
+Record benchmark: per-row memory and construction cost of model results
+
+Compares ``dict(row)`` over sqlite3.Row (the old models.py results) with the
+slotted records in records.py.
+"""
+
+import argparse
+import json
+import sqlite3
+import time
+import tracemalloc
+
+from records import SessionRecord, EntryRecord
+
+from benchmarks.bench_serialization import build_db
+
+
+def build_entries(rows):
+    conn = sqlite3.connect(':memory:')
+    conn.execute('''CREATE TABLE timetable_entries (
+        id INTEGER PRIMARY KEY, timetable_id INTEGER, start_time TIME, end_time TIME,
+        subject TEXT, is_break BOOLEAN
+    )''')
+    conn.executemany(
+        '''INSERT INTO timetable_entries (timetable_id, start_time, end_time, subject, is_break)
+           VALUES (?, ?, ?, ?, ?)''',
+        [(1, '09:00', '09:50', 'Mathematics', 0)] * rows
+    )
+    return conn
+
+
+def fetch(conn, table, record_cls):
+    conn.row_factory = sqlite3.Row
+    return conn.execute(f'SELECT {record_cls.select_columns()} FROM {table}').fetchall()
+
+
+def as_dicts(rows, record_cls):
+    return [dict(row) for row in rows]
+
+
+def as_records(rows, record_cls):
+    return [record_cls.from_row(row) for row in rows]
+
+
+def measure(build, rows, record_cls, count, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        build(rows, record_cls)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    result = build(rows, record_cls)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    return {
+        'us_per_row': round(elapsed / repeat / count * 1e6, 3),
+        'bytes_per_row': round((after - before) / count, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    datasets = {
+        'timer_sessions': (build_db(args.rows), SessionRecord),
+        'timetable_entries': (build_entries(args.rows), EntryRecord),
+    }
+
+    results = {}
+    for table, (conn, record_cls) in datasets.items():
+        rows = fetch(conn, table, record_cls)
+        results[table] = {
+            'dict': measure(as_dicts, rows, record_cls, args.rows, args.repeat),
+            'record': measure(as_records, rows, record_cls, args.rows, args.repeat),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Serialization benchmark: time and allocations per 1k session rows
+
+Compares the old ``[dict(row) for row in rows]`` + stdlib path against the
+tuple-based encoder in serialization.py (orjson and stdlib fallback).
+"""
+
+import argparse
+import json
+import sqlite3
+import time
+import tracemalloc
+
+import serialization
+
+SESSION_ROW = (7, 'work', 25, 1, '2024-01-05 10:00:00.123456', '2024-01-05 10:25:00.654321')
+
+
+def build_db(rows):
+    conn = sqlite3.connect(':memory:')
+    conn.execute('''CREATE TABLE timer_sessions (
+        id INTEGER PRIMARY KEY, user_id INTEGER, session_type TEXT, duration INTEGER,
+        completed BOOLEAN, started_at TIMESTAMP, completed_at TIMESTAMP
+    )''')
+    conn.executemany(
+        '''INSERT INTO timer_sessions (user_id, session_type, duration, completed, started_at, completed_at)
+           VALUES (?, ?, ?, ?, ?, ?)''',
+        [SESSION_ROW] * rows
+    )
+    return conn
+
+
+def encode_row_dicts(conn):
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute('SELECT * FROM timer_sessions').fetchall()
+    return json.dumps({'sessions': [dict(row) for row in rows]}).encode('utf-8')
+
+
+def encode_tuples(conn):
+    conn.row_factory = None
+    cursor = conn.execute('SELECT * FROM timer_sessions')
+    columns = serialization.cursor_columns(cursor)
+    return serialization.dumps_bytes({'sessions': serialization.row_dicts(columns, cursor.fetchall())})
+
+
+def encode_tuples_stdlib(conn):
+    conn.row_factory = None
+    cursor = conn.execute('SELECT * FROM timer_sessions')
+    columns = serialization.cursor_columns(cursor)
+    payload = {'sessions': serialization.row_dicts(columns, cursor.fetchall())}
+    return json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+CASES = {
+    'row_dicts+stdlib': encode_row_dicts,
+    'tuples+stdlib': encode_tuples_stdlib,
+    'tuples+' + ('orjson' if serialization.orjson else 'stdlib'): encode_tuples,
+}
+
+
+def measure(fn, conn, rows, repeat):
+    fn(conn)  # warm up
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(conn)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    body = fn(conn)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    per_1k = 1000 / rows
+    return {
+        'ms_per_1k_rows': round(elapsed / repeat * 1000 * per_1k, 3),
+        'peak_kib_per_1k_rows': round(peak / 1024 * per_1k, 1),
+        'bytes': len(body),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    conn = build_db(args.rows)
+    results = {name: measure(fn, conn, args.rows, args.repeat) for name, fn in CASES.items()}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
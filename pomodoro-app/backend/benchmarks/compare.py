@@ -0,0 +1,134 @@
+"""
+Compare micro-benchmark results between commits
+
+Reads two result files written by the bench_models.py harness and prints one
+row per benchmark and dataset size with ops/sec, the relative change and peak
+allocations. Arguments may be file paths or commit names found in
+benchmarks/results/; with no arguments the two most recent runs are compared.
+
+    python -m benchmarks.compare
+    python -m benchmarks.compare 737af06 HEAD --threshold 10
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+
+
+def resolve(name):
+    """Find the results file for a path, commit or ref"""
+    path = Path(name)
+    if path.is_file():
+        return path
+
+    commit = name
+    try:
+        commit = subprocess.run(
+            ('git', 'rev-parse', '--short', name), cwd=RESULTS_DIR.parent,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+
+    for candidate in (f'{commit}.json', f'{commit}-dirty.json'):
+        if (RESULTS_DIR / candidate).is_file():
+            return RESULTS_DIR / candidate
+    raise SystemExit(f'No benchmark results for {name!r} in {RESULTS_DIR}')
+
+
+def latest(count=2):
+    files = sorted(RESULTS_DIR.glob('*.json'), key=lambda path: path.stat().st_mtime)
+    if len(files) < count:
+        raise SystemExit(f'Need at least {count} result files in {RESULTS_DIR}')
+    return files[-count:]
+
+
+def load(path):
+    report = json.loads(Path(path).read_text())
+    report['by_key'] = {(b['benchmark'], b['dataset']): b for b in report['benchmarks']}
+    return report
+
+
+def compare(old, new, threshold=5.0):
+    """Rows of (benchmark, dataset, old ops, new ops, change %, old KiB, new KiB, flag)"""
+    rows = []
+    for key in sorted(set(old['by_key']) | set(new['by_key']), key=lambda k: (k[0], k[1] or '')):
+        before = old['by_key'].get(key)
+        after = new['by_key'].get(key)
+        change = None
+        flag = ''
+        if before and after and before['ops_per_sec'] and after['ops_per_sec']:
+            change = (after['ops_per_sec'] / before['ops_per_sec'] - 1) * 100
+            if change <= -threshold:
+                flag = 'slower'
+            elif change >= threshold:
+                flag = 'faster'
+        rows.append((
+            key[0], key[1] or '-',
+            before['ops_per_sec'] if before else None,
+            after['ops_per_sec'] if after else None,
+            change,
+            before['peak_kib'] if before else None,
+            after['peak_kib'] if after else None,
+            flag,
+        ))
+    return rows
+
+
+def _format(value, spec):
+    return '-' if value is None else format(value, spec)
+
+
+def render(old, new, rows):
+    headers = ('benchmark', 'dataset', f'{old["commit"]} ops/s', f'{new["commit"]} ops/s',
+               'change', 'old peak KiB', 'new peak KiB', '')
+    table = [headers] + [
+        (name, dataset, _format(before, ',.1f'), _format(after, ',.1f'),
+         _format(change, '+.1f') + ('%' if change is not None else ''),
+         _format(old_kib, ',.1f'), _format(new_kib, ',.1f'), flag)
+        for name, dataset, before, after, change, old_kib, new_kib, flag in rows
+    ]
+    widths = [max(len(str(row[i])) for row in table) for i in range(len(headers))]
+
+    lines = []
+    for index, row in enumerate(table):
+        cells = [str(cell).ljust(width) if i < 2 else str(cell).rjust(width)
+                 for i, (cell, width) in enumerate(zip(row, widths))]
+        lines.append('  '.join(cells).rstrip())
+        if index == 0:
+            lines.append('  '.join('-' * width for width in widths).rstrip())
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare models.py benchmark results')
+    parser.add_argument('old', nargs='?', help='Baseline results file or commit')
+    parser.add_argument('new', nargs='?', help='Candidate results file or commit')
+    parser.add_argument('--threshold', type=float, default=5.0,
+                        help='Percent change in ops/sec reported as faster/slower')
+    parser.add_argument('--fail-on-regression', action='store_true',
+                        help='Exit with status 1 if any benchmark got slower')
+    args = parser.parse_args()
+
+    if args.old and args.new:
+        old_path, new_path = resolve(args.old), resolve(args.new)
+    elif args.old:
+        old_path, new_path = resolve(args.old), latest(1)[0]
+    else:
+        old_path, new_path = latest(2)
+
+    old, new = load(old_path), load(new_path)
+    rows = compare(old, new, args.threshold)
+    print(f'{old_path.name} ({old.get("subject") or "?"}) -> {new_path.name} ({new.get("subject") or "?"})')
+    print(render(old, new, rows))
+
+    if args.fail_on_regression and any(row[-1] == 'slower' for row in rows):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
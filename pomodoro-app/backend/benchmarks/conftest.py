@@ -0,0 +1,245 @@
+"""
+pytest plumbing for the models.py micro-benchmarks
+
+Provides the ``dataset`` fixture (a seeded database per size, generated once
+and cached as a snapshot), the ``storage`` fixture (that dataset behind each
+selected storage backend) and the ``bench`` fixture, which times a callable,
+measures its allocations and records the result. At the end of the run all
+results are written to ``benchmarks/results/<commit>.json`` for
+``python -m benchmarks.compare``.
+
+    python -m pytest benchmarks/bench_models.py
+    python -m pytest benchmarks/bench_models.py --bench-sizes small,medium,large
+    python -m pytest benchmarks/bench_models.py --bench-storage sqlite,memory
+"""
+
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+import storage as storage_backends
+from benchmarks import seed as seeding
+
+BENCH_DIR = Path(__file__).resolve().parent
+DATASET_DIR = BENCH_DIR / '.datasets'
+RESULTS_DIR = BENCH_DIR / 'results'
+
+# name -> (users, sessions)
+DATASET_SIZES = {
+    'small': (100, 10000),
+    'medium': (1000, 200000),
+    'large': (10000, 2000000),
+}
+DEFAULT_SIZES = 'small,medium'
+DEFAULT_STORAGE = 'sqlite'
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('bench', 'models.py micro-benchmarks')
+    group.addoption('--bench-sizes', default=DEFAULT_SIZES,
+                    help=f'Comma separated dataset sizes ({", ".join(DATASET_SIZES)})')
+    group.addoption('--bench-storage', default=DEFAULT_STORAGE,
+                    help=f'Comma separated storage backends ({", ".join(storage_backends.BACKENDS)})')
+    group.addoption('--bench-min-time', type=float, default=0.2,
+                    help='Minimum seconds per timing round')
+    group.addoption('--bench-rounds', type=int, default=5)
+    group.addoption('--bench-output', default=None,
+                    help='Results file (default: benchmarks/results/<commit>.json)')
+    group.addoption('--bench-regenerate', action='store_true',
+                    help='Rebuild cached dataset snapshots')
+
+
+def pytest_generate_tests(metafunc):
+    if 'dataset' in metafunc.fixturenames:
+        sizes = [size.strip() for size in metafunc.config.getoption('--bench-sizes').split(',')]
+        unknown = [size for size in sizes if size not in DATASET_SIZES]
+        if unknown:
+            raise pytest.UsageError(f'Unknown dataset size(s): {", ".join(unknown)}')
+        metafunc.parametrize('dataset', sizes, indirect=True, scope='session')
+    if 'storage' in metafunc.fixturenames:
+        backends = [name.strip() for name in metafunc.config.getoption('--bench-storage').split(',')]
+        unknown = [name for name in backends if name not in storage_backends.BACKENDS]
+        if unknown:
+            raise pytest.UsageError(f'Unknown storage backend(s): {", ".join(unknown)}')
+        metafunc.parametrize('storage', backends, indirect=True, scope='session')
+
+
+class Dataset:
+    """A seeded database plus the ids the benchmarks run against"""
+
+    def __init__(self, name, db_path):
+        self.name = name
+        self.db_path = str(db_path)
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            # The heaviest user is the worst case for every per-user query
+            self.user_id, self.session_count = conn.execute(
+                '''SELECT user_id, COUNT(*) FROM timer_sessions
+                   GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1'''
+            ).fetchone()
+            self.username, self.email = conn.execute(
+                'SELECT username, email FROM users WHERE id = ?', (self.user_id,)
+            ).fetchone()
+            self.timetable_id = conn.execute(
+                'SELECT id FROM timetables WHERE user_id = ? ORDER BY date DESC LIMIT 1',
+                (self.user_id,)
+            ).fetchone()[0]
+        finally:
+            conn.close()
+
+
+@pytest.fixture(scope='session')
+def dataset(request, tmp_path_factory):
+    name = request.param
+    users, sessions = DATASET_SIZES[name]
+    snapshot = DATASET_DIR / f'{name}-{users}-{sessions}-v{seeding.FORMAT_VERSION}.db'
+
+    if request.config.getoption('--bench-regenerate') or not snapshot.exists():
+        build_path = tmp_path_factory.mktemp('build') / f'{name}.db'
+        result = seeding.seed(str(build_path), users, sessions)
+        seeding.snapshot(str(build_path), snapshot, metadata=result)
+
+    db_path = tmp_path_factory.mktemp('data') / f'{name}.db'
+    seeding.restore(snapshot, db_path)
+    return Dataset(name, db_path)
+
+
+@pytest.fixture(scope='session')
+def storage(request, dataset):
+    """The dataset behind one storage backend (memory loads a copy of it)"""
+    return storage_backends.open_storage(request.param, dataset.db_path)
+
+
+def _calibrate(fn, args, min_time):
+    """Smallest power-of-ten loop count that takes at least ``min_time``"""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn(*args)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 10 ** 6:
+            return loops
+        loops *= 10
+
+
+def measure(fn, args=(), min_time=0.2, rounds=5):
+    """Time ``fn(*args)`` and measure the memory one call allocates"""
+    fn(*args)  # warm caches and connections
+    loops = _calibrate(fn, args, min_time)
+
+    per_call = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn(*args)
+        per_call.append((time.perf_counter() - start) / loops)
+
+    tracemalloc.start()
+    try:
+        before_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        before_blocks = sys.getallocatedblocks()
+        result = fn(*args)
+        after_blocks = sys.getallocatedblocks()
+        after_bytes, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+
+    median = statistics.median(per_call)
+    return {
+        'ops_per_sec': round(1 / median, 2) if median else None,
+        'median_us': round(median * 1e6, 2),
+        'min_us': round(min(per_call) * 1e6, 2),
+        'stdev_us': round(statistics.stdev(per_call) * 1e6, 2) if rounds > 1 else 0.0,
+        'loops': loops,
+        'rounds': rounds,
+        'peak_kib': round((peak_bytes - before_bytes) / 1024, 2),
+        'result_kib': round((after_bytes - before_bytes) / 1024, 2),
+        'result_blocks': after_blocks - before_blocks,
+    }
+
+
+class Bench:
+    """Callable fixture: ``bench(fn, *args)`` measures and records one benchmark"""
+
+    def __init__(self, request, results):
+        self.request = request
+        self.results = results
+        config = request.config
+        self.min_time = config.getoption('--bench-min-time')
+        self.rounds = config.getoption('--bench-rounds')
+
+    def __call__(self, fn, *args):
+        node = self.request.node
+        dataset = node.funcargs.get('dataset')
+        storage = node.funcargs.get('storage')
+        result = measure(fn, args, self.min_time, self.rounds)
+        result['benchmark'] = node.originalname.removeprefix('test_')
+        result['dataset'] = dataset.name if dataset is not None else None
+        result['storage'] = storage.name if storage is not None else None
+        # SQLite keeps the plain name so results compare with older runs
+        if storage is not None and storage.name != 'sqlite':
+            result['benchmark'] += f'[{storage.name}]'
+        self.results[node.nodeid] = result
+        return result
+
+
+def pytest_configure(config):
+    config._bench_results = {}
+
+
+@pytest.fixture
+def bench(request):
+    return Bench(request, request.config._bench_results)
+
+
+def _git(*args):
+    try:
+        return subprocess.run(
+            ('git',) + args, cwd=BENCH_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def pytest_sessionfinish(session, exitstatus):
+    results = getattr(session.config, '_bench_results', None)
+    if not results:
+        return
+
+    commit = _git('rev-parse', '--short', 'HEAD') or 'unknown'
+    dirty = bool(_git('status', '--porcelain', '--untracked-files=no'))
+    output = session.config.getoption('--bench-output')
+    if output is None:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        output = RESULTS_DIR / f'{commit}{"-dirty" if dirty else ""}.json'
+
+    report = {
+        'commit': commit,
+        'dirty': dirty,
+        'subject': _git('log', '-1', '--format=%s'),
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'benchmarks': sorted(results.values(), key=lambda r: (r['benchmark'], r['dataset'] or '')),
+    }
+    Path(output).write_text(json.dumps(report, indent=2))
+
+    reporter = session.config.pluginmanager.get_plugin('terminalreporter')
+    if reporter is not None:
+        reporter.write_sep('-', f'benchmark results written to {output}')
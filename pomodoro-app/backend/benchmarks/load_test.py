@@ -0,0 +1,368 @@
+"""
+Load test for the PomodoroFlow API
+
+Seeds a synthetic dataset, then drives every endpoint as logged-in virtual
+users, either in-process through the Flask test client (``--mode client``) or
+over HTTP against a multi-worker server (``--mode server``). Prints throughput
+and latency percentiles per endpoint as JSON, and exits non-zero when a run
+regresses against a stored baseline by more than ``--tolerance``.
+
+    python -m benchmarks.load_test --users 10000 --sessions 10000000 --db bench.db
+    python -m benchmarks.load_test --db bench.db --no-seed --save-baseline baseline.json
+    python -m benchmarks.load_test --db bench.db --restore snapshots/10k.db --baseline baseline.json
+    python -m benchmarks.load_test --db bench.db --no-seed --baseline baseline.json
+    python -m benchmarks.load_test --db bench.db --no-seed --backup-every 5
+
+``--backup-every`` takes online backups in the background throughout each
+run, to measure what they cost in request latency.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# The seeder imports the app, which reads its config at import time; the
+# load test measures the app, not the rate limiter
+os.environ['RATELIMIT_ENABLED'] = '0'
+
+import backup  # noqa: E402
+from benchmarks import seed as seeding  # noqa: E402
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+class TestClientDriver:
+    """Requests through the Flask test client, in this process"""
+
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+
+    def request(self, method, path, body=None):
+        response = self.client.open(path, method=method, json=body)
+        return response.status_code, response.get_json(silent=True)
+
+    def close(self):
+        pass
+
+
+class HTTPDriver:
+    """Requests over HTTP/1.1 keep-alive with a session cookie"""
+
+    def __init__(self, host, port):
+        self.connection = http.client.HTTPConnection(host, port, timeout=30)
+        self.cookie = None
+
+    def request(self, method, path, body=None):
+        headers = {'Content-Type': 'application/json'}
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        payload = json.dumps(body) if body is not None else None
+        try:
+            self.connection.request(method, path, body=payload, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+        except (http.client.HTTPException, OSError):
+            self.connection.close()
+            return 599, None
+
+        set_cookie = response.getheader('Set-Cookie')
+        if set_cookie:
+            self.cookie = set_cookie.split(';', 1)[0]
+        if response.getheader('Connection', '').lower() == 'close':
+            self.connection.close()
+        try:
+            return response.status, json.loads(data) if data else None
+        except ValueError:
+            return response.status, None
+
+    def close(self):
+        self.connection.close()
+
+
+class Recorder:
+    """Collects latencies per endpoint from all worker threads"""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, ok):
+        with self._lock:
+            self.samples.setdefault(name, []).append(seconds)
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, errors, elapsed):
+    values = sorted(samples)
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'throughput_rps': round(len(values) / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(values, 0.50) * 1000, 3),
+        'p90_ms': round(percentile(values, 0.90) * 1000, 3),
+        'p99_ms': round(percentile(values, 0.99) * 1000, 3),
+        'max_ms': round(values[-1] * 1000, 3) if values else 0.0,
+    }
+
+
+def timed(recorder, driver, name, method, path, body=None, expect=(200, 201)):
+    start = time.perf_counter()
+    status, data = driver.request(method, path, body)
+    recorder.record(name, time.perf_counter() - start, status in expect)
+    return status, data
+
+
+def virtual_user(driver, recorder, user_count, iterations, rng):
+    """One simulated user: log in, then cycle through every endpoint"""
+    user = rng.randrange(1, user_count + 1)
+    timed(recorder, driver, 'POST /api/auth/login', 'POST', '/api/auth/login',
+          {'username': seeding.username(user), 'password': seeding.SEED_PASSWORD})
+
+    for _ in range(iterations):
+        timed(recorder, driver, 'GET /api/auth/me', 'GET', '/api/auth/me')
+        timed(recorder, driver, 'GET /api/timer/sessions', 'GET', '/api/timer/sessions')
+        timed(recorder, driver, 'GET /api/stats', 'GET', '/api/stats')
+
+        status, data = timed(recorder, driver, 'POST /api/timer/sessions', 'POST',
+                             '/api/timer/sessions', {'session_type': 'work', 'duration': 25})
+        if status == 201 and data:
+            timed(recorder, driver, 'PUT /api/timer/sessions/<id>/complete', 'PUT',
+                  f"/api/timer/sessions/{data['session_id']}/complete")
+
+        status, data = timed(recorder, driver, 'GET /api/timetables', 'GET', '/api/timetables')
+        if status == 200 and data and data.get('timetables'):
+            timetable_id = data['timetables'][0]['id']
+            timed(recorder, driver, 'GET /api/timetables/<id>', 'GET', f'/api/timetables/{timetable_id}')
+
+        timed(recorder, driver, 'POST /api/timetables', 'POST', '/api/timetables', {
+            'title': 'Load test plan',
+            'date': time.strftime('%Y-%m-%d'),
+            'entries': [{'start_time': '09:00', 'end_time': '09:50', 'subject': 'Mathematics'}],
+        })
+        timed(recorder, driver, 'GET /api/timer/sessions/export', 'GET', '/api/timer/sessions/export')
+
+    timed(recorder, driver, 'POST /api/auth/logout', 'POST', '/api/auth/logout')
+
+
+def run_load(make_driver, user_count, concurrency, virtual_users, iterations, seed_value=1):
+    recorder = Recorder()
+    queue = list(range(virtual_users))
+    queue_lock = threading.Lock()
+
+    def worker(worker_id):
+        rng = random.Random(seed_value * 1000 + worker_id)
+        while True:
+            with queue_lock:
+                if not queue:
+                    return
+                queue.pop()
+            driver = make_driver()
+            try:
+                virtual_user(driver, recorder, user_count, iterations, rng)
+            finally:
+                driver.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    endpoints = {
+        name: summarize(samples, recorder.errors.get(name, 0), elapsed)
+        for name, samples in sorted(recorder.samples.items())
+    }
+    all_samples = [value for samples in recorder.samples.values() for value in samples]
+    total = summarize(all_samples, sum(recorder.errors.values()), elapsed)
+    return {'elapsed_s': round(elapsed, 3), 'total': total, 'endpoints': endpoints}
+
+
+class BackupLoop:
+    """Takes online backups of the database every ``interval`` seconds until stopped"""
+
+    def __init__(self, db_path, interval):
+        self.db_path = db_path
+        self.interval = interval
+        self.backup_dir = tempfile.mkdtemp(prefix='load-test-backups-')
+        self.results = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.results.append(backup.create(self.db_path, self.backup_dir, keep=1, keep_daily=0))
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        shutil.rmtree(self.backup_dir, ignore_errors=True)
+
+    def summary(self):
+        seconds = sorted(result['seconds'] for result in self.results)
+        return {
+            'backups': len(seconds),
+            'interval_s': self.interval,
+            'max_seconds': seconds[-1] if seconds else 0.0,
+            'restarts': sum(result['restarts'] for result in self.results),
+        }
+
+
+def measure(db_path, backup_every, run):
+    """``run()``, with background backups when ``backup_every`` is set"""
+    if not backup_every:
+        return run()
+    with BackupLoop(db_path, backup_every) as loop:
+        result = run()
+    result['backups'] = loop.summary()
+    return result
+
+
+def _wait_for_port(host, port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Server did not start on {host}:{port}')
+
+
+def start_server(db_path, port, workers):
+    # The load comes from one address, so the per-client limits would cap it
+    env = dict(os.environ, POMODORO_DB=os.path.abspath(db_path), RATELIMIT_ENABLED='0')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.serve', '--port', str(port), '--workers', str(workers)],
+        cwd=BACKEND_DIR, env=env,
+    )
+    try:
+        _wait_for_port('127.0.0.1', port)
+    except RuntimeError:
+        process.kill()
+        raise
+    return process
+
+
+def compare(result, baseline, tolerance):
+    """List regressions of p99 latency or throughput beyond ``tolerance``"""
+    regressions = []
+    for name, current in result['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(name)
+        if not previous:
+            continue
+        if previous['p99_ms'] and current['p99_ms'] > previous['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {previous['p99_ms']}ms -> {current['p99_ms']}ms")
+        if previous['throughput_rps'] and current['throughput_rps'] < previous['throughput_rps'] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {previous['throughput_rps']} -> {current['throughput_rps']} req/s"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the PomodoroFlow API')
+    parser.add_argument('--db', default='bench.db', help='Benchmark database path')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--sessions', type=int, default=10000000)
+    parser.add_argument('--no-seed', action='store_true', help='Reuse an already seeded --db')
+    parser.add_argument('--restore', metavar='SNAPSHOT',
+                        help='Restore --db from a benchmarks.seed snapshot instead of seeding')
+    parser.add_argument('--mode', choices=('client', 'server', 'both'), default='both')
+    parser.add_argument('--workers', type=int, default=4, help='Server worker processes')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent virtual users')
+    parser.add_argument('--virtual-users', type=int, default=64)
+    parser.add_argument('--iterations', type=int, default=5, help='Endpoint cycles per virtual user')
+    parser.add_argument('--output', help='Write the JSON report here as well as stdout')
+    parser.add_argument('--baseline', help='Fail if results regress against this report')
+    parser.add_argument('--save-baseline', help='Store this run as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--backup-every', type=float, default=None, metavar='SECONDS',
+                        help='Take an online backup this often during each run')
+    args = parser.parse_args()
+
+    report = {'config': {
+        'users': args.users, 'sessions': args.sessions, 'workers': args.workers,
+        'concurrency': args.concurrency, 'virtual_users': args.virtual_users,
+        'iterations': args.iterations, 'backup_every': args.backup_every,
+    }}
+
+    if args.restore:
+        start = time.perf_counter()
+        seeding.restore(args.restore, args.db)
+        report['restore_seconds'] = round(time.perf_counter() - start, 2)
+    elif not args.no_seed:
+        if os.path.exists(args.db):
+            os.remove(args.db)
+        start = time.perf_counter()
+        report['seed'] = seeding.seed(args.db, args.users, args.sessions)
+        report['seed']['seconds'] = round(time.perf_counter() - start, 2)
+
+    report['runs'] = {}
+    if args.mode in ('client', 'both'):
+        os.environ['POMODORO_DB'] = os.path.abspath(args.db)
+        import app as pomodoro
+        pomodoro.app.config['DATABASE'] = os.path.abspath(args.db)
+        report['runs']['client'] = measure(args.db, args.backup_every, lambda: run_load(
+            lambda: TestClientDriver(pomodoro.app), args.users,
+            args.concurrency, args.virtual_users, args.iterations,
+        ))
+
+    if args.mode in ('server', 'both'):
+        server = start_server(args.db, args.port, args.workers)
+        try:
+            report['runs']['server'] = measure(args.db, args.backup_every, lambda: run_load(
+                lambda: HTTPDriver('127.0.0.1', args.port), args.users,
+                args.concurrency, args.virtual_users, args.iterations,
+            ))
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    for path in (args.output, args.save_baseline):
+        if path:
+            Path(path).write_text(output)
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        regressions = []
+        for mode, result in report['runs'].items():
+            previous = baseline.get('runs', {}).get(mode)
+            if previous:
+                regressions += [f'[{mode}] {line}' for line in compare(result, previous, args.tolerance)]
+        if regressions:
+            print('Regressions against baseline:', file=sys.stderr)
+            for line in regressions:
+                print(f'  {line}', file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
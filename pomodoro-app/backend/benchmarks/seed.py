@@ -0,0 +1,346 @@
+"""
+Synthetic dataset generator and snapshot tool for benchmarks
+
+Generates users, per-user session histories and weekly timetables with the
+app's own schema:
+
+- sessions per user follow a power law (a few heavy users, a long tail)
+- sessions come in pomodoro chains (work 25 / break 5, a 15 minute break
+  after every fourth work block) starting around realistic study hours,
+  with fewer sessions at weekends and more in recent weeks; users are in
+  UTC, so clock times are UTC
+- one timetable per user per week, with a handful of subject blocks
+
+Rows are bulk loaded with executemany in large transactions, with secondary
+indexes dropped during the load and rebuilt once at the end. The result can
+be snapshotted (VACUUM INTO) and restored by a plain file copy. Analytics
+rollups are rebuilt from the loaded sessions.
+
+All synthetic users share one password (SEED_PASSWORD) so generation doesn't
+pay for one password hash per user.
+
+    python -m benchmarks.seed generate --db bench.db --users 10000 --sessions 10000000 \\
+        --snapshot snapshots/10k.db
+    python -m benchmarks.seed restore snapshots/10k.db bench.db
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate, islice
+from pathlib import Path
+
+from werkzeug.security import generate_password_hash
+
+import analytics
+import app as pomodoro
+import timestamps
+
+SEED_PASSWORD = 'benchmark-password'
+
+# Bump when generated data changes shape, so cached snapshots are rebuilt
+# (2: epoch millisecond timestamps)
+FORMAT_VERSION = 2
+BATCH_SIZE = 100000
+SUBJECTS = ('Mathematics', 'Physics', 'Chemistry', 'Biology', 'History', 'Literature', 'Languages')
+
+# Pareto shape for sessions per user; lower is more skewed
+POWER_LAW_ALPHA = 1.16
+
+# Relative likelihood of starting a study block at each hour of the day
+HOUR_WEIGHTS = (
+    0, 0, 0, 0, 0, 0, 1, 2, 5, 9, 10, 8,  # 00-11
+    5, 6, 9, 10, 8, 6, 5, 7, 9, 7, 4, 2,  # 12-23
+)
+WEEKEND_WEIGHT = 0.45
+
+
+def username(n):
+    return f'user{n}'
+
+
+def _init_schema(db_path):
+    previous = pomodoro.app.config['DATABASE']
+    pomodoro.app.config['DATABASE'] = db_path
+    try:
+        pomodoro.init_db()
+    finally:
+        pomodoro.app.config['DATABASE'] = previous
+
+
+def session_counts(users, sessions, rng, alpha=POWER_LAW_ALPHA):
+    """Split ``sessions`` across users following a power law"""
+    weights = [rng.paretovariate(alpha) for _ in range(users)]
+    scale = sessions / sum(weights)
+    counts = [int(weight * scale) for weight in weights]
+    # Hand out the rounding remainder to random users
+    for _ in range(sessions - sum(counts)):
+        counts[rng.randrange(users)] += 1
+    return counts
+
+
+def _day_starts(now, history_days):
+    """Epoch milliseconds of UTC midnight for each day offset, with a sampling weight per day"""
+    days, weights = [], []
+    for offset in range(history_days):
+        day = now - timedelta(days=offset)
+        days.append(timestamps.day_start_ms(day.date()))
+        # Recent weeks are busier than old ones; weekends are quieter
+        weight = 1.0 + 2.0 * (1 - offset / history_days)
+        if day.weekday() >= 5:
+            weight *= WEEKEND_WEIGHT
+        weights.append(weight)
+    return days, weights
+
+
+def session_rows(counts, now, rng, history_days=365):
+    """Yield timer_sessions rows user by user, as pomodoro chains"""
+    days, day_weights = _day_starts(now, history_days)
+    day_cumulative = list(accumulate(day_weights))
+    hours = range(24)
+    hour_cumulative = list(accumulate(HOUR_WEIGHTS))
+    today = days[0]
+
+    for user_id, count in enumerate(counts, start=1):
+        emitted = 0
+        while emitted < count:
+            day = rng.choices(days, cum_weights=day_cumulative)[0]
+            minute_of_day = rng.choices(hours, cum_weights=hour_cumulative)[0] * 60 + rng.randrange(60)
+            chain = min(count - emitted, rng.randint(2, 8))
+            work_blocks = 0
+            abandoned = rng.random() < 0.1
+
+            for i in range(chain):
+                if minute_of_day >= 24 * 60 - 25:
+                    break
+                session_type = 'work' if i % 2 == 0 else 'break'
+                if session_type == 'work':
+                    work_blocks += 1
+                    duration = 25
+                else:
+                    duration = 15 if work_blocks % 4 == 0 else 5
+
+                second = rng.randrange(60)
+                started_at = day + (minute_of_day * 60 + second) * 1000
+                completed = not (abandoned and i == chain - 1) and not (
+                    day == today and minute_of_day + duration > now.hour * 60 + now.minute
+                )
+                if completed:
+                    completed_at = started_at + duration * 60 * 1000
+                else:
+                    completed_at = None
+
+                yield (user_id, session_type, duration, completed, started_at, completed_at)
+                emitted += 1
+                minute_of_day += duration
+
+
+def timetable_rows(users, weeks, now, rng):
+    """Yield (timetable row, entry rows) with explicit ids, one per user per week"""
+    monday = now - timedelta(days=now.weekday())
+    timetable_id = 0
+    entry_id = 0
+    for user_id in range(1, users + 1):
+        for week in range(weeks):
+            timetable_id += 1
+            date = (monday - timedelta(weeks=week)).strftime('%Y-%m-%d')
+            timetable = (timetable_id, user_id, f'Week of {date}', 'Weekly study plan', date)
+
+            entries = []
+            minute_of_day = rng.choice((8, 9, 10)) * 60
+            for block in range(rng.randint(3, 10)):
+                is_break = block % 3 == 2
+                length = 15 if is_break else rng.choice((45, 50, 60, 90))
+                end = minute_of_day + length
+                if end >= 22 * 60:
+                    break
+                entry_id += 1
+                entries.append((
+                    entry_id, timetable_id,
+                    f'{minute_of_day // 60:02d}:{minute_of_day % 60:02d}',
+                    f'{end // 60:02d}:{end % 60:02d}',
+                    'Break' if is_break else rng.choice(SUBJECTS),
+                    is_break,
+                ))
+                minute_of_day = end
+            yield timetable, entries
+
+
+def _drop_secondary_indexes(conn):
+    """Drop user-defined indexes and return their SQL for rebuilding"""
+    indexes = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+    ).fetchall()
+    for name, _ in indexes:
+        conn.execute(f'DROP INDEX {name}')
+    return [sql for _, sql in indexes]
+
+
+def _bulk_insert(conn, sql, rows):
+    total = 0
+    while True:
+        batch = list(islice(rows, BATCH_SIZE))
+        if not batch:
+            return total
+        conn.executemany(sql, batch)
+        total += len(batch)
+
+
+def seed(db_path, users=10000, sessions=10000000, weeks=4, seed_value=42, history_days=365):
+    """Fill ``db_path`` with synthetic data; returns row counts and timings"""
+    rng = random.Random(seed_value)
+    now = datetime.now(timezone.utc)
+    _init_schema(db_path)
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('PRAGMA cache_size = -262144')  # 256 MiB
+        conn.execute('PRAGMA locking_mode = EXCLUSIVE')
+        conn.execute('PRAGMA temp_store = MEMORY')
+
+        start = time.perf_counter()
+        index_sql = _drop_secondary_indexes(conn)
+        conn.execute('BEGIN')
+
+        password_hash = generate_password_hash(SEED_PASSWORD)
+        user_count = _bulk_insert(
+            conn,
+            'INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
+            ((username(n), f'{username(n)}@example.com', password_hash) for n in range(1, users + 1))
+        )
+
+        counts = session_counts(users, sessions, rng) if users else []
+        session_count = _bulk_insert(
+            conn,
+            '''INSERT INTO timer_sessions
+               (user_id, session_type, duration, completed, started_at, completed_at)
+               VALUES (?, ?, ?, ?, ?, ?)''',
+            session_rows(counts, now, rng, history_days)
+        )
+
+        timetable_count = entry_count = 0
+        timetables = timetable_rows(users, weeks, now, rng)
+        while True:
+            chunk = list(islice(timetables, BATCH_SIZE // 10))
+            if not chunk:
+                break
+            conn.executemany(
+                'INSERT INTO timetables (id, user_id, title, description, date) VALUES (?, ?, ?, ?, ?)',
+                [timetable for timetable, _ in chunk]
+            )
+            entries = [entry for _, timetable_entries in chunk for entry in timetable_entries]
+            conn.executemany(
+                '''INSERT INTO timetable_entries
+                   (id, timetable_id, start_time, end_time, subject, is_break)
+                   VALUES (?, ?, ?, ?, ?, ?)''',
+                entries
+            )
+            timetable_count += len(chunk)
+            entry_count += len(entries)
+
+        conn.execute('COMMIT')
+        load_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for sql in index_sql:
+            conn.execute(sql)
+        conn.execute('ANALYZE')
+        index_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        analytics.backfill(conn)
+        rollup_seconds = time.perf_counter() - start
+    finally:
+        conn.close()
+
+    # Leave the file in the mode the app runs in
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode = DELETE')
+    conn.close()
+
+    rows = user_count + session_count + timetable_count + entry_count
+    return {
+        'users': user_count,
+        'sessions': session_count,
+        'timetables': timetable_count,
+        'timetable_entries': entry_count,
+        'load_seconds': round(load_seconds, 2),
+        'index_seconds': round(index_seconds, 2),
+        'rollup_seconds': round(rollup_seconds, 2),
+        'rows_per_minute': round(rows / load_seconds * 60) if load_seconds else 0,
+    }
+
+
+def snapshot(db_path, snapshot_path, metadata=None):
+    """Write a compacted copy of ``db_path`` plus a JSON metadata sidecar"""
+    snapshot_path = Path(snapshot_path)
+    snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+    if snapshot_path.exists():
+        snapshot_path.unlink()
+
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute('VACUUM INTO ?', (str(snapshot_path),))
+    finally:
+        conn.close()
+
+    if metadata is not None:
+        snapshot_path.with_suffix(snapshot_path.suffix + '.json').write_text(json.dumps(metadata, indent=2))
+    return snapshot_path
+
+
+def restore(snapshot_path, db_path):
+    """Replace ``db_path`` with a copy of the snapshot"""
+    for suffix in ('-wal', '-shm', '-journal'):
+        if os.path.exists(f'{db_path}{suffix}'):
+            os.remove(f'{db_path}{suffix}')
+    tmp_path = f'{db_path}.restoring'
+    shutil.copyfile(snapshot_path, tmp_path)
+    os.replace(tmp_path, db_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate or restore benchmark datasets')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help='Generate a synthetic database')
+    generate.add_argument('--db', default='bench.db')
+    generate.add_argument('--users', type=int, default=10000)
+    generate.add_argument('--sessions', type=int, default=10000000)
+    generate.add_argument('--weeks', type=int, default=4, help='Weekly timetables per user')
+    generate.add_argument('--history-days', type=int, default=365)
+    generate.add_argument('--seed', type=int, default=42)
+    generate.add_argument('--snapshot', help='Also write a snapshot here')
+
+    restore_cmd = commands.add_parser('restore', help='Restore a snapshot')
+    restore_cmd.add_argument('snapshot')
+    restore_cmd.add_argument('db')
+
+    args = parser.parse_args()
+
+    if args.command == 'restore':
+        start = time.perf_counter()
+        restore(args.snapshot, args.db)
+        print(json.dumps({'restored': args.db, 'seconds': round(time.perf_counter() - start, 3)}))
+        return
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    result = seed(args.db, args.users, args.sessions, args.weeks, args.seed, args.history_days)
+    if args.snapshot:
+        start = time.perf_counter()
+        snapshot(args.db, args.snapshot, metadata=dict(result, seed=args.seed))
+        result['snapshot'] = args.snapshot
+        result['snapshot_seconds'] = round(time.perf_counter() - start, 2)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
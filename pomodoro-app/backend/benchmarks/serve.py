@@ -0,0 +1,40 @@
+"""
+Multi-worker server for load tests
+
+Runs the app under gunicorn when it is installed, otherwise under werkzeug's
+forking server. The database comes from POMODORO_DB like the app itself.
+"""
+
+import argparse
+import os
+import sys
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        gunicorn = None
+
+    if gunicorn is not None:
+        os.execvp(sys.executable, [
+            sys.executable, '-m', 'gunicorn', '--workers', str(args.workers),
+            '--bind', f'{args.host}:{args.port}', '--log-level', 'warning', 'app:app',
+        ])
+
+    import logging
+    from werkzeug.serving import run_simple
+    from app import app
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    run_simple(args.host, args.port, app, processes=args.workers, threaded=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""
+Response compression for PomodoroFlow API
+
+Responses above a size threshold are compressed with the best encoding the
+client accepts: brotli when the optional ``brotli`` package is installed,
+otherwise gzip from the stdlib. Compressed bodies are cached by a digest of
+the uncompressed body, so repeated identical responses (an unchanged history
+page, a timetable) are compressed once and then served from the cache.
+"""
+
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from flask import request
+import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_MIN_SIZE = 1024
+DEFAULT_GZIP_LEVEL = 6
+DEFAULT_BROTLI_QUALITY = 5
+DEFAULT_CACHE_BYTES = 16 * 1024 * 1024
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/plain', 'text/html', 'text/csv')
+
+
+def available_encodings():
+    """Encodings we can produce, in order of preference"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compress(body, encoding, level=None):
+    if encoding == 'br':
+        quality = DEFAULT_BROTLI_QUALITY if level is None else level
+        return brotli.compress(body, quality=quality)
+    if encoding == 'gzip':
+        # mtime=0 keeps the output deterministic for identical bodies
+        level = DEFAULT_GZIP_LEVEL if level is None else level
+        return gzip.compress(body, compresslevel=level, mtime=0)
+    raise ValueError(f'Unsupported encoding: {encoding}')
+
+
+def negotiate(accept_encoding, encodings=None):
+    """Pick the preferred encoding allowed by an Accept-Encoding header"""
+    if not accept_encoding:
+        return None
+
+    accepted = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    for encoding in encodings or available_encodings():
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > 0:
+            return encoding
+    return None
+
+
+class CompressedBodyCache:
+    """Byte-bounded LRU of compressed bodies keyed by (digest, encoding)"""
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+def body_digest(body):
+    return hashlib.sha256(body).digest()
+
+
+class Compressor:
+    """after_request hook that compresses eligible responses"""
+
+    def __init__(self, app=None):
+        self.cache = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_MIN_SIZE', DEFAULT_MIN_SIZE)
+        app.config.setdefault('COMPRESS_LEVEL', None)
+        app.config.setdefault('COMPRESS_CACHE_BYTES', DEFAULT_CACHE_BYTES)
+        self.min_size = app.config['COMPRESS_MIN_SIZE']
+        self.level = app.config['COMPRESS_LEVEL']
+        self.cache = CompressedBodyCache(app.config['COMPRESS_CACHE_BYTES'])
+        app.extensions['compressor'] = self
+        app.after_request(self.after_request)
+
+    def after_request(self, response):
+        if (response.direct_passthrough
+                or response.is_streamed
+                or response.status_code < 200
+                or response.status_code in (204, 206, 304)
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+
+        response.vary.add('Accept-Encoding')
+
+        body = response.get_data()
+        if len(body) < self.min_size:
+            return response
+
+        encoding = negotiate(request.headers.get('Accept-Encoding'))
+        if encoding is None:
+            return response
+
+        key = (body_digest(body), encoding)
+        compressed = self.cache.get(key)
+        if compressed is None:
+            with metrics.timing('compress'):
+                compressed = compress(body, encoding, self.level)
+            self.cache.put(key, compressed)
+
+        if len(compressed) >= len(body):
+            return response
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+
+def init_app(app):
+    return Compressor(app)
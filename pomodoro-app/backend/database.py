@@ -5,21 +5,31 @@ Database Configuration and Connection Management
 import sqlite3
 import os
 from contextlib import contextmanager
+import analytics
+import archive
+import backup
+import idempotency
+import metrics
+import purge
+import sharding
+import startup
+import timestamps
+import timetable_cache
 
 class DatabaseConfig:
     def __init__(self, db_path='pomodoro.db'):
+        # Nothing touches the file until the first connection
         self.db_path = db_path
-        self.ensure_db_exists()
     
     def ensure_db_exists(self):
-        """Ensure the database file exists and create it if it doesn't"""
-        if not os.path.exists(self.db_path):
-            self.init_database()
+        """Create or upgrade the schema unless it is current; once per process"""
+        startup.ensure_schema(self.db_path, self.create_schema, stamp=False)
     
     @contextmanager
     def get_connection(self):
         """Context manager for database connections"""
-        conn = sqlite3.connect(self.db_path)
+        self.ensure_db_exists()
+        conn = metrics.connect(self.db_path)
         conn.row_factory = sqlite3.Row
         try:
             yield conn
@@ -31,71 +41,82 @@ class DatabaseConfig:
     
     def init_database(self):
         """Initialize the database with all required tables"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Enable foreign key constraints
-            cursor.execute('PRAGMA foreign_keys = ON')
-            
-            # Users table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    email TEXT UNIQUE NOT NULL,
-                    password_hash TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Timer sessions table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS timer_sessions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    session_type TEXT NOT NULL CHECK(session_type IN ('work', 'break')),
-                    duration INTEGER NOT NULL CHECK(duration > 0),
-                    completed BOOLEAN DEFAULT FALSE,
-                    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    completed_at TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-                )
-            ''')
-            
-            # Timetables table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS timetables (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    title TEXT NOT NULL,
-                    description TEXT,
-                    date DATE NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-                )
-            ''')
-            
-            # Timetable entries table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS timetable_entries (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timetable_id INTEGER NOT NULL,
-                    start_time TIME NOT NULL,
-                    end_time TIME NOT NULL,
-                    subject TEXT NOT NULL,
-                    is_break BOOLEAN DEFAULT FALSE,
-                    FOREIGN KEY (timetable_id) REFERENCES timetables (id) ON DELETE CASCADE
-                )
-            ''')
-            
-            # Create indexes for better performance
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_timer_sessions_user_id ON timer_sessions(user_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_timer_sessions_started_at ON timer_sessions(started_at)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_timetables_user_id ON timetables(user_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_timetables_date ON timetables(date)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_timetable_entries_timetable_id ON timetable_entries(timetable_id)')
-            
-            conn.commit()
+        startup.init_schema(self.db_path, self.create_schema, stamp=False)
+    
+    def create_schema(self, conn):
+        cursor = conn.cursor()
+        
+        # Enable foreign key constraints
+        cursor.execute('PRAGMA foreign_keys = ON')
+        
+        # Users table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                email TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                timezone TEXT NOT NULL DEFAULT 'UTC'
+            )
+        ''')
+        
+        # Timer sessions table
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS timer_sessions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                session_type TEXT NOT NULL CHECK(session_type IN ('work', 'break')),
+                duration INTEGER NOT NULL CHECK(duration > 0),
+                completed BOOLEAN DEFAULT FALSE,
+                started_at INTEGER DEFAULT {timestamps.SQL_NOW_MS},
+                completed_at INTEGER,
+                FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+            )
+        ''')
+        
+        # Timetables table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS timetables (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                title TEXT NOT NULL,
+                description TEXT,
+                date DATE NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+            )
+        ''')
+        
+        # Timetable entries table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS timetable_entries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timetable_id INTEGER NOT NULL,
+                start_time TIME NOT NULL,
+                end_time TIME NOT NULL,
+                subject TEXT NOT NULL,
+                is_break BOOLEAN DEFAULT FALSE,
+                FOREIGN KEY (timetable_id) REFERENCES timetables (id) ON DELETE CASCADE
+            )
+        ''')
+        
+        # Create indexes for better performance
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_timer_sessions_user_id ON timer_sessions(user_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_timer_sessions_started_at ON timer_sessions(started_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_timer_sessions_user_started ON timer_sessions(user_id, started_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_timetables_user_id ON timetables(user_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_timetables_date ON timetables(date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_timetable_entries_timetable_id ON timetable_entries(timetable_id)')
+        
+        # Rollups and catalog for archived sessions
+        archive.init_archive_schema(conn)
+        timestamps.init_timestamp_schema(conn)
+        timetable_cache.init_timetable_summary_schema(conn)
+        analytics.init_analytics_schema(conn)
+        sharding.init_directory_schema(conn)
+        idempotency.init_idempotency_schema(conn)
+        purge.init_cascade_schema(conn)
     
     def get_db_info(self):
         """Get database information for debugging"""
@@ -119,21 +140,48 @@ class DatabaseConfig:
                 'row_counts': table_info
             }
     
-    def reset_database(self):
-        """Reset the database by dropping all tables and recreating them"""
+    def reset_database(self, backup_first=True):
+        """Reset the database by dropping all tables and recreating them.
+
+        Unless ``backup_first`` is false a backup is taken first (see
+        backup.py); returns its path, or None.
+        """
+        previous = None
+        if backup_first and os.path.exists(self.db_path):
+            previous = backup.create(self.db_path, keep=None)['path']
+        
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
-            # Drop all tables
+            # Drop all tables, archive partitions before their catalog
+            partitions = cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'timer\\_sessions\\_archive\\_%' ESCAPE '\\'"
+            ).fetchall()
+            for (partition,) in partitions:
+                cursor.execute(f"DROP TABLE IF EXISTS {partition}")
+            cursor.execute("DROP TABLE IF EXISTS idempotency_keys")
             cursor.execute("DROP TABLE IF EXISTS timetable_entries")
             cursor.execute("DROP TABLE IF EXISTS timetables") 
             cursor.execute("DROP TABLE IF EXISTS timer_sessions")
             cursor.execute("DROP TABLE IF EXISTS users")
+            cursor.execute("DROP TABLE IF EXISTS session_rollups")
+            cursor.execute("DROP TABLE IF EXISTS session_archive_partitions")
+            cursor.execute("DROP TABLE IF EXISTS timetable_list_versions")
+            cursor.execute("DROP TABLE IF EXISTS focus_daily")
+            cursor.execute("DROP TABLE IF EXISTS focus_hourly")
+            cursor.execute("DROP TABLE IF EXISTS user_shards")
+            cursor.execute("DROP TABLE IF EXISTS user_shards_version")
+            
+            # Make the app re-run its full schema too
+            cursor.execute("PRAGMA user_version = 0")
             
             conn.commit()
+        timetable_cache.cache.clear()
+        startup.forget(self.db_path)
         
         # Reinitialize
         self.init_database()
+        return previous
 
 # Global database instance
 db_config = DatabaseConfig()
\ No newline at end of file
@@ -0,0 +1,251 @@
+"""
+Idempotency keys for PomodoroFlow write endpoints
+
+A client that sends ``Idempotency-Key: <unique value>`` with a write request
+can safely retry it: the first response is stored and every retry with the
+same key gets that response back without the write running again. Keys are
+scoped to the logged-in user and expire after IDEMPOTENCY_TTL seconds.
+
+Responses live in a small in-process LRU in front of the
+``idempotency_keys`` table, so a retry that lands on another worker process
+is still deduplicated. A key is claimed (a row with no response yet) before
+the write runs; a concurrent retry with the same key gets 409 until the
+first request finishes.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, jsonify, request, session
+
+import metrics
+
+HEADER = 'Idempotency-Key'
+REPLAY_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_CACHE_SIZE = 10000
+
+# A claim older than this belongs to a request that died; it may be taken over
+DEFAULT_LOCK_SECONDS = 30
+
+# Expired rows are swept at most this often per process
+SWEEP_INTERVAL_SECONDS = 60
+
+
+def init_idempotency_schema(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS idempotency_keys (
+        user_id INTEGER NOT NULL,
+        key TEXT NOT NULL,
+        fingerprint BLOB NOT NULL, -- digest of method, path and body
+        status INTEGER, -- NULL while the first request is running
+        body BLOB,
+        mimetype TEXT,
+        created_at REAL NOT NULL, -- unix seconds
+        PRIMARY KEY (user_id, key)
+    ) WITHOUT ROWID''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created
+                    ON idempotency_keys(created_at)''')
+
+
+def request_fingerprint():
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(b'\0')
+    digest.update(request.path.encode())
+    digest.update(b'\0')
+    digest.update(request.get_data())
+    return digest.digest()
+
+
+class StoredResponse:
+    __slots__ = ('fingerprint', 'status', 'body', 'mimetype', 'created_at')
+
+    def __init__(self, fingerprint, status, body, mimetype, created_at):
+        self.fingerprint = fingerprint
+        self.status = status
+        self.body = body
+        self.mimetype = mimetype
+        self.created_at = created_at
+
+
+class IdempotencyStore:
+    """Completed responses by (user_id, key): an LRU backed by SQLite"""
+
+    def __init__(self, db_path=None, ttl=DEFAULT_TTL_SECONDS, cache_size=DEFAULT_CACHE_SIZE,
+                 lock_seconds=DEFAULT_LOCK_SECONDS):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.lock_seconds = lock_seconds
+        self.cache_size = cache_size
+        self.hits = 0
+        self.replays = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    def _connect(self):
+        return metrics.connect(self.db_path or current_app.config['DATABASE'], timeout=5)
+
+    def _remember(self, scope, stored):
+        with self._lock:
+            self._entries[scope] = stored
+            self._entries.move_to_end(scope)
+            while len(self._entries) > self.cache_size:
+                self._entries.popitem(last=False)
+
+    def _cached(self, scope, now):
+        with self._lock:
+            stored = self._entries.get(scope)
+            if stored is None:
+                return None
+            if now - stored.created_at >= self.ttl:
+                del self._entries[scope]
+                return None
+            self._entries.move_to_end(scope)
+            self.hits += 1
+            return stored
+
+    def claim(self, scope, fingerprint):
+        """Claim ``scope`` for a new request.
+
+        Returns None when the caller should run the write, or the existing
+        StoredResponse (status None while that request is still running).
+        """
+        now = time.time()
+        stored = self._cached(scope, now)
+        if stored is not None:
+            return stored
+
+        user_id, key = scope
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                '''SELECT fingerprint, status, body, mimetype, created_at
+                   FROM idempotency_keys WHERE user_id = ? AND key = ?''',
+                (user_id, key)
+            ).fetchone()
+
+            if row is not None:
+                stored = StoredResponse(*row)
+                expired = now - stored.created_at >= self.ttl
+                abandoned = stored.status is None and now - stored.created_at >= self.lock_seconds
+                if not (expired or abandoned):
+                    conn.rollback()
+                    if stored.status is not None:
+                        self._remember(scope, stored)
+                    return stored
+
+            conn.execute(
+                '''INSERT OR REPLACE INTO idempotency_keys
+                   (user_id, key, fingerprint, status, body, mimetype, created_at)
+                   VALUES (?, ?, ?, NULL, NULL, NULL, ?)''',
+                (user_id, key, fingerprint, now)
+            )
+            conn.commit()
+            return None
+        finally:
+            conn.close()
+            self._maybe_sweep(now)
+
+    def complete(self, scope, fingerprint, response):
+        """Store the response for a claimed key, or release it on server errors"""
+        user_id, key = scope
+        conn = self._connect()
+        try:
+            if response.status_code >= 500:
+                # Let the client retry a failed write for real
+                conn.execute(
+                    'DELETE FROM idempotency_keys WHERE user_id = ? AND key = ? AND status IS NULL',
+                    (user_id, key)
+                )
+                conn.commit()
+                return
+
+            stored = StoredResponse(
+                fingerprint, response.status_code, response.get_data(), response.mimetype, time.time()
+            )
+            conn.execute(
+                '''UPDATE idempotency_keys SET status = ?, body = ?, mimetype = ?, created_at = ?
+                   WHERE user_id = ? AND key = ?''',
+                (stored.status, stored.body, stored.mimetype, stored.created_at, user_id, key)
+            )
+            conn.commit()
+            self._remember(scope, stored)
+        finally:
+            conn.close()
+
+    def _maybe_sweep(self, now):
+        if now - self._last_sweep < SWEEP_INTERVAL_SECONDS:
+            return
+        self._last_sweep = now
+        conn = self._connect()
+        try:
+            conn.execute('DELETE FROM idempotency_keys WHERE created_at < ?', (now - self.ttl,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _replay(stored):
+    response = current_app.response_class(stored.body, status=stored.status, mimetype=stored.mimetype)
+    response.headers[REPLAY_HEADER] = 'true'
+    return response
+
+
+def idempotent(view):
+    """Deduplicate retries of a write view by its Idempotency-Key header.
+
+    Place below ``login_required``: keys are scoped to the session user.
+    Requests without the header run as before.
+    """
+    @wraps(view)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view(*args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{HEADER} must be 1-{MAX_KEY_LENGTH} characters'}), 400
+
+        store = current_app.extensions['idempotency']
+        scope = (session['user_id'], key)
+        fingerprint = request_fingerprint()
+
+        stored = store.claim(scope, fingerprint)
+        if stored is not None:
+            if stored.fingerprint != fingerprint:
+                return jsonify({'error': f'{HEADER} was already used for a different request'}), 422
+            if stored.status is None:
+                return jsonify({'error': 'A request with this Idempotency-Key is still in progress'}), 409
+            store.replays += 1
+            return _replay(stored)
+
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except Exception:
+            store.complete(scope, fingerprint, current_app.response_class(status=500))
+            raise
+        store.complete(scope, fingerprint, response)
+        return response
+
+    return decorated_function
+
+
+def init_app(app):
+    app.config.setdefault('IDEMPOTENCY_TTL', DEFAULT_TTL_SECONDS)
+    app.config.setdefault('IDEMPOTENCY_CACHE_SIZE', DEFAULT_CACHE_SIZE)
+    store = IdempotencyStore(
+        ttl=app.config['IDEMPOTENCY_TTL'],
+        cache_size=app.config['IDEMPOTENCY_CACHE_SIZE'],
+    )
+    app.extensions['idempotency'] = store
+    return store
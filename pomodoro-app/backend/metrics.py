@@ -0,0 +1,381 @@
+"""
+Request and database instrumentation for PomodoroFlow API
+
+- Per-endpoint request latency histograms, recorded by before/after request hooks
+- Per-query timing, row counts and SQL fingerprints, captured by a sqlite3
+  connection factory (use ``metrics.connect`` instead of ``sqlite3.connect``)
+- Named phases (password hashing, serialization, ...) timed with ``timing()``
+- A Server-Timing header on every response and Prometheus text output
+"""
+
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from flask import g, has_request_context, request
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Called with every finished QueryRecord, e.g. by the slow query log
+query_listeners = []
+
+
+class Histogram:
+    """Cumulative histogram with fixed upper bounds, Prometheus style"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket containing it"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return bound
+        return float('inf')
+
+
+class Registry:
+    """Thread-safe store for all collected metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = {}  # (endpoint, method, status) -> Histogram
+            self.queries = {}  # fingerprint -> Histogram
+            self.query_rows = {}  # fingerprint -> rows returned or changed
+            self.phases = {}  # phase -> (seconds, count)
+            self.gauges = {}  # name -> (help text, callable returning {labels: value})
+
+    def observe_request(self, endpoint, method, status, seconds):
+        key = (endpoint, method, status)
+        with self._lock:
+            histogram = self.requests.get(key)
+            if histogram is None:
+                histogram = self.requests[key] = Histogram()
+            histogram.observe(seconds)
+
+    def observe_query(self, fingerprint, seconds, rows):
+        with self._lock:
+            histogram = self.queries.get(fingerprint)
+            if histogram is None:
+                histogram = self.queries[fingerprint] = Histogram()
+            histogram.observe(seconds)
+            self.query_rows[fingerprint] = self.query_rows.get(fingerprint, 0) + rows
+
+    def observe_phase(self, phase, seconds):
+        with self._lock:
+            total, count = self.phases.get(phase, (0.0, 0))
+            self.phases[phase] = (total + seconds, count + 1)
+
+    def register_gauge(self, name, help_text, collect):
+        """Expose the result of ``collect()`` ({labels tuple: value}) as a gauge"""
+        with self._lock:
+            self.gauges[name] = (help_text, collect)
+
+    def render_prometheus(self):
+        with self._lock:
+            requests = {key: _copy_histogram(h) for key, h in self.requests.items()}
+            queries = {key: _copy_histogram(h) for key, h in self.queries.items()}
+            query_rows = dict(self.query_rows)
+            phases = dict(self.phases)
+            gauges = dict(self.gauges)
+
+        lines = []
+        _render_histograms(
+            lines, 'pomodoro_request_duration_seconds', 'Request latency by endpoint',
+            ('endpoint', 'method', 'status'), requests
+        )
+        _render_histograms(
+            lines, 'pomodoro_db_query_duration_seconds', 'SQLite query time by SQL fingerprint',
+            ('fingerprint',), {(fingerprint,): h for fingerprint, h in queries.items()}
+        )
+
+        lines.append('# HELP pomodoro_db_query_rows_total Rows returned or changed by SQL fingerprint')
+        lines.append('# TYPE pomodoro_db_query_rows_total counter')
+        for fingerprint, rows in sorted(query_rows.items()):
+            lines.append(f'pomodoro_db_query_rows_total{_labels(("fingerprint",), (fingerprint,))} {rows}')
+
+        lines.append('# HELP pomodoro_phase_seconds_total Time spent in named request phases')
+        lines.append('# TYPE pomodoro_phase_seconds_total counter')
+        for phase, (seconds, _) in sorted(phases.items()):
+            lines.append(f'pomodoro_phase_seconds_total{_labels(("phase",), (phase,))} {seconds:.6f}')
+        lines.append('# HELP pomodoro_phase_calls_total Number of timed request phases')
+        lines.append('# TYPE pomodoro_phase_calls_total counter')
+        for phase, (_, count) in sorted(phases.items()):
+            lines.append(f'pomodoro_phase_calls_total{_labels(("phase",), (phase,))} {count}')
+
+        for name, (help_text, collect) in sorted(gauges.items()):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            for labels, value in sorted(collect().items()):
+                names = tuple(label for label, _ in labels)
+                values = tuple(value for _, value in labels)
+                lines.append(f'{name}{_labels(names, values)} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _copy_histogram(histogram):
+    copy = Histogram(histogram.buckets)
+    copy.counts = list(histogram.counts)
+    copy.sum = histogram.sum
+    copy.count = histogram.count
+    return copy
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _render_histograms(lines, name, help_text, label_names, histograms):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} histogram')
+    for labels, histogram in sorted(histograms.items()):
+        for bound, total in histogram.cumulative():
+            bucket_labels = _labels(label_names + ('le',), labels + (repr(bound),))
+            lines.append(f'{name}_bucket{bucket_labels} {total}')
+        inf_labels = _labels(label_names + ('le',), labels + ('+Inf',))
+        lines.append(f'{name}_bucket{inf_labels} {histogram.count}')
+        lines.append(f'{name}_sum{_labels(label_names, labels)} {histogram.sum:.6f}')
+        lines.append(f'{name}_count{_labels(label_names, labels)} {histogram.count}')
+
+
+registry = Registry()
+
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(sql):
+    """Normalize SQL so queries differing only in literals group together"""
+    sql = re.sub(r'--[^\n]*', ' ', sql)
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _PLACEHOLDER_LIST.sub('(?)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+class QueryRecord:
+    """Timing for one statement, including the time spent fetching its rows"""
+
+    __slots__ = ('sql', 'params', 'seconds', 'rows', 'db_path', 'attached', 'done')
+
+    def __init__(self, sql, params, db_path, attached=()):
+        self.sql = sql
+        self.params = params
+        self.seconds = 0.0
+        self.rows = 0
+        self.db_path = db_path
+        self.attached = attached
+        self.done = False
+
+    @property
+    def fingerprint(self):
+        return fingerprint(self.sql)
+
+
+def _finish(record):
+    if record.done:
+        return
+    record.done = True
+    registry.observe_query(record.fingerprint, record.seconds, record.rows)
+    if has_request_context():
+        stats = g.get('_request_timing')
+        if stats is not None:
+            stats['db'] += record.seconds
+            stats['db_queries'] += 1
+    for listener in query_listeners:
+        listener(record)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times statements and counts the rows they produce"""
+
+    _record = None
+
+    def _start(self, sql, params):
+        if self._record is not None:
+            _finish(self._record)
+        record = self._record = QueryRecord(sql, params, self.connection.db_path, self.connection.attached)
+        pending = self.connection._pending
+        if len(pending) >= 64:
+            pending[:] = [r for r in pending if not r.done]
+        pending.append(record)
+        return record
+
+    def execute(self, sql, parameters=()):
+        record = self._start(sql, parameters)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record.seconds += time.perf_counter() - start
+            if self.rowcount > 0:
+                record.rows += self.rowcount
+
+    def executemany(self, sql, seq_of_parameters):
+        record = self._start(sql, None)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record.seconds += time.perf_counter() - start
+            if self.rowcount > 0:
+                record.rows += self.rowcount
+            _finish(record)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        record = self._record
+        if record is not None:
+            record.seconds += time.perf_counter() - start
+            if row is None:
+                _finish(record)
+            else:
+                record.rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        record = self._record
+        if record is not None:
+            record.seconds += time.perf_counter() - start
+            record.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        record = self._record
+        if record is not None:
+            record.seconds += time.perf_counter() - start
+            record.rows += len(rows)
+            _finish(record)
+        return rows
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors report to the metrics registry"""
+
+    def __init__(self, database, *args, **kwargs):
+        super().__init__(database, *args, **kwargs)
+        self.db_path = database
+        # (schema, path) pairs attached for the connection's whole life,
+        # so tools like the slow query log can rebuild the same view
+        self.attached = ()
+        self._pending = []
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # The C implementations of these shortcuts don't go through cursor()
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def flush_metrics(self):
+        pending, self._pending = self._pending, []
+        for record in pending:
+            _finish(record)
+
+    def close(self):
+        self.flush_metrics()
+        super().close()
+
+
+def connect(db_path, **kwargs):
+    """sqlite3.connect with query instrumentation and foreign keys enforced"""
+    conn = sqlite3.connect(db_path, factory=InstrumentedConnection, **kwargs)
+    # Off by default in SQLite and scoped to the connection, so set it on every
+    # one; the base class execute keeps it out of the query metrics
+    sqlite3.Connection.execute(conn, 'PRAGMA foreign_keys = ON')
+    return conn
+
+
+@contextmanager
+def timing(phase):
+    """Time a block as a named phase of the current request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        registry.observe_phase(phase, elapsed)
+        if has_request_context():
+            stats = g.get('_request_timing')
+            if stats is not None:
+                stats[phase] = stats.get(phase, 0.0) + elapsed
+
+
+def _before_request():
+    g._request_start = time.perf_counter()
+    g._request_timing = {'db': 0.0, 'db_queries': 0}
+
+
+def _after_request(response):
+    start = g.pop('_request_start', None)
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    stats = g.pop('_request_timing')
+
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    registry.observe_request(endpoint, request.method, response.status_code, elapsed)
+
+    entries = [f'db;dur={stats.pop("db") * 1000:.2f};desc="{stats.pop("db_queries")} queries"']
+    entries.extend(f'{phase};dur={seconds * 1000:.2f}' for phase, seconds in stats.items())
+    entries.append(f'total;dur={elapsed * 1000:.2f}')
+    response.headers.add('Server-Timing', ', '.join(entries))
+    return response
+
+
+def init_app(app):
+    """Register the timing hooks. Call before other extensions add after_request
+    hooks so that their work is included in the measured latency."""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+
+def render_prometheus():
+    return registry.render_prometheus()
@@ -3,21 +3,33 @@ Database Models for PomodoroFlow Application
 """
 
 import sqlite3
-from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
+import analytics
+import archive
+import idempotency
+import metrics
+import purge
+import sharding
+import startup
+import timestamps
+import timetable_cache
+from records import UserRecord, SessionRecord, TimetableRecord, TimetableSummaryRecord, EntryRecord
 
 class Database:
     def __init__(self, db_path='pomodoro.db'):
+        # Nothing touches the file until the first connection
         self.db_path = db_path
-        self.init_db()
     
     def get_connection(self):
-        conn = sqlite3.connect(self.db_path)
+        startup.ensure_schema(self.db_path, self.create_schema, stamp=False)
+        conn = metrics.connect(self.db_path)
         conn.row_factory = sqlite3.Row
         return conn
     
     def init_db(self):
-        conn = self.get_connection()
+        startup.init_schema(self.db_path, self.create_schema, stamp=False)
+    
+    def create_schema(self, conn):
         c = conn.cursor()
         
         # Users table
@@ -26,18 +38,19 @@ class Database:
             username TEXT UNIQUE NOT NULL,
             email TEXT UNIQUE NOT NULL,
             password_hash TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            timezone TEXT NOT NULL DEFAULT 'UTC'
         )''')
         
         # Timer sessions table
-        c.execute('''CREATE TABLE IF NOT EXISTS timer_sessions (
+        c.execute(f'''CREATE TABLE IF NOT EXISTS timer_sessions (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
             session_type TEXT NOT NULL,
             duration INTEGER NOT NULL,
             completed BOOLEAN DEFAULT FALSE,
-            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            completed_at TIMESTAMP,
+            started_at INTEGER DEFAULT {timestamps.SQL_NOW_MS},
+            completed_at INTEGER,
             FOREIGN KEY (user_id) REFERENCES users (id)
         )''')
         
@@ -63,36 +76,63 @@ class Database:
             FOREIGN KEY (timetable_id) REFERENCES timetables (id)
         )''')
         
-        conn.commit()
-        conn.close()
+        c.execute('''CREATE INDEX IF NOT EXISTS idx_timer_sessions_user_started
+                     ON timer_sessions(user_id, started_at)''')
+        
+        archive.init_archive_schema(conn)
+        timestamps.init_timestamp_schema(conn)
+        timetable_cache.init_timetable_summary_schema(conn)
+        analytics.init_analytics_schema(conn)
+        sharding.init_directory_schema(conn)
+        idempotency.init_idempotency_schema(conn)
+        purge.init_cascade_schema(conn)
 
 class User:
     def __init__(self, db):
         self.db = db
     
-    def create(self, username, email, password):
+    def create(self, username, email, password, timezone=timestamps.DEFAULT_TIMEZONE):
         conn = self.db.get_connection()
         try:
-            password_hash = generate_password_hash(password)
+            with metrics.timing('hash'):
+                password_hash = generate_password_hash(password)
             cursor = conn.execute(
-                'INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
-                (username, email, password_hash)
+                'INSERT INTO users (username, email, password_hash, timezone) VALUES (?, ?, ?, ?)',
+                (username, email, password_hash, timezone)
             )
             conn.commit()
             return cursor.lastrowid
         finally:
             conn.close()
     
+    def set_timezone(self, user_id, timezone):
+        """Change the user's time zone and rebucket their analytics; False if unchanged"""
+        conn = self.db.get_connection()
+        try:
+            updated = conn.execute(
+                'UPDATE users SET timezone = ? WHERE id = ? AND timezone != ?',
+                (timezone, user_id, timezone)
+            ).rowcount
+            if updated:
+                analytics.backfill(conn, user_id)
+            conn.commit()
+            return bool(updated)
+        finally:
+            conn.close()
+    
     def authenticate(self, username, password):
         conn = self.db.get_connection()
         try:
             user = conn.execute(
-                'SELECT * FROM users WHERE username = ?',
+                f'SELECT password_hash, {UserRecord.select_columns()} FROM users WHERE username = ?',
                 (username,)
             ).fetchone()
             
-            if user and check_password_hash(user['password_hash'], password):
-                return dict(user)
+            with metrics.timing('hash'):
+                valid = user is not None and check_password_hash(user[0], password)
+            
+            if valid:
+                return UserRecord(*user[1:])
             return None
         finally:
             conn.close()
@@ -101,10 +141,10 @@ class User:
         conn = self.db.get_connection()
         try:
             user = conn.execute(
-                'SELECT id, username, email, created_at FROM users WHERE id = ?',
+                f'SELECT {UserRecord.select_columns()} FROM users WHERE id = ?',
                 (user_id,)
             ).fetchone()
-            return dict(user) if user else None
+            return UserRecord.from_row(user) if user else None
         finally:
             conn.close()
     
@@ -138,14 +178,16 @@ class TimerSession:
         self.db = db
     
     def create(self, user_id, session_type, duration):
+        started_at = timestamps.now_ms()
         conn = self.db.get_connection()
         try:
             cursor = conn.execute(
                 '''INSERT INTO timer_sessions 
                    (user_id, session_type, duration, started_at) 
                    VALUES (?, ?, ?, ?)''',
-                (user_id, session_type, duration, datetime.now())
+                (user_id, session_type, duration, started_at)
             )
+            analytics.record_start(conn, user_id, started_at, timestamps.user_timezone(conn, user_id))
             conn.commit()
             return cursor.lastrowid
         finally:
@@ -154,12 +196,15 @@ class TimerSession:
     def complete(self, session_id, user_id):
         conn = self.db.get_connection()
         try:
-            conn.execute(
+            completed = conn.execute(
                 '''UPDATE timer_sessions 
                    SET completed = TRUE, completed_at = ? 
-                   WHERE id = ? AND user_id = ?''',
-                (datetime.now(), session_id, user_id)
-            )
+                   WHERE id = ? AND user_id = ? AND NOT completed
+                   RETURNING started_at, session_type, duration''',
+                (timestamps.now_ms(), session_id, user_id)
+            ).fetchone()
+            if completed:
+                analytics.record_completion(conn, user_id, timestamps.user_timezone(conn, user_id), *completed)
             conn.commit()
             return True
         finally:
@@ -169,13 +214,13 @@ class TimerSession:
         conn = self.db.get_connection()
         try:
             sessions = conn.execute(
-                '''SELECT * FROM timer_sessions 
+                f'''SELECT {SessionRecord.select_columns()} FROM timer_sessions 
                    WHERE user_id = ? 
                    ORDER BY started_at DESC 
                    LIMIT ?''',
                 (user_id, limit)
             ).fetchall()
-            return [dict(session) for session in sessions]
+            return [SessionRecord.from_row(session) for session in sessions]
         finally:
             conn.close()
     
@@ -195,13 +240,17 @@ class TimerSession:
                 (user_id,)
             ).fetchone()['total'] or 0
             
-            # Sessions this week
-            from datetime import timedelta
-            week_ago = datetime.now() - timedelta(days=7)
+            # Archived sessions only survive as rollups
+            archived_sessions, archived_time = archive.rollup_totals(conn, user_id)
+            total_sessions += archived_sessions
+            total_time += archived_time
+            
+            # Sessions in the last seven days of the user's calendar
+            week_start = timestamps.week_start_ms(timestamps.user_timezone(conn, user_id))
             weekly_sessions = conn.execute(
                 '''SELECT COUNT(*) as count FROM timer_sessions 
-                   WHERE user_id = ? AND completed = TRUE AND started_at > ?''',
-                (user_id, week_ago)
+                   WHERE user_id = ? AND completed = TRUE AND started_at >= ?''',
+                (user_id, week_start)
             ).fetchone()['count']
             
             return {
@@ -225,6 +274,7 @@ class Timetable:
                 (user_id, title, description, date)
             )
             conn.commit()
+            timetable_cache.cache.invalidate(self.db.db_path, user_id)
             return cursor.lastrowid
         finally:
             conn.close()
@@ -246,16 +296,16 @@ class Timetable:
     def get_user_timetables(self, user_id):
         conn = self.db.get_connection()
         try:
-            timetables = conn.execute(
-                '''SELECT t.*, COUNT(te.id) as entry_count
-                   FROM timetables t 
-                   LEFT JOIN timetable_entries te ON t.id = te.timetable_id
-                   WHERE t.user_id = ? 
-                   GROUP BY t.id
-                   ORDER BY t.date DESC''',
-                (user_id,)
-            ).fetchall()
-            return [dict(timetable) for timetable in timetables]
+            def load():
+                timetables = conn.execute(
+                    f'''SELECT {TimetableSummaryRecord.select_columns()} FROM timetables 
+                       WHERE user_id = ? 
+                       ORDER BY date DESC''',
+                    (user_id,)
+                ).fetchall()
+                return [TimetableSummaryRecord.from_row(timetable) for timetable in timetables]
+            
+            return list(timetable_cache.cached_list(conn, self.db.db_path, user_id, 'records', load))
         finally:
             conn.close()
     
@@ -264,7 +314,7 @@ class Timetable:
         try:
             # Get timetable
             timetable = conn.execute(
-                'SELECT * FROM timetables WHERE id = ? AND user_id = ?',
+                f'SELECT {TimetableRecord.select_columns()} FROM timetables WHERE id = ? AND user_id = ?',
                 (timetable_id, user_id)
             ).fetchone()
             
@@ -273,15 +323,15 @@ class Timetable:
             
             # Get entries
             entries = conn.execute(
-                '''SELECT * FROM timetable_entries 
+                f'''SELECT {EntryRecord.select_columns()} FROM timetable_entries 
                    WHERE timetable_id = ? 
                    ORDER BY start_time''',
                 (timetable_id,)
             ).fetchall()
             
             return {
-                'timetable': dict(timetable),
-                'entries': [dict(entry) for entry in entries]
+                'timetable': TimetableRecord.from_row(timetable),
+                'entries': [EntryRecord.from_row(entry) for entry in entries]
             }
         finally:
             conn.close()
@@ -289,19 +339,14 @@ class Timetable:
     def delete(self, timetable_id, user_id):
         conn = self.db.get_connection()
         try:
-            # Delete entries first
-            conn.execute(
-                'DELETE FROM timetable_entries WHERE timetable_id = ?',
-                (timetable_id,)
-            )
-            
-            # Delete timetable
+            # Entries go with it via the cascade trigger
             conn.execute(
                 'DELETE FROM timetables WHERE id = ? AND user_id = ?',
                 (timetable_id, user_id)
             )
             
             conn.commit()
+            timetable_cache.cache.invalidate(self.db.db_path, user_id)
             return True
         finally:
             conn.close()
\ No newline at end of file
@@ -0,0 +1,248 @@
+"""
+Opt-in request profiler for PomodoroFlow API
+
+When PROFILING_ENABLED is set, a fraction of requests (PROFILE_SAMPLE_RATE)
+are profiled, plus requests carrying the ``X-Profile: 1`` header that pass
+the app's admin check (a valid X-Admin-Token), so anonymous clients cannot
+make the server profile every request:
+
+- ``sample`` mode (default): a background thread snapshots the stacks of the
+  threads serving profiled requests every PROFILE_INTERVAL_MS and aggregates
+  them per endpoint as folded stacks, ready for flamegraph.pl / speedscope.
+- ``cprofile`` mode: each profiled request runs under cProfile and the
+  function statistics are merged per endpoint.
+
+With profiling disabled no hooks are registered, so requests pay nothing.
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+
+DEFAULT_INTERVAL_MS = 5
+DEFAULT_HEADER = 'X-Profile'
+MAX_STACKS_PER_ENDPOINT = 5000
+MAX_STACK_DEPTH = 128
+
+
+def _frame_label(code):
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+def folded_stack(frame):
+    """Render a frame and its callers as 'root;...;leaf'"""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class StackSampler:
+    """Samples the stacks of registered threads from a background thread"""
+
+    def __init__(self, interval_ms=DEFAULT_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.stacks = {}  # endpoint -> Counter of folded stacks
+        self.samples = Counter()  # endpoint -> sample count
+        self.requests = Counter()  # endpoint -> profiled requests
+        self._active = {}  # thread ident -> endpoint
+        self._lock = threading.Lock()
+        self._busy = threading.Event()
+        self._thread = None
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name='pomodoro-profiler', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            # Sleep until there is something to sample
+            self._busy.wait()
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                active = dict(self._active)
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, endpoint in active.items():
+                    if ident == own or ident not in frames:
+                        continue
+                    stacks = self.stacks.setdefault(endpoint, Counter())
+                    stack = folded_stack(frames[ident])
+                    if stack not in stacks and len(stacks) >= MAX_STACKS_PER_ENDPOINT:
+                        stack = '[truncated]'
+                    stacks[stack] += 1
+                    self.samples[endpoint] += 1
+            del frames
+
+    def start(self, endpoint):
+        with self._lock:
+            self._active[threading.get_ident()] = endpoint
+            self.requests[endpoint] += 1
+            self._busy.set()
+        self._ensure_thread()
+
+    def stop(self):
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+            if not self._active:
+                self._busy.clear()
+
+    def folded(self, endpoint=None):
+        with self._lock:
+            endpoints = [endpoint] if endpoint else sorted(self.stacks)
+            lines = []
+            for name in endpoints:
+                for stack, count in self.stacks.get(name, Counter()).most_common():
+                    lines.append(f'{name};{stack} {count}' if endpoint is None else f'{stack} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        with self._lock:
+            return {
+                endpoint: {
+                    'requests': self.requests[endpoint],
+                    'samples': self.samples[endpoint],
+                    'distinct_stacks': len(self.stacks.get(endpoint, ())),
+                }
+                for endpoint in sorted(self.requests)
+            }
+
+    def clear(self):
+        with self._lock:
+            self.stacks.clear()
+            self.samples.clear()
+            self.requests.clear()
+
+
+class CProfileAggregator:
+    """Runs profiled requests under cProfile and merges stats per endpoint"""
+
+    def __init__(self):
+        self.stats = {}  # endpoint -> pstats.Stats
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        # cProfile can't reliably run in several threads at once, so
+        # concurrent requests past the first simply go unprofiled
+        self._running = threading.Lock()
+
+    def start(self, endpoint):
+        if not self._running.acquire(blocking=False):
+            return
+        # Imported here so processes that never profile don't load them
+        import cProfile
+        profile = cProfile.Profile()
+        g._profile = (endpoint, profile)
+        profile.enable()
+
+    def stop(self):
+        endpoint, profile = g.pop('_profile', (None, None))
+        if profile is None:
+            return
+        profile.disable()
+        self._running.release()
+        with self._lock:
+            self.requests[endpoint] += 1
+            if endpoint in self.stats:
+                self.stats[endpoint].add(profile)
+            else:
+                import pstats
+                self.stats[endpoint] = pstats.Stats(profile)
+
+    def top(self, endpoint, limit=30):
+        with self._lock:
+            stats = self.stats.get(endpoint)
+            if stats is None:
+                return []
+            rows = []
+            for (filename, line, name), (_, calls, tottime, cumtime, _) in stats.stats.items():
+                rows.append({
+                    'function': f'{name} ({os.path.basename(filename)}:{line})',
+                    'calls': calls,
+                    'tottime_ms': round(tottime * 1000, 3),
+                    'cumtime_ms': round(cumtime * 1000, 3),
+                })
+        rows.sort(key=lambda row: row['cumtime_ms'], reverse=True)
+        return rows[:limit]
+
+    def summary(self):
+        with self._lock:
+            return {endpoint: {'requests': count} for endpoint, count in sorted(self.requests.items())}
+
+    def clear(self):
+        with self._lock:
+            self.stats.clear()
+            self.requests.clear()
+
+
+class RequestProfiler:
+    """Decides which requests to profile and hands them to the backend"""
+
+    def __init__(self, app):
+        self.sample_rate = app.config['PROFILE_SAMPLE_RATE']
+        self.header = app.config['PROFILE_HEADER']
+        self.mode = app.config['PROFILE_MODE']
+        # Set by the app: whether this request may force profiling by header
+        self.authorize = None
+        if self.mode == 'cprofile':
+            self.backend = CProfileAggregator()
+        else:
+            self.backend = StackSampler(app.config['PROFILE_INTERVAL_MS'])
+
+        app.before_request(self.before_request)
+        app.teardown_request(self.teardown_request)
+
+    def _wanted(self):
+        if request.headers.get(self.header) == '1' and self.authorize is not None and self.authorize():
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def before_request(self):
+        if not self._wanted():
+            return
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        g._profiling = True
+        self.backend.start(endpoint)
+
+    def teardown_request(self, exc):
+        if g.pop('_profiling', False):
+            self.backend.stop()
+
+    def report(self, endpoint=None, limit=30):
+        report = {'mode': self.mode, 'endpoints': self.backend.summary()}
+        if endpoint and self.mode == 'cprofile':
+            report['top'] = self.backend.top(endpoint, limit)
+        return report
+
+    def folded(self, endpoint=None):
+        """Folded stacks (sample mode only); prefixed by endpoint unless one is given"""
+        if self.mode == 'cprofile':
+            return None
+        return self.backend.folded(endpoint)
+
+
+def init_app(app):
+    """Enable request profiling if PROFILING_ENABLED is set; returns the profiler or None"""
+    app.config.setdefault('PROFILING_ENABLED', False)
+    app.config.setdefault('PROFILE_SAMPLE_RATE', 0.0)
+    app.config.setdefault('PROFILE_HEADER', DEFAULT_HEADER)
+    app.config.setdefault('PROFILE_MODE', 'sample')
+    app.config.setdefault('PROFILE_INTERVAL_MS', DEFAULT_INTERVAL_MS)
+
+    if not app.config['PROFILING_ENABLED']:
+        return None
+
+    profiler = RequestProfiler(app)
+    app.extensions['profiler'] = profiler
+    return profiler
@@ -0,0 +1,260 @@
+"""
+Bulk deletes for PomodoroFlow data
+
+Account deletion, "delete all my timetables" and "delete sessions older than
+X" run as set-based DELETEs in bounded chunks. Each chunk is its own short
+write transaction, with an optional pause in between, so a purge of a large
+history never holds the write lock for long and other requests keep going.
+
+Dependent rows are removed by the database: triggers cascade timetables to
+their entries and users to everything they own, archive partition tables
+included, so a single-row DELETE is always complete, whether or not the
+schema was created with ``ON DELETE CASCADE``. Partitions kept in separate
+files are out of a trigger's reach; ``delete_account`` purges those itself.
+"""
+
+import argparse
+import sqlite3
+import time
+
+import analytics
+import archive
+import timestamps
+import timetable_cache
+
+DEFAULT_CHUNK_SIZE = 500
+DEFAULT_PAUSE_MS = 5
+
+# Timetables cascade to their entries, so their chunks cover several times more rows
+TIMETABLE_CHUNK_DIVISOR = 10
+
+CASCADE_TRIGGERS = {
+    'timetables_cascade_delete': '''
+        AFTER DELETE ON timetables BEGIN
+            DELETE FROM timetable_entries WHERE timetable_id = OLD.id;
+        END''',
+    'users_cascade_delete': '''
+        AFTER DELETE ON users BEGIN
+            DELETE FROM timer_sessions WHERE user_id = OLD.id;
+            DELETE FROM timetables WHERE user_id = OLD.id;
+            DELETE FROM session_rollups WHERE user_id = OLD.id;
+            DELETE FROM timetable_list_versions WHERE user_id = OLD.id;
+            DELETE FROM focus_daily WHERE user_id = OLD.id;
+            DELETE FROM focus_hourly WHERE user_id = OLD.id;
+            DELETE FROM user_shards WHERE user_id = OLD.id;
+            DELETE FROM idempotency_keys WHERE user_id = OLD.id;{partitions}
+        END''',
+}
+
+# Shard files hold no users table, so only timetables cascade there
+SHARD_TRIGGERS = ('timetables_cascade_delete',)
+
+
+def init_cascade_schema(conn, names=None):
+    """(Re)create the cascade triggers (only ``names`` if given); call after every other schema init"""
+    partitions = ''.join(
+        f'\n            DELETE FROM {location} WHERE user_id = OLD.id;'
+        for _, storage, location, _ in archive.get_partitions(conn) if storage == 'table'
+    )
+    for name, body in CASCADE_TRIGGERS.items():
+        if names is not None and name not in names:
+            continue
+        # Recreated so databases pick up tables added to the cascade later;
+        # qualified so a shard never drops its attached directory's trigger
+        conn.execute(f'DROP TRIGGER IF EXISTS main.{name}')
+        conn.execute(f'CREATE TRIGGER {name} {body.format(partitions=partitions)}')
+
+
+def refresh_user_cascade(conn):
+    """Recreate the users trigger after an archive partition table is added.
+
+    A no-op on shards, which have no users table of their own.
+    """
+    has_users = conn.execute(
+        "SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = 'users'"
+    ).fetchone()
+    if has_users:
+        init_cascade_schema(conn, ('users_cascade_delete',))
+
+
+def parse_before(value, tz=None):
+    """Turn a 'YYYY-MM-DD' or ISO datetime, local to ``tz``, into epoch milliseconds"""
+    if isinstance(value, int):
+        return value
+    return timestamps.parse_ms(value, tz)
+
+
+def delete_in_chunks(conn, table, where, params=(), chunk_size=DEFAULT_CHUNK_SIZE,
+                     pause_ms=DEFAULT_PAUSE_MS, key='rowid'):
+    """DELETE rows of ``table`` matching ``where``, ``chunk_size`` rows per transaction.
+
+    ``key`` identifies rows for the chunking subquery; WITHOUT ROWID tables
+    pass their primary key columns, e.g. ``'(user_id, day)'``. Returns the
+    number of rows deleted from ``table`` itself (rows removed by cascade
+    triggers are not counted).
+    """
+    if conn.in_transaction:
+        conn.commit()
+
+    sql = f'''DELETE FROM {table} WHERE {key} IN (
+                  SELECT {key.strip('()')} FROM {table} WHERE {where} LIMIT ?
+              )'''
+    total = 0
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            deleted = conn.execute(sql, tuple(params) + (chunk_size,)).rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        total += deleted
+        if deleted < chunk_size:
+            return total
+        if pause_ms:
+            time.sleep(pause_ms / 1000)
+
+
+def _delete_archived(conn, user_id, before, chunk_size, pause_ms):
+    """Delete archived sessions (all users when ``user_id`` is None) and their rollups.
+
+    ``before`` is epoch milliseconds or None for everything.
+    """
+    conditions, rollup_conditions, params, rollup_params = [], [], [], []
+    if user_id is not None:
+        conditions.append('user_id = ?')
+        rollup_conditions.append('user_id = ?')
+        params.append(user_id)
+        rollup_params.append(user_id)
+    if before is not None:
+        conditions.append('started_at < ?')
+        params.append(before)
+        # Rollups are per UTC day, so only days entirely before the cutoff go
+        rollup_conditions.append('day < ?')
+        rollup_params.append(timestamps.local_day(before))
+    where = ' AND '.join(conditions) or '1'
+
+    total = 0
+    for month, table in archive.partition_tables(conn):
+        if before is not None and archive.month_bounds(month)[0] >= before:
+            continue
+        deleted = delete_in_chunks(conn, table, where, params, chunk_size, pause_ms)
+        if deleted:
+            conn.execute(
+                'UPDATE session_archive_partitions SET row_count = MAX(row_count - ?, 0) WHERE month = ?',
+                (deleted, month)
+            )
+            conn.commit()
+        total += deleted
+
+    delete_in_chunks(conn, 'session_rollups', ' AND '.join(rollup_conditions) or '1',
+                     rollup_params, chunk_size, pause_ms, key='(user_id, day, session_type)')
+    return total
+
+
+def delete_sessions_before(conn, user_id, before, include_archived=True,
+                           chunk_size=DEFAULT_CHUNK_SIZE, pause_ms=DEFAULT_PAUSE_MS):
+    """Delete sessions that started before ``before``; ``user_id=None`` means every user.
+
+    A date or naive datetime ``before`` is local to the user (UTC for every user).
+    """
+    tz = timestamps.user_timezone(conn, user_id) if user_id is not None else None
+    before = parse_before(before, tz)
+    if user_id is None:
+        where, params = 'started_at < ?', (before,)
+    else:
+        where, params = 'user_id = ? AND started_at < ?', (user_id, before)
+
+    result = {'sessions': delete_in_chunks(conn, 'timer_sessions', where, params, chunk_size, pause_ms)}
+    if include_archived:
+        result['archived_sessions'] = _delete_archived(conn, user_id, before, chunk_size, pause_ms)
+        # Analytics rollups cover archived sessions too, so they go only with them
+        analytics.delete_rollups(conn, user_id, timestamps.local_day(before, tz))
+    return result
+
+
+def delete_all_timetables(conn, user_id, chunk_size=DEFAULT_CHUNK_SIZE, pause_ms=DEFAULT_PAUSE_MS):
+    """Delete every timetable a user owns; entries go with them"""
+    deleted = delete_in_chunks(
+        conn, 'timetables', 'user_id = ?', (user_id,),
+        max(1, chunk_size // TIMETABLE_CHUNK_DIVISOR), pause_ms
+    )
+    return {'timetables': deleted}
+
+
+def delete_account(conn, user_id, db_path=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                   pause_ms=DEFAULT_PAUSE_MS, data_conn=None):
+    """Delete a user and everything they own.
+
+    The bulky children go first in chunks; the final DELETE of the user row
+    then only has to cascade over what is left. ``data_conn`` is the user's
+    shard when their sessions and timetables live on one (default: ``conn``).
+    """
+    data_conn = data_conn or conn
+    result = {
+        'sessions': delete_in_chunks(data_conn, 'timer_sessions', 'user_id = ?', (user_id,),
+                                     chunk_size, pause_ms),
+        'archived_sessions': _delete_archived(data_conn, user_id, None, chunk_size, pause_ms),
+    }
+    result.update(delete_all_timetables(data_conn, user_id, chunk_size, pause_ms))
+    if data_conn is not conn:
+        # A shard has no users row to cascade from; after the timetables,
+        # whose deletes bump the list version
+        analytics.delete_rollups(data_conn, user_id)
+        data_conn.execute('DELETE FROM timetable_list_versions WHERE user_id = ?', (user_id,))
+        data_conn.commit()
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        result['users'] = conn.execute('DELETE FROM users WHERE id = ?', (user_id,)).rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    if db_path is not None:
+        timetable_cache.cache.invalidate(db_path, user_id)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk delete PomodoroFlow data')
+    parser.add_argument('--db', default='pomodoro.db', help='Path to the SQLite database')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--pause-ms', type=float, default=DEFAULT_PAUSE_MS)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    sessions = commands.add_parser('sessions', help='Delete sessions older than a date')
+    sessions.add_argument('--before', required=True,
+                          help="YYYY-MM-DD or ISO datetime, in the user's time zone (UTC for all users)")
+    sessions.add_argument('--user-id', type=int, default=None, help='Only this user (default: all)')
+    sessions.add_argument('--hot-only', action='store_true', help='Leave archived sessions alone')
+
+    timetables = commands.add_parser('timetables', help="Delete all of a user's timetables")
+    timetables.add_argument('--user-id', type=int, required=True)
+
+    account = commands.add_parser('account', help='Delete a user and all their data')
+    account.add_argument('--user-id', type=int, required=True)
+
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    conn.execute('PRAGMA foreign_keys = ON')
+    try:
+        if args.command == 'sessions':
+            result = delete_sessions_before(
+                conn, args.user_id, args.before, not args.hot_only, args.chunk_size, args.pause_ms
+            )
+        elif args.command == 'timetables':
+            result = delete_all_timetables(conn, args.user_id, args.chunk_size, args.pause_ms)
+        else:
+            result = delete_account(conn, args.user_id, None, args.chunk_size, args.pause_ms)
+    finally:
+        conn.close()
+
+    for name, count in result.items():
+        print(f'{name}: deleted {count}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+"""
+Token bucket rate limiting for PomodoroFlow API
+
+Every request takes tokens from two buckets: one for the client (the session
+user when logged in, otherwise the remote address) and one shared by all
+clients. Buckets refill continuously at a fixed rate up to their capacity,
+so clients get short bursts but not sustained floods. Endpoints cost
+different amounts: password hashing endpoints are far more expensive than
+reads.
+
+Bucket state lives in process by default. With RATELIMIT_STORAGE=sqlite it
+is kept in a small SQLite database (RATELIMIT_DB) so several worker
+processes share one set of limits.
+
+Responses carry X-RateLimit-Limit/Remaining/Reset for the client bucket;
+rejected requests get 429 with Retry-After and are counted, by the bucket
+that ran short, in the pomodoro_ratelimit_rejected gauge.
+"""
+
+import math
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from flask import g, jsonify, request, session
+
+import metrics
+
+DEFAULT_CAPACITY = 60
+DEFAULT_RATE = 1.0  # tokens per second
+DEFAULT_GLOBAL_CAPACITY = 2000
+DEFAULT_GLOBAL_RATE = 500.0
+
+READ_COST = 1
+WRITE_COST = 2
+
+# Endpoints that hash a password
+ENDPOINT_COSTS = {
+    'login': 10,
+    'register': 10,
+    'delete_current_user': 10,
+}
+
+# Prefixes of paths that are never limited (admin and metrics scraping)
+EXEMPT_PREFIXES = ('/api/_',)
+
+# Forget buckets that have refilled once the in-memory store grows past this
+MAX_MEMORY_BUCKETS = 100000
+
+# How often the SQLite store deletes buckets that have refilled
+SWEEP_INTERVAL_SECONDS = 60
+
+GLOBAL_KEY = 'global'
+
+
+def _refill(tokens, updated_at, capacity, rate, now):
+    return min(capacity, tokens + max(0.0, now - updated_at) * rate)
+
+
+class MemoryStore:
+    """Bucket state in a dict, guarded by one lock"""
+
+    def __init__(self, max_buckets=MAX_MEMORY_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets = {}  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def consume(self, buckets, cost, now):
+        """Take ``cost`` from every bucket or from none.
+
+        ``buckets`` is a list of (key, capacity, rate). Returns
+        (allowed, [tokens left per bucket]).
+        """
+        with self._lock:
+            levels = []
+            for key, capacity, rate in buckets:
+                state = self._buckets.get(key)
+                levels.append(capacity if state is None else _refill(*state, capacity, rate, now))
+
+            allowed = all(level >= cost for level in levels)
+            if allowed:
+                levels = [level - cost for level in levels]
+                for (key, _, _), level in zip(buckets, levels):
+                    self._buckets[key] = (level, now)
+                if len(self._buckets) > self.max_buckets:
+                    self._sweep(buckets[0][1], buckets[0][2], now)
+            return allowed, levels
+
+    def _sweep(self, capacity, rate, now):
+        # A full bucket behaves exactly like a missing one
+        full = [key for key, state in self._buckets.items()
+                if key != GLOBAL_KEY and _refill(*state, capacity, rate, now) >= capacity]
+        for key in full:
+            del self._buckets[key]
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SQLiteStore:
+    """Bucket state in a SQLite file shared by worker processes"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._last_sweep = 0.0
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('''CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL
+        ) WITHOUT ROWID''')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Losing a few bucket updates in a crash is harmless
+            conn = sqlite3.connect(self.db_path, timeout=1, isolation_level=None)
+            conn.execute('PRAGMA synchronous = OFF')
+            self._local.conn = conn
+        return conn
+
+    def consume(self, buckets, cost, now):
+        conn = self._connection()
+        keys = [key for key, _, _ in buckets]
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            placeholders = ', '.join('?' * len(keys))
+            states = dict((row[0], row[1:]) for row in conn.execute(
+                f'SELECT key, tokens, updated_at FROM rate_limit_buckets WHERE key IN ({placeholders})',
+                keys
+            ))
+            levels = []
+            for key, capacity, rate in buckets:
+                state = states.get(key)
+                levels.append(capacity if state is None else _refill(*state, capacity, rate, now))
+
+            allowed = all(level >= cost for level in levels)
+            if allowed:
+                levels = [level - cost for level in levels]
+                conn.executemany(
+                    '''INSERT INTO rate_limit_buckets (key, tokens, updated_at) VALUES (?, ?, ?)
+                       ON CONFLICT (key) DO UPDATE SET
+                           tokens = excluded.tokens, updated_at = excluded.updated_at''',
+                    [(key, level, now) for key, level in zip(keys, levels)]
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        if now - self._last_sweep >= SWEEP_INTERVAL_SECONDS:
+            self._last_sweep = now
+            self.sweep(buckets[0][1], buckets[0][2], now)
+        return allowed, levels
+
+    def sweep(self, capacity, rate, now):
+        """Delete client buckets that have refilled completely; returns rows removed"""
+        conn = self._connection()
+        return conn.execute(
+            'DELETE FROM rate_limit_buckets WHERE key != ? AND updated_at < ?',
+            (GLOBAL_KEY, now - capacity / rate)
+        ).rowcount
+
+    def clear(self):
+        self._connection().execute('DELETE FROM rate_limit_buckets')
+
+
+def request_cost():
+    cost = ENDPOINT_COSTS.get(request.endpoint)
+    if cost is not None:
+        return cost
+    return READ_COST if request.method in ('GET', 'HEAD') else WRITE_COST
+
+
+def client_key():
+    user_id = session.get('user_id')
+    if user_id is not None:
+        return f'user:{user_id}'
+    return f'ip:{request.remote_addr}'
+
+
+class RateLimiter:
+    """before/after request hooks enforcing the client and global buckets"""
+
+    def __init__(self, app):
+        self.capacity = app.config['RATELIMIT_CAPACITY']
+        self.rate = app.config['RATELIMIT_RATE']
+        self.global_capacity = app.config['RATELIMIT_GLOBAL_CAPACITY']
+        self.global_rate = app.config['RATELIMIT_GLOBAL_RATE']
+        if app.config['RATELIMIT_STORAGE'] == 'sqlite':
+            self.store = SQLiteStore(app.config['RATELIMIT_DB'])
+        else:
+            self.store = MemoryStore()
+        self.rejected = Counter()  # bucket -> requests rejected
+        self._lock = threading.Lock()
+
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+
+        metrics.registry.register_gauge(
+            'pomodoro_ratelimit_rejected', 'Requests rejected by the rate limiter',
+            self._rejected_counts
+        )
+
+    def _rejected_counts(self):
+        with self._lock:
+            return {(('bucket', bucket),): count for bucket, count in self.rejected.items()}
+
+    def before_request(self):
+        if request.method == 'OPTIONS' or request.path.startswith(EXEMPT_PREFIXES):
+            return None
+
+        cost = request_cost()
+        now = time.time()
+        allowed, levels = self.store.consume([
+            (client_key(), self.capacity, self.rate),
+            (GLOBAL_KEY, self.global_capacity, self.global_rate),
+        ], cost, now)
+        g._rate_limit = levels[0]
+
+        if allowed:
+            return None
+
+        with self._lock:
+            self.rejected['client' if levels[0] < cost else GLOBAL_KEY] += 1
+        # Wait for whichever bucket is short, at the slower of the two refills
+        waits = [
+            (cost - levels[0]) / self.rate,
+            (cost - levels[1]) / self.global_rate,
+        ]
+        response = jsonify({'error': 'Too many requests, please slow down'})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(max(1, math.ceil(max(waits))))
+        return response
+
+    def after_request(self, response):
+        remaining = g.pop('_rate_limit', None)
+        if remaining is None:
+            return response
+        response.headers['X-RateLimit-Limit'] = str(self.capacity)
+        response.headers['X-RateLimit-Remaining'] = str(max(0, math.floor(remaining)))
+        response.headers['X-RateLimit-Reset'] = str(math.ceil((self.capacity - remaining) / self.rate))
+        return response
+
+
+def init_app(app):
+    """Enable rate limiting unless RATELIMIT_ENABLED is false; returns the limiter or None"""
+    app.config.setdefault('RATELIMIT_ENABLED', True)
+    app.config.setdefault('RATELIMIT_CAPACITY', DEFAULT_CAPACITY)
+    app.config.setdefault('RATELIMIT_RATE', DEFAULT_RATE)
+    app.config.setdefault('RATELIMIT_GLOBAL_CAPACITY', DEFAULT_GLOBAL_CAPACITY)
+    app.config.setdefault('RATELIMIT_GLOBAL_RATE', DEFAULT_GLOBAL_RATE)
+    app.config.setdefault('RATELIMIT_STORAGE', 'memory')
+    app.config.setdefault('RATELIMIT_DB', 'ratelimit.db')
+
+    if not app.config['RATELIMIT_ENABLED']:
+        return None
+
+    limiter = RateLimiter(app)
+    app.extensions['rate_limiter'] = limiter
+    return limiter
@@ -0,0 +1,85 @@
+"""
+Compact row records for PomodoroFlow models
+
+Each record is a ``__slots__`` class built positionally from a query row, so a
+row costs one small object instead of a dict. Records support ``record['key']``
+and ``record.get('key')`` for code written against the old dict results, and
+``to_dict()`` produces the JSON wire format.
+"""
+
+
+class Record:
+    """Base class for slotted row records"""
+
+    __slots__ = ()
+
+    # Field names in query column order; subclasses set this to __slots__
+    fields = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Generate a positional __init__ per record, as namedtuple does, so
+        # construction is plain attribute stores rather than a setattr loop
+        args = ', '.join(cls.fields)
+        body = ''.join(f'\n    self.{name} = {name}' for name in cls.fields) or '\n    pass'
+        namespace = {}
+        exec(f'def __init__(self, {args}):{body}', namespace)
+        cls.__init__ = namespace['__init__']
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row)
+
+    @classmethod
+    def select_columns(cls, alias=None):
+        """Column list for a SELECT that feeds ``from_row``"""
+        prefix = f'{alias}.' if alias else ''
+        return ', '.join(prefix + name for name in cls.fields)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def keys(self):
+        return self.fields
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.fields}
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.fields)
+
+    def __repr__(self):
+        values = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.fields)
+        return f'{type(self).__name__}({values})'
+
+
+class UserRecord(Record):
+    __slots__ = fields = ('id', 'username', 'email', 'created_at')
+
+
+class SessionRecord(Record):
+    __slots__ = fields = (
+        'id', 'user_id', 'session_type', 'duration', 'completed', 'started_at', 'completed_at'
+    )
+
+
+class EntryRecord(Record):
+    __slots__ = fields = ('id', 'timetable_id', 'start_time', 'end_time', 'subject', 'is_break')
+
+
+class TimetableRecord(Record):
+    __slots__ = fields = ('id', 'user_id', 'title', 'description', 'date', 'created_at')
+
+
+class TimetableSummaryRecord(Record):
+    """A timetable row from the listing query, with its entry summary"""
+
+    __slots__ = fields = TimetableRecord.fields + ('entry_count', 'first_start', 'last_end')
@@ -0,0 +1,247 @@
+"""
+Read replica for PomodoroFlow API
+
+Heavy read endpoints (history, stats, analytics and exports) can read from
+a snapshot copy of the database instead of the primary file, so long reads
+never take the primary's locks or compete with timer writes for its pages.
+
+The snapshot is copied the way ``backup.py`` takes backups, a few pages per
+step with the SQLite online backup API, into a temporary file that is
+stamped with the time the copy started and then moved over the replica
+path. Connections already open on the previous copy keep reading it, and
+since a copy is never modified after the move it is opened ``immutable``
+without any locking. A background thread refreshes it every
+REPLICA_REFRESH_SECONDS; with several worker processes, whichever one finds
+the copy due refreshes it.
+
+A request reads from the replica only when the copy is at most
+REPLICA_MAX_STALENESS_SECONDS old and was taken after the user's last write
+(remembered in the session), so users always see their own changes.
+Otherwise it reads from the primary.
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, request, session
+
+import backup
+import metrics
+
+DEFAULT_REFRESH_SECONDS = 30
+DEFAULT_MAX_STALENESS_SECONDS = 120
+
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+SESSION_KEY = '_last_write'
+
+
+def take_snapshot(primary_path, replica_path, pages=backup.DEFAULT_PAGES_PER_STEP,
+                  sleep=backup.DEFAULT_STEP_SLEEP_SECONDS):
+    """Copy ``primary_path`` to ``replica_path`` atomically; returns the snapshot time"""
+    started = time.time()
+    tmp_path = f'{replica_path}.{os.getpid()}.tmp'
+    source = sqlite3.connect(primary_path, timeout=30)
+    target = sqlite3.connect(tmp_path)
+    try:
+        backup.copy_database(source, target, pages, sleep)
+        target.execute('PRAGMA journal_mode = DELETE')
+        target.execute('CREATE TABLE IF NOT EXISTS replica_meta (snapshot_at REAL NOT NULL)')
+        target.execute('DELETE FROM replica_meta')
+        target.execute('INSERT INTO replica_meta (snapshot_at) VALUES (?)', (started,))
+        target.commit()
+    except Exception:
+        target.close()
+        os.remove(tmp_path)
+        raise
+    finally:
+        source.close()
+    target.close()
+    os.replace(tmp_path, replica_path)
+    return started
+
+
+def read_snapshot_time(replica_path):
+    conn = sqlite3.connect(f'file:{replica_path}?mode=ro&immutable=1', uri=True)
+    try:
+        row = conn.execute('SELECT snapshot_at FROM replica_meta').fetchone()
+        return row[0] if row else None
+    except sqlite3.DatabaseError:
+        return None
+    finally:
+        conn.close()
+
+
+class Replica:
+    """Keeps a snapshot of the primary fresh and hands out connections to it"""
+
+    def __init__(self, replica_path=None, refresh_seconds=DEFAULT_REFRESH_SECONDS,
+                 max_staleness=DEFAULT_MAX_STALENESS_SECONDS, pages=backup.DEFAULT_PAGES_PER_STEP,
+                 sleep=backup.DEFAULT_STEP_SLEEP_SECONDS):
+        self.replica_path = replica_path
+        self.primary_path = None
+        self.refresh_seconds = refresh_seconds
+        self.max_staleness = max_staleness
+        self.pages = pages
+        self.sleep = sleep
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.reads = Counter()  # (target, reason) -> connections handed out
+        self._snapshot = (None, None)  # (file identity, snapshot time)
+        self._refresh_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._thread = None
+
+        metrics.registry.register_gauge(
+            'pomodoro_replica_staleness_seconds', 'Age of the read replica snapshot',
+            lambda: {(): self.staleness() or 0.0}
+        )
+        metrics.registry.register_gauge(
+            'pomodoro_replica_reads', 'Heavy reads by database and reason',
+            self._read_counts
+        )
+        metrics.registry.register_gauge(
+            'pomodoro_replica_refreshes', 'Replica refreshes by outcome',
+            lambda: {(('outcome', 'ok'),): self.refreshes, (('outcome', 'failed'),): self.refresh_failures}
+        )
+
+    def _read_counts(self):
+        with self._lock:
+            return {(('target', target), ('reason', reason)): count
+                    for (target, reason), count in self.reads.items()}
+
+    def bind(self, primary_path):
+        """Set the primary path on first use (it may change after init_app)"""
+        if self.primary_path is None:
+            self.primary_path = primary_path
+            if self.replica_path is None:
+                self.replica_path = f'{primary_path}.replica'
+
+    def snapshot_time(self):
+        """Time the current copy was taken, or None when there is none"""
+        try:
+            stat = os.stat(self.replica_path)
+        except (OSError, TypeError):
+            return None
+        identity = (stat.st_ino, stat.st_mtime_ns)
+        cached_identity, snapshot_at = self._snapshot
+        if identity != cached_identity:
+            snapshot_at = read_snapshot_time(self.replica_path)
+            self._snapshot = (identity, snapshot_at)
+        return snapshot_at
+
+    def staleness(self):
+        snapshot_at = self.snapshot_time()
+        return None if snapshot_at is None else max(0.0, time.time() - snapshot_at)
+
+    def refresh(self, force=False):
+        """Take a new snapshot if one is due; returns whether it did"""
+        if not self._refresh_lock.acquire(blocking=False):
+            return False
+        try:
+            staleness = self.staleness()
+            if not force and staleness is not None and staleness < self.refresh_seconds:
+                return False
+            start = time.perf_counter()
+            take_snapshot(self.primary_path, self.replica_path, self.pages, self.sleep)
+            metrics.registry.observe_phase('replica_refresh', time.perf_counter() - start)
+            self.refreshes += 1
+            return True
+        except (sqlite3.Error, OSError):
+            self.refresh_failures += 1
+            return False
+        finally:
+            self._refresh_lock.release()
+
+    def _run(self):
+        while True:
+            self.refresh()
+            time.sleep(self.refresh_seconds)
+
+    def start(self):
+        """Start the background refresher once per process"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='replica-refresh', daemon=True)
+                self._thread.start()
+
+    def _count(self, target, reason):
+        with self._lock:
+            self.reads[(target, reason)] += 1
+
+    def connect(self, not_before=None):
+        """A read-only connection to the replica, or None to read the primary.
+
+        ``not_before`` is the oldest acceptable snapshot time, e.g. the
+        user's last write.
+        """
+        snapshot_at = self.snapshot_time()
+        if snapshot_at is None:
+            self._count('primary', 'missing')
+            return None
+        if time.time() - snapshot_at > self.max_staleness:
+            self._count('primary', 'stale')
+            return None
+        if not_before is not None and snapshot_at < not_before:
+            self._count('primary', 'own_write')
+            return None
+        self._count('replica', 'fresh')
+        return metrics.connect(f'file:{self.replica_path}?mode=ro&immutable=1', uri=True)
+
+
+def connect_for_request():
+    """Replica connection for the current request, or None when it should use the primary"""
+    replica = current_app.extensions.get('replica')
+    if replica is None:
+        return None
+    replica.bind(current_app.config['DATABASE'])
+    replica.start()
+    return replica.connect(not_before=session.get(SESSION_KEY))
+
+
+def _remember_write(response):
+    if request.method in WRITE_METHODS and response.status_code < 400 and 'user_id' in session:
+        session[SESSION_KEY] = time.time()
+    return response
+
+
+def init_app(app):
+    """Enable replica reads when REPLICA_ENABLED is true; returns the Replica or None"""
+    app.config.setdefault('REPLICA_ENABLED', False)
+    app.config.setdefault('REPLICA_PATH', None)
+    app.config.setdefault('REPLICA_REFRESH_SECONDS', DEFAULT_REFRESH_SECONDS)
+    app.config.setdefault('REPLICA_MAX_STALENESS_SECONDS', DEFAULT_MAX_STALENESS_SECONDS)
+
+    if not app.config['REPLICA_ENABLED']:
+        return None
+
+    replica = Replica(
+        app.config['REPLICA_PATH'],
+        app.config['REPLICA_REFRESH_SECONDS'],
+        app.config['REPLICA_MAX_STALENESS_SECONDS'],
+    )
+    app.after_request(_remember_write)
+    app.extensions['replica'] = replica
+    return replica
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Refresh the read replica once')
+    parser.add_argument('--db', default='pomodoro.db', help='Path to the primary database')
+    parser.add_argument('--replica', default=None, help='Replica path (default: <db>.replica)')
+    parser.add_argument('--pages', type=int, default=backup.DEFAULT_PAGES_PER_STEP, help='Pages per backup step')
+    parser.add_argument('--sleep', type=float, default=backup.DEFAULT_STEP_SLEEP_SECONDS,
+                        help='Seconds to pause between steps')
+    args = parser.parse_args()
+
+    replica_path = args.replica or f'{args.db}.replica'
+    start = time.perf_counter()
+    take_snapshot(args.db, replica_path, args.pages, args.sleep)
+    print(f'Refreshed {replica_path} in {time.perf_counter() - start:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -6,8 +6,10 @@ from flask import Blueprint, request, jsonify, session
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
 from ..models import Database, User
+from .. import timestamps
 
 auth_bp = Blueprint('auth', __name__)
+# Shared by every blueprint; the schema is checked on its first connection
 db = Database()
 user_model = User(db)
 
@@ -32,11 +34,15 @@ def register():
         username = data.get('username', '').strip()
         email = data.get('email', '').strip()
         password = data.get('password', '')
+        timezone = data.get('timezone') or timestamps.DEFAULT_TIMEZONE
         
         # Validation
         if not username or not email or not password:
             return jsonify({'error': 'All fields are required'}), 400
         
+        if not timestamps.is_valid_timezone(timezone):
+            return jsonify({'error': 'Unknown time zone'}), 400
+        
         if len(username) < 3:
             return jsonify({'error': 'Username must be at least 3 characters long'}), 400
         
@@ -51,7 +57,7 @@ def register():
             return jsonify({'error': 'Username or email already exists'}), 400
         
         # Create user
-        user_id = user_model.create(username, email, password)
+        user_id = user_model.create(username, email, password, timezone)
         
         # Log user in
         session['user_id'] = user_id
@@ -91,6 +97,10 @@ def login():
             session['user_id'] = user['id']
             session['username'] = user['username']
             
+            # Follow the browser's time zone
+            if timestamps.is_valid_timezone(data.get('timezone')):
+                user_model.set_timezone(user['id'], data['timezone'])
+            
             return jsonify({
                 'message': 'Login successful',
                 'user': {
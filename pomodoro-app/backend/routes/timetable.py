@@ -3,11 +3,10 @@ Timetable management routes for PomodoroFlow API
 """
 from flask import Blueprint, request, jsonify, session
 from datetime import datetime, time
-from .auth import login_required
-from ..models import Database, Timetable
+from .auth import login_required, db
+from ..models import Timetable
 
 timetable_bp = Blueprint('timetable', __name__)
-db = Database()
 timetable_model = Timetable(db)
 
 @timetable_bp.route('', methods=['GET'])
@@ -0,0 +1,108 @@
+"""
+JSON serialization for PomodoroFlow API responses
+
+Uses orjson when it is installed and falls back to the stdlib encoder.
+List endpoints encode query results straight from row tuples instead of
+going through sqlite3.Row -> dict -> jsonify.
+"""
+
+import json
+from datetime import date, datetime, time
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj):
+    """Encode types the JSON encoders don't handle natively"""
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps_bytes(obj):
+        """Serialize ``obj`` to compact UTF-8 JSON bytes"""
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+else:
+    _encoder = json.JSONEncoder(
+        default=_default, separators=(',', ':'), ensure_ascii=False
+    )
+
+    def dumps_bytes(obj):
+        """Serialize ``obj`` to compact UTF-8 JSON bytes"""
+        return _encoder.encode(obj).encode('utf-8')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by ``dumps_bytes``"""
+
+    default = staticmethod(_default)
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # Callers asking for indent/sort_keys etc. get the stdlib encoder
+            return super().dumps(obj, **kwargs)
+        return dumps_bytes(obj).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        with metrics.timing('serialize'):
+            body = dumps_bytes(obj)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_app(app):
+    """Install the fast JSON provider on ``app``"""
+    app.json = FastJSONProvider(app)
+
+
+def cursor_columns(cursor):
+    return tuple(column[0] for column in cursor.description)
+
+
+def row_dicts(columns, rows):
+    """Pair each row tuple with ``columns`` for the encoder"""
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def json_response(payload, status=200):
+    """Encode ``payload`` once and wrap it in a response"""
+    with metrics.timing('serialize'):
+        body = dumps_bytes(payload)
+    return current_app.response_class(body, status=status, mimetype='application/json')
+
+
+def rows_body(key, cursor, **extra):
+    """Encode ``{key: [row, ...], **extra}`` for an executed query.
+
+    The cursor is switched to plain tuples before fetching so no sqlite3.Row
+    objects are built.
+    """
+    cursor.row_factory = None
+    columns = cursor_columns(cursor)
+    rows = cursor.fetchall()
+    payload = dict(extra)
+    with metrics.timing('serialize'):
+        payload[key] = row_dicts(columns, rows)
+        return dumps_bytes(payload)
+
+
+def body_response(body, status=200):
+    """Wrap an already encoded JSON body in a response"""
+    return current_app.response_class(body, status=status, mimetype='application/json')
+
+
+def rows_response(key, cursor, status=200, **extra):
+    """Respond with ``{key: [row, ...], **extra}`` for an executed query"""
+    return body_response(rows_body(key, cursor, **extra), status)
@@ -0,0 +1,592 @@
+"""
+Sharding of per-user data for PomodoroFlow API
+
+With SHARD_COUNT set, each user's timer sessions, timetables and entries,
+and everything derived from them (archive rollups and partitions, focus
+rollups, timetable list versions), live in one of several shard files next
+to the main database: ``pomodoro.shard0.db``, ``pomodoro.shard1.db``, ...
+SQLite has one writer per file, so writes for users on different shards no
+longer queue behind each other.
+
+The main database becomes the directory: ``users``, idempotency keys and
+``user_shards``, which records the shard each user's data is on. New users
+are placed with a jump consistent hash of their id, so going from N to N+1
+shards moves only about 1/(N+1) of them. Users without a row (everyone
+from before sharding was turned on) keep being served from the main
+database until ``python sharding.py rebalance`` moves them.
+
+Shard connections attach the directory as ``directory``. Shards have no
+``users`` table of their own, so queries that read it (time zones) resolve
+to the directory unchanged.
+
+Each process caches which shard a user is on. A cached placement is checked
+against ``user_shards_version`` on the shard connection itself, through the
+attached directory, so routing a known user opens no extra connection.
+Every move bumps the version, so a rebalance in another process makes each
+cached placement look itself up again on its next use.
+
+Maintenance CLIs that work on one file (``archive.py``, ``backup.py``) take
+a shard's path as ``--db``; give each shard its own ``--archive-dir``.
+"""
+
+import argparse
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from flask import current_app, session
+
+import analytics
+import archive
+import metrics
+import purge
+import timestamps
+import timetable_cache
+
+DEFAULT_SHARD_COUNT = 0
+
+# Users whose shard placement each process remembers
+DEFAULT_PLACEMENT_CACHE_SIZE = 100000
+
+DIRECTORY_SCHEMA = 'directory'
+
+# Rollup tables moved with a user: (table, key columns, summed columns)
+ROLLUP_TABLES = (
+    ('session_rollups', ('user_id', 'day', 'session_type'),
+     ('sessions', 'completed_sessions', 'completed_minutes')),
+    ('focus_daily', ('user_id', 'day'),
+     ('sessions', 'completed_sessions', 'focus_minutes', 'break_minutes')),
+    ('focus_hourly', ('user_id', 'day', 'hour'),
+     ('completed_sessions', 'focus_minutes')),
+)
+
+SESSION_COLUMNS = 'user_id, session_type, duration, completed, started_at, completed_at'
+
+_MASK_64 = (1 << 64) - 1
+
+
+def jump_hash(key, buckets):
+    """Jump consistent hash (Lamping & Veach) of integer ``key`` into ``buckets``"""
+    key &= _MASK_64
+    bucket, candidate = -1, 0
+    while candidate < buckets:
+        bucket = candidate
+        key = (key * 2862933555777941757 + 1) & _MASK_64
+        candidate = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_path(db_path, shard, shard_dir=None):
+    """``<name>.shard<N>.db`` next to the directory database (or in ``shard_dir``)"""
+    stem, ext = os.path.splitext(os.path.basename(db_path))
+    directory = shard_dir or os.path.dirname(os.path.abspath(db_path))
+    return os.path.join(directory, f'{stem}.shard{shard}{ext or ".db"}')
+
+
+def existing_shards(db_path, shard_dir=None):
+    """Numbers of the shard files that exist for ``db_path``"""
+    stem, ext = os.path.splitext(os.path.basename(db_path))
+    pattern = re.compile(rf'^{re.escape(stem)}\.shard(\d+){re.escape(ext or ".db")}$')
+    directory = shard_dir or os.path.dirname(os.path.abspath(db_path))
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted(int(match.group(1)) for match in map(pattern.match, names) if match)
+
+
+def database_files(db_path, shard_dir=None):
+    """The directory database and every existing shard file"""
+    return [db_path] + [shard_path(db_path, shard, shard_dir) for shard in existing_shards(db_path, shard_dir)]
+
+
+def init_directory_schema(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS user_shards (
+        user_id INTEGER PRIMARY KEY,
+        shard INTEGER NOT NULL
+    )''')
+    # Bumped by every move, so cached placements know to look again
+    conn.execute('''CREATE TABLE IF NOT EXISTS user_shards_version (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        version INTEGER NOT NULL
+    )''')
+    conn.execute('INSERT OR IGNORE INTO user_shards_version (id, version) VALUES (0, 0)')
+
+
+def init_shard_schema(conn):
+    """Create the per-user tables in a shard; ``conn`` must have the directory attached"""
+    # No foreign keys to users: they live in the directory database
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS timer_sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        session_type TEXT NOT NULL, -- 'work' or 'break'
+        duration INTEGER NOT NULL, -- in minutes
+        completed BOOLEAN DEFAULT FALSE,
+        started_at INTEGER DEFAULT {timestamps.SQL_NOW_MS}, -- epoch milliseconds (UTC)
+        completed_at INTEGER -- epoch milliseconds (UTC)
+    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS timetables (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        description TEXT,
+        date DATE NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS timetable_entries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timetable_id INTEGER NOT NULL,
+        start_time TIME NOT NULL,
+        end_time TIME NOT NULL,
+        subject TEXT NOT NULL,
+        is_break BOOLEAN DEFAULT FALSE,
+        FOREIGN KEY (timetable_id) REFERENCES timetables (id)
+    )''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_timer_sessions_user_started
+                    ON timer_sessions(user_id, started_at)''')
+
+    archive.init_archive_schema(conn)
+    timetable_cache.init_timetable_summary_schema(conn)
+    analytics.init_analytics_schema(conn)
+    purge.init_cascade_schema(conn, purge.SHARD_TRIGGERS)
+    conn.commit()
+
+
+def connect_shard(path, directory_path, **kwargs):
+    """Connection to a shard file with the directory database attached"""
+    conn = metrics.connect(path, **kwargs)
+    conn.execute(f'ATTACH DATABASE ? AS {DIRECTORY_SCHEMA}', (directory_path,))
+    conn.attached = ((DIRECTORY_SCHEMA, directory_path),)
+    return conn
+
+
+def lookup(conn, user_id):
+    """Shard holding the user's data, or None for the directory database itself"""
+    row = conn.execute('SELECT shard FROM user_shards WHERE user_id = ?', (user_id,)).fetchone()
+    return row[0] if row else None
+
+
+def placement_version(conn):
+    """The directory's placement version; works on shard connections too"""
+    return conn.execute('SELECT version FROM user_shards_version').fetchone()[0]
+
+
+def bump_placement_version(conn):
+    conn.execute('UPDATE user_shards_version SET version = version + 1')
+
+
+class ShardRouter:
+    """Places users on shards and opens connections to the shard a user is on"""
+
+    def __init__(self, count, shard_dir=None, cache_size=DEFAULT_PLACEMENT_CACHE_SIZE):
+        self.count = count
+        self.shard_dir = shard_dir
+        self.cache_size = cache_size
+        self.directory_path = None
+        self.connections = Counter()  # shard (or 'main') -> connections opened
+        self.lookups = Counter()  # 'cached', 'stale' or 'directory' -> placements resolved
+        self._placements = OrderedDict()  # user_id -> (shard, placement version)
+        self._ready = set()
+        self._lock = threading.Lock()
+
+        metrics.registry.register_gauge(
+            'pomodoro_shard_connections', 'Per-user data connections opened by shard',
+            self._connection_counts
+        )
+        metrics.registry.register_gauge(
+            'pomodoro_shard_placement_lookups', 'Shard placements resolved, by source',
+            lambda: {(('source', source),): count for source, count in self.lookups.items()}
+        )
+
+    def _connection_counts(self):
+        with self._lock:
+            return {(('shard', str(shard)),): count for shard, count in self.connections.items()}
+
+    def bind(self, directory_path):
+        """Set the directory database on first use (it may change after init_app)"""
+        if self.directory_path is None:
+            self.directory_path = directory_path
+
+    def path(self, shard):
+        return shard_path(self.directory_path, shard, self.shard_dir)
+
+    def place(self, conn, user_id):
+        """Record a new user's shard; call inside the transaction that creates the user"""
+        conn.execute(
+            'INSERT OR IGNORE INTO user_shards (user_id, shard) VALUES (?, ?)',
+            (user_id, jump_hash(user_id, self.count))
+        )
+
+    def connect(self, shard):
+        path = self.path(shard)
+        conn = connect_shard(path, self.directory_path)
+        if path not in self._ready:
+            init_shard_schema(conn)
+            with self._lock:
+                self._ready.add(path)
+        return conn
+
+    def _resolved(self, user_id, shard, version, source):
+        with self._lock:
+            self.lookups[source] += 1
+            self.connections['main' if shard is None else shard] += 1
+            if shard is None:
+                # Users still in the directory database are looked up every
+                # time; there are none left after the first rebalance
+                self._placements.pop(user_id, None)
+                return
+            self._placements[user_id] = (shard, version)
+            self._placements.move_to_end(user_id)
+            while len(self._placements) > self.cache_size:
+                self._placements.popitem(last=False)
+
+    def forget(self, user_id=None):
+        """Drop cached placements (all when ``user_id`` is None)"""
+        with self._lock:
+            if user_id is None:
+                self._placements.clear()
+            else:
+                self._placements.pop(user_id, None)
+
+    def connect_user(self, user_id):
+        """Connection to the user's shard, or None when their data is in the directory database"""
+        cached = self._placements.get(user_id)
+        if cached is not None:
+            shard, version = cached
+            conn = self.connect(shard)
+            try:
+                current = placement_version(conn)
+                if current == version:
+                    self._resolved(user_id, shard, version, 'cached')
+                    return conn
+                # Something moved since: look again through the attached directory
+                moved_to = lookup(conn, user_id)
+            except Exception:
+                conn.close()
+                raise
+            self._resolved(user_id, moved_to, current, 'stale')
+            if moved_to == shard:
+                return conn
+            conn.close()
+            return None if moved_to is None else self.connect(moved_to)
+
+        directory = metrics.connect(self.directory_path)
+        try:
+            shard = lookup(directory, user_id)
+            version = placement_version(directory)
+        finally:
+            directory.close()
+
+        self._resolved(user_id, shard, version, 'directory')
+        return None if shard is None else self.connect(shard)
+
+
+def connect_for_request(user_id=None):
+    """Connection to the current user's shard, or None to use the main database"""
+    router = current_app.extensions.get('sharding')
+    if router is None:
+        return None
+    router.bind(current_app.config['DATABASE'])
+    return router.connect_user(session['user_id'] if user_id is None else user_id)
+
+
+def place_new_user(conn, user_id):
+    router = current_app.extensions.get('sharding')
+    if router is not None:
+        router.place(conn, user_id)
+
+
+def init_app(app):
+    """Shard per-user data when SHARD_COUNT is positive; returns the ShardRouter or None"""
+    app.config.setdefault('SHARD_COUNT', DEFAULT_SHARD_COUNT)
+    app.config.setdefault('SHARD_DIR', None)
+
+    if app.config['SHARD_COUNT'] < 1:
+        return None
+
+    router = ShardRouter(app.config['SHARD_COUNT'], app.config['SHARD_DIR'])
+    app.extensions['sharding'] = router
+    return router
+
+
+def _user_ids(conn):
+    """Users with any data in ``conn``'s main database"""
+    return [row[0] for row in conn.execute(
+        '''SELECT user_id FROM main.timer_sessions UNION SELECT user_id FROM main.timetables
+           UNION SELECT user_id FROM main.session_rollups UNION SELECT user_id FROM main.focus_daily'''
+    )]
+
+
+def _has_file_partitions(conn):
+    return any(storage == 'file' for _, storage, _, _ in archive.get_partitions(conn))
+
+
+def _merge_rollups(conn, user_id):
+    for table, keys, sums in ROLLUP_TABLES:
+        columns = ', '.join(keys + sums)
+        updates = ', '.join(f'{name} = {name} + excluded.{name}' for name in sums)
+        conn.execute(
+            f'''INSERT INTO target.{table} ({columns})
+                SELECT {columns} FROM main.{table} WHERE user_id = ?
+                ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}''',
+            (user_id,)
+        )
+        conn.execute(f'DELETE FROM main.{table} WHERE user_id = ?', (user_id,))
+
+
+def _move_archived(conn, user_id):
+    moved = 0
+    for month, storage, location, _ in archive.get_partitions(conn):
+        if storage != 'table':
+            continue
+        archive.create_partition_table(conn, f'target.{location}')
+        count = conn.execute(
+            f'''INSERT INTO target.{location} ({SESSION_COLUMNS})
+                SELECT {SESSION_COLUMNS} FROM main.{location} WHERE user_id = ?''',
+            (user_id,)
+        ).rowcount
+        if not count:
+            continue
+        conn.execute(f'DELETE FROM main.{location} WHERE user_id = ?', (user_id,))
+        conn.execute(
+            '''INSERT INTO target.session_archive_partitions (month, storage, location, row_count)
+               VALUES (?, 'table', ?, ?)
+               ON CONFLICT (month) DO UPDATE SET row_count = row_count + excluded.row_count''',
+            (month, location, count)
+        )
+        conn.execute(
+            'UPDATE main.session_archive_partitions SET row_count = MAX(row_count - ?, 0) WHERE month = ?',
+            (count, month)
+        )
+        moved += count
+    return moved
+
+
+def _move_timetables(conn, user_id):
+    timetables = conn.execute(
+        'SELECT id, title, description, date, created_at FROM main.timetables WHERE user_id = ? ORDER BY id',
+        (user_id,)
+    ).fetchall()
+    for old_id, title, description, date, created_at in timetables:
+        new_id = conn.execute(
+            '''INSERT INTO target.timetables (user_id, title, description, date, created_at)
+               VALUES (?, ?, ?, ?, ?)''',
+            (user_id, title, description, date, created_at)
+        ).lastrowid
+        conn.execute(
+            '''INSERT INTO target.timetable_entries (timetable_id, start_time, end_time, subject, is_break)
+               SELECT ?, start_time, end_time, subject, is_break FROM main.timetable_entries
+               WHERE timetable_id = ? ORDER BY id''',
+            (new_id, old_id)
+        )
+
+    # Past every version either side had, so no cached listing matches the moved data
+    source_version = timetable_cache.list_version(conn, user_id)
+    conn.execute('DELETE FROM main.timetables WHERE user_id = ?', (user_id,))
+    conn.execute('DELETE FROM main.timetable_list_versions WHERE user_id = ?', (user_id,))
+    conn.execute(
+        '''INSERT INTO target.timetable_list_versions (user_id, version) VALUES (?, ?)
+           ON CONFLICT (user_id) DO UPDATE SET version = version + excluded.version''',
+        (user_id, source_version + 1)
+    )
+    return len(timetables)
+
+
+def move_user(conn, user_id, target_path, target_shard):
+    """Move a user's data from ``conn``'s main database to the shard at ``target_path``.
+
+    ``conn`` is a connection to the directory database or to a shard with
+    the directory attached. Copying, deleting, recording the new shard and
+    bumping the placement version are one transaction across the files, so
+    the user is never half moved. Rows get new ids on the target shard.
+    """
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute('ATTACH DATABASE ? AS target', (target_path,))
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            sessions = conn.execute(
+                f'''INSERT INTO target.timer_sessions ({SESSION_COLUMNS})
+                    SELECT {SESSION_COLUMNS} FROM main.timer_sessions WHERE user_id = ? ORDER BY id''',
+                (user_id,)
+            ).rowcount
+            conn.execute('DELETE FROM main.timer_sessions WHERE user_id = ?', (user_id,))
+            result = {
+                'sessions': sessions,
+                'archived_sessions': _move_archived(conn, user_id),
+                'timetables': _move_timetables(conn, user_id),
+            }
+            _merge_rollups(conn, user_id)
+            conn.execute(
+                '''INSERT INTO user_shards (user_id, shard) VALUES (?, ?)
+                   ON CONFLICT (user_id) DO UPDATE SET shard = excluded.shard''',
+                (user_id, target_shard)
+            )
+            bump_placement_version(conn)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        conn.execute('DETACH DATABASE target')
+    return result
+
+
+def rebalance(db_path, count, shard_dir=None, dry_run=False):
+    """Move every user's data to shard ``jump_hash(user_id, count)``.
+
+    Covers users still in the directory database, users placed for another
+    shard count and stray rows written to a user's old shard while it was
+    being moved, so running it again is always safe. Shards whose archive is
+    kept in separate files are skipped and reported.
+    """
+    directory = metrics.connect(db_path)
+    init_directory_schema(directory)
+    directory.commit()
+
+    placements = dict(directory.execute('SELECT user_id, shard FROM user_shards').fetchall())
+    result = {'moved_users': 0, 'sessions': 0, 'archived_sessions': 0, 'timetables': 0,
+              'placed_users': 0, 'skipped': []}
+    ready = set()
+    try:
+        for location in [None] + sorted(set(range(count)) | set(existing_shards(db_path, shard_dir))):
+            if location is None:
+                conn = directory
+            elif os.path.exists(shard_path(db_path, location, shard_dir)):
+                conn = connect_shard(shard_path(db_path, location, shard_dir), db_path)
+            else:
+                continue
+            try:
+                if _has_file_partitions(conn):
+                    result['skipped'].append('main' if location is None else location)
+                    continue
+                for user_id in _user_ids(conn):
+                    shard = jump_hash(user_id, count)
+                    if shard == location:
+                        continue
+                    result['moved_users'] += 1
+                    placements[user_id] = shard
+                    if dry_run:
+                        continue
+                    target_path = shard_path(db_path, shard, shard_dir)
+                    if target_path not in ready:
+                        target = connect_shard(target_path, db_path)
+                        init_shard_schema(target)
+                        target.close()
+                        ready.add(target_path)
+                    moved = move_user(conn, user_id, target_path, shard)
+                    for name, rows in moved.items():
+                        result[name] += rows
+            finally:
+                if conn is not directory:
+                    conn.close()
+
+        # Users with no data yet only need their placement recorded
+        unplaced = [
+            (user_id, jump_hash(user_id, count))
+            for (user_id,) in directory.execute('SELECT id FROM users').fetchall()
+            if placements.get(user_id) != jump_hash(user_id, count)
+        ]
+        result['placed_users'] = len(unplaced)
+        if unplaced and not dry_run:
+            directory.executemany(
+                '''INSERT INTO user_shards (user_id, shard) VALUES (?, ?)
+                   ON CONFLICT (user_id) DO UPDATE SET shard = excluded.shard''',
+                unplaced
+            )
+            bump_placement_version(directory)
+            directory.commit()
+    finally:
+        directory.close()
+    return result
+
+
+def query_all(db_path, sql, params=(), shard_dir=None):
+    """Run a read-only query on the directory database and every shard.
+
+    Returns (location, row) pairs, location being 'main' or the shard
+    number. Shards see the directory's tables (``users``) as well.
+    """
+    rows = []
+    locations = [('main', db_path)] + [
+        (shard, shard_path(db_path, shard, shard_dir)) for shard in existing_shards(db_path, shard_dir)
+    ]
+    for location, path in locations:
+        if location == 'main':
+            conn = metrics.connect(path)
+        else:
+            conn = connect_shard(path, db_path)
+        try:
+            conn.execute('PRAGMA query_only = ON')
+            rows.extend((location, tuple(row)) for row in conn.execute(sql, params))
+        finally:
+            conn.close()
+    return rows
+
+
+def status(db_path, shard_dir=None):
+    """Users placed, sessions, timetables and file size per location"""
+    directory = metrics.connect(db_path)
+    try:
+        placed = dict(directory.execute('SELECT shard, COUNT(*) FROM user_shards GROUP BY shard').fetchall())
+    finally:
+        directory.close()
+    counts = query_all(
+        db_path,
+        '''SELECT (SELECT COUNT(*) FROM main.timer_sessions),
+                  (SELECT COUNT(*) FROM main.timetables)''',
+        shard_dir=shard_dir,
+    )
+    report = []
+    for location, (sessions, timetables) in counts:
+        path = db_path if location == 'main' else shard_path(db_path, location, shard_dir)
+        report.append({
+            'location': location,
+            'users': placed.get(location, 0) if location != 'main' else None,
+            'sessions': sessions,
+            'timetables': timetables,
+            'bytes': os.path.getsize(path),
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage PomodoroFlow shards')
+    parser.add_argument('--db', default='pomodoro.db', help='Path to the directory database')
+    parser.add_argument('--shard-dir', default=None, help='Shard directory (default: next to --db)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('status', help='Show what each shard holds')
+
+    rebalance_cmd = commands.add_parser('rebalance', help='Move users to the shard they hash to')
+    rebalance_cmd.add_argument('--shards', type=int, required=True, help='Number of shards')
+    rebalance_cmd.add_argument('--dry-run', action='store_true', help='Only count the users to move')
+
+    query_cmd = commands.add_parser('query', help='Run a read-only query on every shard')
+    query_cmd.add_argument('sql')
+    args = parser.parse_args()
+
+    if args.command == 'status':
+        for entry in status(args.db, args.shard_dir):
+            users = '' if entry['users'] is None else f"{entry['users']} users, "
+            print(f"{entry['location']}: {users}{entry['sessions']} sessions, "
+                  f"{entry['timetables']} timetables, {entry['bytes']} bytes")
+    elif args.command == 'rebalance':
+        if args.shards < 1:
+            parser.error('--shards must be at least 1')
+        result = rebalance(args.db, args.shards, args.shard_dir, args.dry_run)
+        verb = 'Would move' if args.dry_run else 'Moved'
+        print(f"{verb} {result['moved_users']} users ({result['sessions']} sessions, "
+              f"{result['archived_sessions']} archived, {result['timetables']} timetables); "
+              f"placed {result['placed_users']} users without data")
+        for location in result['skipped']:
+            print(f'Skipped {location}: its archive is kept in separate files')
+    else:
+        for location, row in query_all(args.db, args.sql, shard_dir=args.shard_dir):
+            print(location, *row, sep='\t')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""
+Request coalescing for PomodoroFlow read endpoints
+
+With several tabs open, the frontend fires identical ``/auth/me``,
+``/stats`` and ``/timer/sessions`` requests at the same moment. A view
+wrapped in ``coalesce`` runs at most once at a time per key (user, endpoint,
+query arguments): the first request computes the response, and identical
+requests arriving while it runs wait for it and get a copy. Nothing is
+cached; once the first request finishes, the next one runs the view again.
+
+Only successful responses are shared: when the first request fails, the
+ones waiting on it run the view themselves. A write by a user with reads
+in progress starts a new generation of that user's keys, so a read that
+arrives after a write never joins one that started before it. Generations
+are only kept while the user has reads in progress.
+
+Per endpoint, the gauges count requests that ran the view and requests that
+were served from another's run, plus the view time those shared requests
+did not spend. ``/api/_admin/singleflight`` lists the busiest keys.
+"""
+
+import threading
+import time
+from collections import Counter, OrderedDict
+from functools import wraps
+
+from flask import current_app, request, session
+
+import metrics
+
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+# Waiters give up and run the view themselves after this long
+DEFAULT_WAIT_SECONDS = 30
+
+# Per-key counts are kept for this many recently used keys
+DEFAULT_TRACKED_KEYS = 1000
+
+
+class Flight:
+    """One in-progress run of a view and the requests waiting on it"""
+
+    __slots__ = ('done', 'waiters', 'status', 'body', 'mimetype')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.waiters = 0
+        self.status = None  # set only when the response may be shared
+        self.body = None
+        self.mimetype = None
+
+
+class SingleFlight:
+    """Concurrent identical reads share one run of the view"""
+
+    def __init__(self, wait_seconds=DEFAULT_WAIT_SECONDS, tracked_keys=DEFAULT_TRACKED_KEYS):
+        self.wait_seconds = wait_seconds
+        self.tracked_keys = tracked_keys
+        self.runs = Counter()  # endpoint -> requests that ran the view
+        self.shared = Counter()  # endpoint -> requests served from another's run
+        self.saved_seconds = Counter()  # endpoint -> view time shared requests didn't spend
+        self.timeouts = 0
+        self._flights = {}  # key -> Flight
+        self._generations = {}  # user_id -> writes seen while their reads ran
+        self._user_flights = Counter()  # user_id -> flights in progress
+        self._keys = OrderedDict()  # key -> [runs, shared], most recent last
+        self._lock = threading.Lock()
+
+        metrics.registry.register_gauge(
+            'pomodoro_singleflight_requests', 'Coalesced read requests by endpoint and role',
+            self._request_counts
+        )
+        metrics.registry.register_gauge(
+            'pomodoro_singleflight_saved_seconds', 'View time not repeated thanks to coalescing',
+            lambda: {(('endpoint', endpoint),): round(seconds, 6)
+                     for endpoint, seconds in self.saved_seconds.items()}
+        )
+        metrics.registry.register_gauge(
+            'pomodoro_singleflight_inflight', 'Views currently running with waiters able to join',
+            lambda: {(): len(self._flights)}
+        )
+
+    def _request_counts(self):
+        with self._lock:
+            counts = {(('endpoint', endpoint), ('role', 'run')): count
+                      for endpoint, count in self.runs.items()}
+            counts.update({(('endpoint', endpoint), ('role', 'shared')): count
+                           for endpoint, count in self.shared.items()})
+            return counts
+
+    def wrote(self, user_id):
+        """Start a new key generation for ``user_id``"""
+        with self._lock:
+            # With nothing in progress there is no earlier read to keep apart from
+            if user_id in self._user_flights:
+                self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+    def _count(self, key, runs, shared):
+        stats = self._keys.get(key)
+        if stats is None:
+            stats = self._keys[key] = [0, 0]
+            while len(self._keys) > self.tracked_keys:
+                self._keys.popitem(last=False)
+        else:
+            self._keys.move_to_end(key)
+        stats[0] += runs
+        stats[1] += shared
+
+    def do(self, user_id, endpoint, params, compute):
+        """Response of ``compute()``, sharing one run between concurrent identical callers"""
+        with self._lock:
+            # Keyed under the lock, so a generation is never dropped between
+            # reading it and joining a flight
+            key = (user_id, self._generations.get(user_id, 0), endpoint, params)
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight()
+                self._user_flights[user_id] += 1
+            else:
+                flight.waiters += 1
+
+        if not leader:
+            if not flight.done.wait(self.wait_seconds):
+                with self._lock:
+                    self.timeouts += 1
+            elif flight.status is not None:
+                return current_app.response_class(flight.body, status=flight.status, mimetype=flight.mimetype)
+            # The run failed or was not shareable: do the work ourselves
+            response = compute()
+            with self._lock:
+                self.runs[endpoint] += 1
+                self._count(key, 1, 0)
+            return response
+
+        start = time.perf_counter()
+        try:
+            response = compute()
+            if response.status_code < 400 and not response.is_streamed:
+                flight.status = response.status_code
+                flight.body = response.get_data()
+                flight.mimetype = response.mimetype
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                # No one can join once the flight is gone, so waiters is final
+                del self._flights[key]
+                self._user_flights[user_id] -= 1
+                if not self._user_flights[user_id]:
+                    del self._user_flights[user_id]
+                    self._generations.pop(user_id, None)
+                self.runs[endpoint] += 1
+                if flight.status is not None and flight.waiters:
+                    self.shared[endpoint] += flight.waiters
+                    self.saved_seconds[endpoint] += elapsed * flight.waiters
+                self._count(key, 1, flight.waiters if flight.status is not None else 0)
+            flight.done.set()
+
+    def summary(self, limit=20):
+        with self._lock:
+            endpoints = sorted(set(self.runs) | set(self.shared))
+            keys = sorted(self._keys.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+            return {
+                'endpoints': {
+                    endpoint: {
+                        'runs': self.runs[endpoint],
+                        'shared': self.shared[endpoint],
+                        'saved_seconds': round(self.saved_seconds[endpoint], 6),
+                    }
+                    for endpoint in endpoints
+                },
+                'keys': [
+                    {'user_id': user_id, 'endpoint': endpoint, 'params': dict(params),
+                     'runs': runs, 'shared': shared}
+                    for (user_id, _, endpoint, params), (runs, shared) in keys
+                ],
+                'timeouts': self.timeouts,
+            }
+
+
+def coalesce(view):
+    """Share one run of a read view between identical concurrent requests.
+
+    Place below ``login_required``: keys are scoped to the session user.
+    """
+    @wraps(view)
+    def decorated_function(*args, **kwargs):
+        group = current_app.extensions.get('singleflight')
+        if group is None:
+            return view(*args, **kwargs)
+
+        params = tuple(sorted(request.args.items(multi=True))) + tuple(sorted(kwargs.items()))
+        return group.do(session['user_id'], request.endpoint, params,
+                        lambda: current_app.make_response(view(*args, **kwargs)))
+
+    return decorated_function
+
+
+def _note_write():
+    # Before and after: a read arriving during or after the write starts afresh
+    if request.method in WRITE_METHODS and 'user_id' in session:
+        current_app.extensions['singleflight'].wrote(session['user_id'])
+
+
+def _note_write_after(response):
+    _note_write()
+    return response
+
+
+def init_app(app):
+    """Enable coalescing when SINGLEFLIGHT_ENABLED is true; returns the SingleFlight or None"""
+    app.config.setdefault('SINGLEFLIGHT_ENABLED', True)
+    app.config.setdefault('SINGLEFLIGHT_WAIT_SECONDS', DEFAULT_WAIT_SECONDS)
+
+    if not app.config['SINGLEFLIGHT_ENABLED']:
+        return None
+
+    group = SingleFlight(wait_seconds=app.config['SINGLEFLIGHT_WAIT_SECONDS'])
+    app.before_request(_note_write)
+    app.after_request(_note_write_after)
+    app.extensions['singleflight'] = group
+    return group
@@ -0,0 +1,181 @@
+"""
+Slow query log for PomodoroFlow API
+
+Listens to the query records produced by metrics.py. Any statement slower
+than the configured threshold is captured with the shape of its bound
+parameters and its EXPLAIN QUERY PLAN, kept in an in-memory ring buffer and
+written as JSON lines to a rotating log file. Plans that fall back to a full
+table scan or a temporary B-tree are flagged so index regressions show up
+before users notice them.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import metrics
+
+DEFAULT_THRESHOLD_MS = 100
+DEFAULT_BUFFER_SIZE = 200
+DEFAULT_LOG_BYTES = 5 * 1024 * 1024
+DEFAULT_LOG_BACKUPS = 3
+
+# Re-run EXPLAIN for a fingerprint at most this often
+PLAN_CACHE_SECONDS = 60
+
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+logger = logging.getLogger('pomodoro.slow_queries')
+
+
+def param_shape(params):
+    """Describe bound parameters by type only, never by value"""
+    if params is None:
+        return 'executemany'
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    return [type(value).__name__ for value in params]
+
+
+def plan_warnings(plan):
+    """Flag plan steps that usually mean a missing or unused index"""
+    warnings = []
+    for step in plan:
+        if step.startswith('SCAN ') and 'COVERING INDEX' not in step:
+            warnings.append(f'full scan: {step}')
+        elif 'USE TEMP B-TREE' in step:
+            warnings.append(f'temp b-tree: {step}')
+    return warnings
+
+
+def explain(db_path, sql, params, attached=()):
+    """Return EXPLAIN QUERY PLAN details for ``sql``, or None if unavailable
+
+    ``attached`` lists the (schema, path) pairs the original connection had
+    attached, e.g. the directory database on a shard connection.
+    """
+    if not db_path or db_path == ':memory:' or params is None:
+        return None
+    if not sql.lstrip().upper().startswith(EXPLAINABLE):
+        return None
+
+    # A separate, uninstrumented connection so this never feeds back into
+    # the listener and never disturbs the caller's transaction
+    conn = sqlite3.connect(db_path, timeout=0.5)
+    try:
+        for schema, path in attached:
+            conn.execute(f'ATTACH DATABASE ? AS {schema}', (path,))
+        rows = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+        return [row[-1] for row in rows]
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+
+
+class SlowQueryLog:
+    """Ring buffer and per-fingerprint summary of slow statements"""
+
+    def __init__(self, threshold_ms=DEFAULT_THRESHOLD_MS, buffer_size=DEFAULT_BUFFER_SIZE,
+                 log_path=None, log_bytes=DEFAULT_LOG_BYTES, log_backups=DEFAULT_LOG_BACKUPS):
+        self.threshold = threshold_ms / 1000
+        self.threshold_ms = threshold_ms
+        self.recent = deque(maxlen=buffer_size)
+        self.by_fingerprint = {}
+        self._plans = {}  # fingerprint -> (explained at, plan)
+        self._lock = threading.Lock()
+
+        if log_path:
+            from logging.handlers import RotatingFileHandler
+            handler = RotatingFileHandler(log_path, maxBytes=log_bytes, backupCount=log_backups)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+
+    def _plan_for(self, record):
+        fingerprint = record.fingerprint
+        now = time.monotonic()
+        cached = self._plans.get(fingerprint)
+        if cached is not None and now - cached[0] < PLAN_CACHE_SECONDS:
+            return cached[1]
+        plan = explain(record.db_path, record.sql, record.params, record.attached)
+        self._plans[fingerprint] = (now, plan)
+        return plan
+
+    def __call__(self, record):
+        if record.seconds < self.threshold:
+            return
+
+        plan = self._plan_for(record)
+        entry = {
+            'at': time.time(),
+            'fingerprint': record.fingerprint,
+            'ms': round(record.seconds * 1000, 3),
+            'rows': record.rows,
+            'params': param_shape(record.params),
+            'plan': plan,
+            'warnings': plan_warnings(plan or []),
+        }
+
+        with self._lock:
+            self.recent.append(entry)
+            stats = self.by_fingerprint.get(entry['fingerprint'])
+            if stats is None:
+                stats = self.by_fingerprint[entry['fingerprint']] = {
+                    'fingerprint': entry['fingerprint'],
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'rows': 0,
+                }
+            stats['count'] += 1
+            stats['total_ms'] += entry['ms']
+            stats['max_ms'] = max(stats['max_ms'], entry['ms'])
+            stats['rows'] += entry['rows']
+            stats['params'] = entry['params']
+            stats['plan'] = plan
+            stats['warnings'] = entry['warnings']
+            stats['last_seen'] = entry['at']
+
+        logger.info(json.dumps(entry))
+
+    def summary(self, limit=20):
+        """Worst fingerprints by total time spent over the threshold"""
+        with self._lock:
+            worst = sorted(self.by_fingerprint.values(), key=lambda s: s['total_ms'], reverse=True)
+            worst = [dict(stats) for stats in worst[:limit]]
+            recent = list(self.recent)[-limit:]
+        for stats in worst:
+            stats['total_ms'] = round(stats['total_ms'], 3)
+            stats['avg_ms'] = round(stats['total_ms'] / stats['count'], 3)
+        return {
+            'threshold_ms': self.threshold_ms,
+            'worst': worst,
+            'recent': recent[::-1],
+        }
+
+    def clear(self):
+        with self._lock:
+            self.recent.clear()
+            self.by_fingerprint.clear()
+            self._plans.clear()
+
+
+def init_app(app):
+    """Attach a SlowQueryLog configured from ``app.config`` to the query listeners"""
+    app.config.setdefault('SLOW_QUERY_MS', DEFAULT_THRESHOLD_MS)
+    app.config.setdefault('SLOW_QUERY_BUFFER', DEFAULT_BUFFER_SIZE)
+    app.config.setdefault('SLOW_QUERY_LOG', None)
+
+    slow_log = SlowQueryLog(
+        threshold_ms=app.config['SLOW_QUERY_MS'],
+        buffer_size=app.config['SLOW_QUERY_BUFFER'],
+        log_path=app.config['SLOW_QUERY_LOG'],
+    )
+    metrics.query_listeners.append(slow_log)
+    app.extensions['slow_query_log'] = slow_log
+    return slow_log
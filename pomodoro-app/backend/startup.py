@@ -0,0 +1,224 @@
+"""
+Startup and schema checks for PomodoroFlow API
+
+Importing the app, models.py, database.py or the routes package touches no
+database. The schema is checked once per process and database file, on the
+first request or connection that needs it: ``PRAGMA user_version`` is
+compared with SCHEMA_VERSION and only a database that is new or older runs
+the DDL, after which ``app.init_db`` stamps the version. A respawned worker
+on an existing database pays one pragma read.
+
+Bump SCHEMA_VERSION whenever ``app.create_schema`` (or a schema init it
+calls) changes, so existing databases pick the change up.
+
+    python startup.py --print-startup-profile
+    python startup.py --print-startup-profile --budget-ms 400
+
+The profile imports the app in a fresh interpreter (``-X importtime``) and
+reports import time by module, schema init on a new database and the check
+on an existing one, and the first request. With ``--budget-ms`` it exits
+non-zero when import, schema check and first request together take longer,
+so CI can keep worker respawns fast; tests/test_startup.py holds the default
+configuration to STARTUP_BUDGET_MS. This module imports only the standard
+library at the top so it adds nothing to what it measures.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SCHEMA_VERSION = 3
+
+# Import, schema check and first request of a respawned worker, with -X
+# importtime overhead; generous so a loaded CI machine stays under it
+STARTUP_BUDGET_MS = 1000
+
+# (database path, stamp) pairs this process has checked; the app's full
+# schema and the models.py/database.py subset are tracked apart
+_checked = set()
+_lock = threading.Lock()
+
+
+def _key(db_path, stamp):
+    return os.path.abspath(db_path), stamp
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def _run_init(db_path, create, stamp):
+    import metrics
+
+    conn = metrics.connect(db_path)
+    try:
+        create(conn)
+        if stamp:
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def init_schema(db_path, create, stamp=True):
+    """Run ``create(conn)`` on ``db_path`` now and remember the schema as checked.
+
+    ``stamp`` records SCHEMA_VERSION; only the app's full schema does, since
+    models.py and database.py create a subset of its tables.
+    """
+    with _lock:
+        _run_init(db_path, create, stamp)
+        _checked.add(_key(db_path, stamp))
+
+
+def ensure_schema(db_path, create, stamp=True):
+    """Run ``create(conn)`` unless ``db_path`` is current; once per process and path.
+
+    Returns whether the DDL ran.
+    """
+    key = _key(db_path, stamp)
+    if key in _checked:
+        return False
+    with _lock:
+        if key in _checked:
+            return False
+        import metrics
+
+        conn = metrics.connect(db_path)
+        try:
+            current = schema_version(conn) >= SCHEMA_VERSION
+        finally:
+            conn.close()
+        if not current:
+            _run_init(db_path, create, stamp)
+        _checked.add(key)
+        return not current
+
+
+def forget(db_path=None):
+    """Check the schema of ``db_path`` (all paths when None) again on next use"""
+    with _lock:
+        if db_path is None:
+            _checked.clear()
+        else:
+            _checked.discard(_key(db_path, True))
+            _checked.discard(_key(db_path, False))
+
+
+def _ms(start):
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+def probe(db_path):
+    """Time the app's startup phases in this (fresh) interpreter"""
+    start = time.perf_counter()
+    import app as pomodoro
+    phases = {'import_app': _ms(start)}
+
+    create_schema = pomodoro.create_schema
+
+    start = time.perf_counter()
+    ensure_schema(db_path, create_schema)
+    phases['schema_init_new_db'] = _ms(start)
+
+    forget(db_path)
+    start = time.perf_counter()
+    ensure_schema(db_path, create_schema)
+    phases['schema_check_existing_db'] = _ms(start)
+
+    pomodoro.app.config['DATABASE'] = db_path
+    start = time.perf_counter()
+    pomodoro.app.test_client().get('/api/test')
+    phases['first_request'] = _ms(start)
+    return phases
+
+
+def parse_importtime(lines, parent='app'):
+    """Cumulative microseconds per module imported directly by ``parent``.
+
+    ``-X importtime`` lists a module after everything it imports, indented
+    two spaces per level.
+    """
+    children = {}
+    for line in lines:
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children[name.strip()] = int(cumulative)
+        elif depth == 0:
+            if name.strip() == parent:
+                return children
+            children = {}
+    return {}
+
+
+def profile(top=15):
+    """Run ``probe`` in a fresh interpreter; returns the report"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'startup.db')
+        code = f'import json, startup; print(json.dumps(startup.probe({db_path!r})))'
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True,
+            env=dict(os.environ, POMODORO_DB=db_path),
+        )
+        wall_ms = _ms(start)
+    if result.returncode != 0:
+        raise RuntimeError(f'Startup probe failed:\n{result.stderr[-2000:]}')
+
+    phases = json.loads(result.stdout.strip().splitlines()[-1])
+    modules = parse_importtime(result.stderr.splitlines())
+    imports = sorted(modules.items(), key=lambda item: item[1], reverse=True)
+    return {
+        'phases_ms': phases,
+        'respawn_ms': round(phases['import_app'] + phases['schema_check_existing_db']
+                            + phases['first_request'], 2),
+        'interpreter_wall_ms': wall_ms,
+        'top_imports_ms': [(name, round(us / 1000, 2)) for name, us in imports[:top]],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report PomodoroFlow startup times')
+    parser.add_argument('--print-startup-profile', action='store_true',
+                        help='Import the app in a fresh interpreter and report startup phases')
+    parser.add_argument('--budget-ms', type=float, default=None,
+                        help='Fail when import, schema check and first request take longer')
+    parser.add_argument('--top', type=int, default=15, help='Slowest imports of app.py to list')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    if not args.print_startup_profile:
+        parser.error('nothing to do (use --print-startup-profile)')
+
+    report = profile(args.top)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for phase, ms in report['phases_ms'].items():
+            print(f'{phase:<28}{ms:>10.2f} ms')
+        print(f'{"respawn (import+check+req)":<28}{report["respawn_ms"]:>10.2f} ms')
+        print(f'{"interpreter wall":<28}{report["interpreter_wall_ms"]:>10.2f} ms')
+        print('\nSlowest imports of app.py (cumulative):')
+        for name, ms in report['top_imports_ms']:
+            print(f'  {name:<26}{ms:>10.2f} ms')
+
+    if args.budget_ms is not None and report['respawn_ms'] > args.budget_ms:
+        print(f'\nStartup budget exceeded: {report["respawn_ms"]:.2f} ms > {args.budget_ms:.2f} ms')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
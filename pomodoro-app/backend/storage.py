@@ -0,0 +1,360 @@
+"""
+Storage backends for PomodoroFlow users, sessions and timetables
+
+A ``Storage`` bundles three stores with the methods (and return types) of
+the models.py classes:
+
+- ``users``: create, set_timezone, authenticate, get_by_id, exists
+- ``sessions``: create, complete, get_user_sessions, get_user_stats
+- ``timetables``: create, add_entry, get_user_timetables,
+  get_timetable_with_entries, delete
+
+``SQLiteStorage`` is the models.py classes over a database file.
+``MemoryStorage`` keeps everything in dicts indexed by id, username and
+email, with per-user arrays kept sorted by start time (sessions) and date
+(timetables). It can be loaded from an existing database with
+``MemoryStorage.load``.
+
+This is the interface of the models layer, not of the API: app.py's
+handlers keep their own SQL, because sharding, the read replica, archive
+partitions and the serialization fast paths all work below this level.
+The backends exist so that code written against models.py, the benchmark
+harness and tests/test_storage.py can run with or without disk I/O, and so
+profiles can tell Flask's overhead apart from the database's
+(benchmarks/bench_endpoints.py).
+
+The memory backend covers these methods only: analytics rollups, archive
+partitions and the timetable list cache live in SQL and are not kept up to
+date there (stats do include archived totals loaded from a database).
+"""
+
+import sqlite3
+import threading
+import time
+from bisect import bisect_left, insort
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+import metrics
+import timestamps
+from records import UserRecord, SessionRecord, TimetableRecord, TimetableSummaryRecord, EntryRecord
+
+BACKENDS = ('sqlite', 'memory')
+
+
+class Storage:
+    """Users, sessions and timetables behind one object"""
+
+    name = None
+
+    def __init__(self, users, sessions, timetables):
+        self.users = users
+        self.sessions = sessions
+        self.timetables = timetables
+
+    def close(self):
+        pass
+
+
+class SQLiteStorage(Storage):
+    """The models.py classes over one database file"""
+
+    name = 'sqlite'
+
+    def __init__(self, db_path='pomodoro.db'):
+        from models import Database, User, TimerSession, Timetable
+
+        self.db = Database(db_path)
+        super().__init__(User(self.db), TimerSession(self.db), Timetable(self.db))
+
+
+def _sql_now():
+    """CURRENT_TIMESTAMP as SQLite writes it"""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+
+
+class _MemoryData:
+    """Tables and indexes shared by the memory stores"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+        # id -> [id, username, email, created_at, password_hash, timezone]
+        self.users = {}
+        self.user_ids_by_username = {}
+        self.user_ids_by_email = {}
+
+        # id -> [id, user_id, session_type, duration, completed, started_at, completed_at]
+        self.sessions = {}
+        # user_id -> sorted [(started_at, id)] of all sessions and the
+        # sorted started_at of completed ones
+        self.user_sessions = {}
+        self.user_completed = {}
+        # user_id -> [completed sessions, completed work minutes]
+        self.user_totals = {}
+        # user_id -> (completed sessions, completed work minutes) archived in SQL
+        self.archived_totals = {}
+
+        # id -> [id, user_id, title, description, date, created_at]
+        self.timetables = {}
+        # user_id -> sorted [(date, id)]
+        self.user_timetables = {}
+        # timetable_id -> sorted [(start_time, id)]; id -> entry row
+        self.timetable_entries = {}
+        self.entries = {}
+
+        self.next_ids = {'users': 1, 'sessions': 1, 'timetables': 1, 'entries': 1}
+
+    def next_id(self, table, requested=None):
+        if requested is None:
+            requested = self.next_ids[table]
+        self.next_ids[table] = max(self.next_ids[table], requested + 1)
+        return requested
+
+    def add_user(self, username, email, password_hash, timezone, user_id=None, created_at=None):
+        if username in self.user_ids_by_username or email in self.user_ids_by_email:
+            raise ValueError('Username or email already exists')
+        user_id = self.next_id('users', user_id)
+        self.users[user_id] = [user_id, username, email, created_at or _sql_now(), password_hash, timezone]
+        self.user_ids_by_username[username] = user_id
+        self.user_ids_by_email[email] = user_id
+        return user_id
+
+    def add_session(self, user_id, session_type, duration, started_at):
+        session_id = self.next_id('sessions')
+        self.sessions[session_id] = [session_id, user_id, session_type, duration, 0, started_at, None]
+        insort(self.user_sessions.setdefault(user_id, []), (started_at, session_id))
+        return session_id
+
+    def mark_completed(self, session_id, completed_at):
+        row = self.sessions[session_id]
+        user_id = row[1]
+        row[4] = 1
+        row[6] = completed_at
+        insort(self.user_completed.setdefault(user_id, []), row[5])
+        totals = self.user_totals.setdefault(user_id, [0, 0])
+        totals[0] += 1
+        if row[2] == 'work':
+            totals[1] += row[3]
+
+    def add_timetable(self, user_id, title, description, date, timetable_id=None, created_at=None):
+        timetable_id = self.next_id('timetables', timetable_id)
+        self.timetables[timetable_id] = [timetable_id, user_id, title, description, date,
+                                         created_at or _sql_now()]
+        insort(self.user_timetables.setdefault(user_id, []), (date, timetable_id))
+        self.timetable_entries[timetable_id] = []
+        return timetable_id
+
+    def add_entry(self, timetable_id, start_time, end_time, subject, is_break, entry_id=None):
+        if timetable_id not in self.timetables:
+            raise KeyError(f'No timetable {timetable_id}')
+        entry_id = self.next_id('entries', entry_id)
+        self.entries[entry_id] = (entry_id, timetable_id, start_time, end_time, subject, int(bool(is_break)))
+        insort(self.timetable_entries[timetable_id], (start_time, entry_id))
+        return entry_id
+
+
+class MemoryUsers:
+    def __init__(self, data):
+        self.data = data
+
+    def create(self, username, email, password, timezone=timestamps.DEFAULT_TIMEZONE):
+        with metrics.timing('hash'):
+            password_hash = generate_password_hash(password)
+        with self.data.lock:
+            return self.data.add_user(username, email, password_hash, timezone)
+
+    def set_timezone(self, user_id, timezone):
+        """Change the user's time zone; False if unchanged"""
+        with self.data.lock:
+            row = self.data.users.get(user_id)
+            if row is None or row[5] == timezone:
+                return False
+            row[5] = timezone
+            return True
+
+    def timezone(self, user_id):
+        row = self.data.users.get(user_id)
+        return row[5] if row and row[5] else timestamps.DEFAULT_TIMEZONE
+
+    def authenticate(self, username, password):
+        user_id = self.data.user_ids_by_username.get(username)
+        row = self.data.users.get(user_id) if user_id is not None else None
+
+        with metrics.timing('hash'):
+            valid = row is not None and check_password_hash(row[4], password)
+
+        if valid:
+            return UserRecord(*row[:4])
+        return None
+
+    def get_by_id(self, user_id):
+        row = self.data.users.get(user_id)
+        return UserRecord(*row[:4]) if row else None
+
+    def exists(self, username=None, email=None):
+        if not username and not email:
+            return False
+        return ((bool(username) and username in self.data.user_ids_by_username)
+                or (bool(email) and email in self.data.user_ids_by_email))
+
+
+class MemorySessions:
+    def __init__(self, data, users):
+        self.data = data
+        self.users = users
+
+    def create(self, user_id, session_type, duration):
+        with self.data.lock:
+            return self.data.add_session(user_id, session_type, duration, timestamps.now_ms())
+
+    def complete(self, session_id, user_id):
+        with self.data.lock:
+            row = self.data.sessions.get(session_id)
+            if row is not None and row[1] == user_id and not row[4]:
+                self.data.mark_completed(session_id, timestamps.now_ms())
+        return True
+
+    def get_user_sessions(self, user_id, limit=50):
+        keys = self.data.user_sessions.get(user_id, ())
+        sessions = self.data.sessions
+        return [SessionRecord(*sessions[session_id])
+                for _, session_id in reversed(keys[max(0, len(keys) - limit):])]
+
+    def get_user_stats(self, user_id):
+        total_sessions, total_time = self.data.user_totals.get(user_id, (0, 0))
+        archived_sessions, archived_time = self.data.archived_totals.get(user_id, (0, 0))
+
+        # Completed start times are sorted, so the last week is one bisect
+        completed = self.data.user_completed.get(user_id, ())
+        week_start = timestamps.week_start_ms(self.users.timezone(user_id))
+        weekly_sessions = len(completed) - bisect_left(completed, week_start)
+
+        return {
+            'total_sessions': total_sessions + archived_sessions,
+            'total_study_time': total_time + archived_time,
+            'weekly_sessions': weekly_sessions
+        }
+
+
+class MemoryTimetables:
+    def __init__(self, data):
+        self.data = data
+
+    def create(self, user_id, title, description, date):
+        with self.data.lock:
+            return self.data.add_timetable(user_id, title, description, date)
+
+    def add_entry(self, timetable_id, start_time, end_time, subject, is_break=False):
+        with self.data.lock:
+            return self.data.add_entry(timetable_id, start_time, end_time, subject, is_break)
+
+    def _summary(self, row):
+        entries = self.data.entries
+        keys = self.data.timetable_entries[row[0]]
+        if not keys:
+            return TimetableSummaryRecord(*row, 0, None, None)
+        last_end = max(entries[entry_id][3] for _, entry_id in keys)
+        return TimetableSummaryRecord(*row, len(keys), keys[0][0], last_end)
+
+    def get_user_timetables(self, user_id):
+        timetables = self.data.timetables
+        return [self._summary(timetables[timetable_id])
+                for _, timetable_id in reversed(self.data.user_timetables.get(user_id, ()))]
+
+    def get_timetable_with_entries(self, timetable_id, user_id):
+        row = self.data.timetables.get(timetable_id)
+        if row is None or row[1] != user_id:
+            return None
+
+        entries = self.data.entries
+        return {
+            'timetable': TimetableRecord(*row),
+            'entries': [EntryRecord(*entries[entry_id])
+                        for _, entry_id in self.data.timetable_entries[timetable_id]]
+        }
+
+    def delete(self, timetable_id, user_id):
+        """True, like ``Timetable.delete``, whether or not anything was deleted"""
+        with self.data.lock:
+            row = self.data.timetables.get(timetable_id)
+            if row is None or row[1] != user_id:
+                return True
+            del self.data.timetables[timetable_id]
+            keys = self.data.user_timetables[user_id]
+            del keys[bisect_left(keys, (row[4], timetable_id))]
+            for _, entry_id in self.data.timetable_entries.pop(timetable_id):
+                del self.data.entries[entry_id]
+        return True
+
+
+class MemoryStorage(Storage):
+    """Everything in process memory; nothing is persisted"""
+
+    name = 'memory'
+
+    def __init__(self):
+        self.data = _MemoryData()
+        users = MemoryUsers(self.data)
+        super().__init__(users, MemorySessions(self.data, users), MemoryTimetables(self.data))
+
+    @classmethod
+    def load(cls, db_path):
+        """A memory copy of the users, hot sessions and timetables in ``db_path``.
+
+        Archived sessions are not copied, but their rollup totals are, so
+        stats match the database.
+        """
+        storage = cls()
+        data = storage.data
+        conn = sqlite3.connect(db_path)
+        try:
+            for row in conn.execute(
+                f'SELECT {UserRecord.select_columns()}, password_hash, timezone FROM users ORDER BY id'
+            ):
+                data.add_user(row[1], row[2], row[4], row[5], user_id=row[0], created_at=row[3])
+
+            # Bulk load: append, then sort each user's index once
+            for row in conn.execute(f'SELECT {SessionRecord.select_columns()} FROM timer_sessions'):
+                session_id, user_id, session_type, duration, completed, started_at, completed_at = row
+                data.next_id('sessions', session_id)
+                data.sessions[session_id] = list(row)
+                data.user_sessions.setdefault(user_id, []).append((started_at, session_id))
+                if completed:
+                    data.user_completed.setdefault(user_id, []).append(started_at)
+                    totals = data.user_totals.setdefault(user_id, [0, 0])
+                    totals[0] += 1
+                    if session_type == 'work':
+                        totals[1] += duration
+            for keys in data.user_sessions.values():
+                keys.sort()
+            for keys in data.user_completed.values():
+                keys.sort()
+
+            has_rollups = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'session_rollups'"
+            ).fetchone()
+            if has_rollups:
+                for user_id, completed, minutes in conn.execute(
+                    '''SELECT user_id, SUM(completed_sessions),
+                              SUM(CASE WHEN session_type = 'work' THEN completed_minutes ELSE 0 END)
+                       FROM session_rollups GROUP BY user_id'''
+                ):
+                    data.archived_totals[user_id] = (completed, minutes)
+
+            for row in conn.execute(f'SELECT {TimetableRecord.select_columns()} FROM timetables ORDER BY id'):
+                data.add_timetable(row[1], row[2], row[3], row[4], timetable_id=row[0], created_at=row[5])
+            for row in conn.execute(f'SELECT {EntryRecord.select_columns()} FROM timetable_entries ORDER BY id'):
+                data.add_entry(row[1], row[2], row[3], row[4], row[5], entry_id=row[0])
+        finally:
+            conn.close()
+        return storage
+
+
+def open_storage(backend='sqlite', db_path=None):
+    """Storage for ``backend``; the memory backend starts as a copy of ``db_path`` when given"""
+    if backend == 'sqlite':
+        return SQLiteStorage(db_path or 'pomodoro.db')
+    if backend == 'memory':
+        return MemoryStorage.load(db_path) if db_path else MemoryStorage()
+    raise ValueError(f'Unknown storage backend {backend!r} (choose from {", ".join(BACKENDS)})')
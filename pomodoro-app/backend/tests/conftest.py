@@ -0,0 +1,48 @@
+"""
+Fixtures for the PomodoroFlow backend tests
+
+Tests run against the Flask app through its test client, each with a fresh
+SQLite file under pytest's tmp_path, so nothing needs a running server.
+
+    python -m pytest tests -q
+"""
+
+import os
+
+# Decided when the app is imported; the tests fire requests faster than the
+# default buckets allow
+os.environ.setdefault('RATELIMIT_ENABLED', '0')
+
+import pytest
+
+import app as pomodoro
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'pomodoro.db')
+
+
+@pytest.fixture
+def app(db_path):
+    saved = dict(pomodoro.app.config)
+    pomodoro.app.config.update(DATABASE=db_path, TESTING=True)
+    pomodoro.app.extensions['idempotency'].clear()
+    yield pomodoro.app
+    pomodoro.app.config.clear()
+    pomodoro.app.config.update(saved)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def login(client, username='ada', password='secret123'):
+    """Register ``username`` (if new) and log the client in; returns the user id"""
+    client.post('/api/auth/register', json={
+        'username': username, 'email': f'{username}@example.com', 'password': password,
+    })
+    response = client.post('/api/auth/login', json={'username': username, 'password': password})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['user']['id']
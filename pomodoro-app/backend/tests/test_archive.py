@@ -0,0 +1,80 @@
+"""
+The admin archive endpoint and the ARCHIVE_* settings it runs with
+"""
+
+import os
+import sqlite3
+
+import pytest
+
+import archive
+import timestamps
+from tests.conftest import login
+
+ADMIN = {'X-Admin-Token': 'admin-secret'}
+
+
+@pytest.fixture
+def sessions(app, client, db_path):
+    """Four sessions started 10, 40, 100 and 200 days ago; returns their ids"""
+    app.config['ADMIN_TOKEN'] = ADMIN['X-Admin-Token']
+    user_id = login(client)
+    now = timestamps.now_ms()
+    conn = sqlite3.connect(db_path)
+    ids = [
+        conn.execute(
+            '''INSERT INTO timer_sessions (user_id, session_type, duration, completed, started_at, completed_at)
+               VALUES (?, 'work', 25, 1, ?, ?)''',
+            (user_id, now - days * timestamps.DAY_MS, now - days * timestamps.DAY_MS + 1500000)
+        ).lastrowid
+        for days in (10, 40, 100, 200)
+    ]
+    conn.commit()
+    conn.close()
+    return ids
+
+
+def hot_ids(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return [row[0] for row in conn.execute('SELECT id FROM timer_sessions ORDER BY id')]
+    finally:
+        conn.close()
+
+
+def test_archive_uses_the_configured_horizon(app, client, sessions, db_path):
+    app.config['ARCHIVE_HORIZON_DAYS'] = 30
+
+    assert client.post('/api/_admin/archive').status_code == 401
+    response = client.post('/api/_admin/archive', headers=ADMIN)
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['horizon_days'] == 30
+    assert sum(body['archived'][db_path].values()) == 3
+    assert hot_ids(db_path) == sessions[:1]
+    exported = client.get('/api/timer/sessions/export?include_archived=1').get_json()['sessions']
+    assert sorted(session['id'] for session in exported) == sessions
+
+
+def test_archive_writes_month_files_to_the_archive_dir(app, client, sessions, db_path, tmp_path):
+    archive_dir = str(tmp_path / 'cold')
+    app.config.update(ARCHIVE_HORIZON_DAYS=90, ARCHIVE_DIR=archive_dir)
+
+    response = client.post('/api/_admin/archive', headers=ADMIN)
+
+    assert response.status_code == 200
+    assert hot_ids(db_path) == sessions[:2]
+    conn = sqlite3.connect(db_path)
+    locations = [location for _, storage, location, _ in archive.get_partitions(conn) if storage == 'file']
+    conn.close()
+    assert locations and all(os.path.dirname(location) == archive_dir for location in locations)
+
+
+def test_archive_rejects_a_horizon_below_the_minimum(app, client, sessions, db_path):
+    app.config['ARCHIVE_HORIZON_DAYS'] = archive.MIN_HORIZON_DAYS - 1
+
+    response = client.post('/api/_admin/archive', headers=ADMIN)
+
+    assert response.status_code == 400
+    assert hot_ids(db_path) == sessions
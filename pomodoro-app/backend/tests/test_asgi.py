@@ -0,0 +1,164 @@
+"""
+Limits on the long-lived ASGI responses: stream slots, rate limiting, admission
+"""
+
+import asyncio
+
+import flask
+import pytest
+
+import admission
+import asgi
+import metrics
+import ratelimit
+from tests.conftest import login
+
+STREAM = '/api/timer/stream'
+EXPORT = '/api/timer/sessions/export'
+
+
+class Call:
+    """One request to ``asgi.application`` that stays open until ``close``"""
+
+    def __init__(self, path, cookie):
+        self.messages = []
+        self.responded = asyncio.Event()
+        self.gone = asyncio.Event()
+        self.body_sent = False
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'path': path, 'query_string': b'',
+            'root_path': '', 'headers': [(b'cookie', cookie)],
+            'client': ('127.0.0.1', 50000), 'server': ('localhost', 80),
+        }
+        self.task = asyncio.ensure_future(asgi.application(scope, self.receive, self.send))
+
+    async def receive(self):
+        if not self.body_sent:
+            self.body_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self.gone.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        self.messages.append(message)
+        if message['type'] == 'http.response.body':
+            self.responded.set()
+
+    async def response(self):
+        await asyncio.wait_for(self.responded.wait(), 5)
+        return self.messages[0]['status']
+
+    async def close(self):
+        self.gone.set()
+        await asyncio.wait_for(self.task, 5)
+
+    @property
+    def headers(self):
+        return dict(self.messages[0]['headers'])
+
+
+def session_cookie(client, username):
+    login(client, username)
+    return b'session=' + client.get_cookie('session').value.encode('latin-1')
+
+
+@pytest.fixture
+def cookies(app):
+    return {name: session_cookie(app.test_client(), name) for name in ('ada', 'bob')}
+
+
+def limits_app(**config):
+    """A throwaway app to build a limiter or controller from, without touching the real app's hooks"""
+    limits = flask.Flask('limits')
+    limits.config.update(config)
+    return limits
+
+
+def test_user_stream_limit(cookies, monkeypatch):
+    monkeypatch.setattr(asgi.application, 'max_user_streams', 2)
+
+    async def run():
+        first = Call(STREAM, cookies['ada'])
+        assert await first.response() == 200
+        second = Call(STREAM, cookies['ada'])
+        assert await second.response() == 200
+        for path in (STREAM, EXPORT):
+            refused = Call(path, cookies['ada'])
+            assert await refused.response() == 429
+            await refused.task
+        other = Call(STREAM, cookies['bob'])
+        assert await other.response() == 200
+
+        await second.close()
+        again = Call(EXPORT, cookies['ada'])
+        assert await again.response() == 200
+        await again.close()
+        for call in (first, other):
+            await call.close()
+
+    asyncio.run(run())
+    assert asgi.application.hub.user_streams == {}
+    assert asgi.application.hub.open_streams == {'timer': 0, 'export': 0}
+
+
+def test_process_stream_limit(cookies, monkeypatch):
+    monkeypatch.setattr(asgi.application, 'max_streams', 1)
+
+    async def run():
+        first = Call(STREAM, cookies['ada'])
+        assert await first.response() == 200
+        refused = Call(STREAM, cookies['bob'])
+        assert await refused.response() == 503
+        assert refused.headers[b'retry-after'] == b'1'
+        await refused.task
+        await first.close()
+
+    asyncio.run(run())
+
+
+def test_streams_are_rate_limited(app, cookies, monkeypatch):
+    limiter = ratelimit.RateLimiter(limits_app(
+        RATELIMIT_CAPACITY=1, RATELIMIT_RATE=0.01, RATELIMIT_GLOBAL_CAPACITY=100,
+        RATELIMIT_GLOBAL_RATE=1.0, RATELIMIT_STORAGE='memory',
+    ))
+    monkeypatch.setitem(app.extensions, 'rate_limiter', limiter)
+
+    async def run():
+        export = Call(EXPORT, cookies['ada'])
+        await export.close()
+        assert export.messages[0]['status'] == 200
+        for path in (EXPORT, STREAM):
+            refused = Call(path, cookies['ada'])
+            assert await refused.response() == 429
+            assert int(refused.headers[b'retry-after']) > 1
+            await refused.task
+
+    asyncio.run(run())
+    assert limiter.rejected == {'client': 2}
+    assert 'pomodoro_ratelimit_rejected{bucket="client"} 2' in metrics.render_prometheus()
+
+
+def test_streams_pass_admission_control(app, cookies, monkeypatch):
+    controller = admission.AdmissionController(limits_app(
+        ADMISSION_MAX_INFLIGHT=1, ADMISSION_MAX_QUEUE_MS=2000,
+        ADMISSION_LOW_MAX_INFLIGHT=0, ADMISSION_LOW_MAX_QUEUE_MS=500,
+    ))
+    monkeypatch.setitem(app.extensions, 'admission', controller)
+
+    async def run():
+        # Exports are low priority and the low limit is 0
+        export = Call(EXPORT, cookies['ada'])
+        assert await export.response() == 503
+        await export.task
+        # An idle timer stream is admitted but does not stay in flight
+        streams = []
+        for name in ('ada', 'bob'):
+            streams.append(Call(STREAM, cookies[name]))
+            assert await streams[-1].response() == 200
+        assert controller.in_flight == 0
+        for stream in streams:
+            await stream.close()
+
+    asyncio.run(run())
+    assert controller.shed == {('low', 'inflight'): 1}
@@ -0,0 +1,72 @@
+"""
+Cohort reports from batch_analytics, with and without NumPy
+"""
+
+import sqlite3
+
+import pytest
+
+import app as pomodoro
+import archive
+import batch_analytics
+import startup
+import timestamps
+
+DAY_MS = timestamps.DAY_MS
+START_MS = timestamps.parse_ms('2024-03-01T00:00:00Z')
+
+# (day offset or None, session type, duration, completed or None)
+SESSIONS = [
+    (0, 'work', 25, 1),
+    (0, 'work', 25, 0),
+    (0, 'break', 5, 1),
+    (0, 'work', 25, None),
+    (1, 'work', 50, 1),
+    (1, 'long_break', 15, 1),
+    (None, 'work', 25, 1),
+    (40, 'work', 25, 1),
+]
+
+BACKENDS = ['array', pytest.param('numpy', marks=pytest.mark.skipif(
+    batch_analytics.np is None, reason='NumPy is not installed'))]
+
+
+@pytest.fixture
+def conn(db_path):
+    startup.init_schema(db_path, pomodoro.create_schema)
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO users (id, username, email, password_hash) VALUES (1, 'ada', 'ada@example.com', 'x')")
+    conn.executemany(
+        '''INSERT INTO timer_sessions (user_id, session_type, duration, completed, started_at)
+           VALUES (1, ?, ?, ?, ?)''',
+        [(session_type, duration, completed, None if day is None else START_MS + day * DAY_MS + 3600000)
+         for day, session_type, duration, completed in SESSIONS]
+    )
+    conn.commit()
+    # The first two days move to an archive partition
+    assert archive.archive_sessions(conn, horizon_days=30, now=START_MS + 40 * DAY_MS)
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('chunk_size', [2, 100])
+def test_reports_skip_sessions_without_a_start(conn, backend, chunk_size):
+    result = batch_analytics.run(conn, chunk_size=chunk_size, backend=backend)
+
+    assert result['backend'] == backend
+    assert result['rows'] == len(SESSIONS) - 1
+    assert conn.execute('SELECT * FROM cohort_daily_focus ORDER BY day').fetchall() == [
+        ('2024-03-01', 4, 2, 25, 5),
+        ('2024-03-02', 2, 2, 50, 15),
+        ('2024-04-10', 1, 1, 25, 0),
+    ]
+    assert conn.execute(
+        'SELECT session_type, duration, sessions, completed_sessions FROM session_completion_rates '
+        'ORDER BY session_type, duration'
+    ).fetchall() == [
+        ('break', 5, 1, 1),
+        ('long_break', 15, 1, 1),
+        ('work', 25, 4, 2),
+        ('work', 50, 1, 1),
+    ]
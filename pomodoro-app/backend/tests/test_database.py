@@ -0,0 +1,40 @@
+"""
+DatabaseConfig.reset_database leaves nothing from before the reset
+"""
+
+import sqlite3
+
+import archive
+from database import DatabaseConfig
+from tests.conftest import login
+from tests.test_purge import add_data
+
+
+def test_reset_drops_every_table_it_created(app, client, db_path):
+    user_id = login(client)
+    add_data(client, user_id, db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute('UPDATE user_shards_version SET version = 5')
+    conn.commit()
+    conn.close()
+
+    DatabaseConfig(db_path).reset_database(backup_first=False)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        tables = [name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        assert not [name for name in tables if name.startswith('timer_sessions_archive_')]
+        assert archive.get_partitions(conn) == []
+        for table in ('users', 'timer_sessions', 'idempotency_keys', 'session_rollups'):
+            assert conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] == 0, table
+        assert conn.execute('SELECT version FROM user_shards_version').fetchall() == [(0,)]
+    finally:
+        conn.close()
+
+    # A retried key from before the reset writes afresh instead of replaying
+    app.extensions['idempotency'].clear()
+    login(client)
+    response = client.post('/api/timer/sessions', json={'session_type': 'work', 'duration': 25},
+                           headers={'Idempotency-Key': 'start-0'})
+    assert response.status_code == 201
+    assert 'Idempotent-Replayed' not in response.headers
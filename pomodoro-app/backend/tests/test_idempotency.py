@@ -0,0 +1,102 @@
+"""
+Idempotency-Key handling on write endpoints
+"""
+
+import hashlib
+import json
+import sqlite3
+import time
+
+import pytest
+
+import app as pomodoro
+from tests.conftest import login
+
+PATH = '/api/timer/sessions'
+BODY = json.dumps({'session_type': 'work', 'duration': 25}).encode()
+
+
+def post(client, key, body=BODY):
+    return client.post(PATH, data=body, content_type='application/json', headers={'Idempotency-Key': key})
+
+
+def session_count(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM timer_sessions').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def key_rows(db_path, key):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('SELECT status FROM idempotency_keys WHERE key = ?', (key,)).fetchall()
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def user_id(client):
+    return login(client)
+
+
+def test_retry_replays_the_stored_response(app, client, user_id, db_path):
+    first = post(client, 'k-replay')
+    assert first.status_code == 201
+    assert 'Idempotent-Replayed' not in first.headers
+
+    # Once from the process cache, once from the table as another worker would
+    for clear_cache in (False, True):
+        if clear_cache:
+            app.extensions['idempotency'].clear()
+        retry = post(client, 'k-replay')
+        assert retry.status_code == 201
+        assert retry.headers['Idempotent-Replayed'] == 'true'
+        assert retry.get_json() == first.get_json()
+
+    assert session_count(db_path) == 1
+
+
+def test_same_key_different_request_is_422(client, user_id, db_path):
+    assert post(client, 'k-mismatch').status_code == 201
+
+    response = post(client, 'k-mismatch', json.dumps({'session_type': 'break', 'duration': 5}).encode())
+
+    assert response.status_code == 422
+    assert session_count(db_path) == 1
+
+
+def test_key_in_progress_is_409(client, user_id, db_path):
+    # Another worker has claimed the key and is still running the write
+    fingerprint = hashlib.sha256(b'POST\0' + PATH.encode() + b'\0' + BODY).digest()
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        '''INSERT INTO idempotency_keys (user_id, key, fingerprint, status, created_at)
+           VALUES (?, 'k-busy', ?, NULL, ?)''',
+        (user_id, fingerprint, time.time())
+    )
+    conn.commit()
+    conn.close()
+
+    response = post(client, 'k-busy')
+
+    assert response.status_code == 409
+    assert session_count(db_path) == 0
+
+
+def test_server_error_releases_the_key(client, user_id, db_path, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError('disk on fire')
+
+    monkeypatch.setattr(pomodoro.analytics, 'record_start', fail)
+    failed = post(client, 'k-error')
+    assert failed.status_code == 500
+    assert key_rows(db_path, 'k-error') == []
+
+    monkeypatch.undo()
+    retry = post(client, 'k-error')
+    assert retry.status_code == 201
+    assert 'Idempotent-Replayed' not in retry.headers
+    assert key_rows(db_path, 'k-error') == [(201,)]
+    assert session_count(db_path) == 1
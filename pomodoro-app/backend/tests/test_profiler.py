@@ -0,0 +1,44 @@
+"""
+Who may force profiling with the X-Profile header
+"""
+
+from flask import Flask, request
+
+import profiler
+
+
+def profiled_app():
+    app = Flask(__name__)
+    app.config.update(PROFILING_ENABLED=True, PROFILE_MODE='cprofile')
+    request_profiler = profiler.init_app(app)
+
+    @app.route('/work')
+    def work():
+        return 'done'
+
+    return app, request_profiler
+
+
+def profiled_requests(request_profiler):
+    return sum(entry['requests'] for entry in request_profiler.report()['endpoints'].values())
+
+
+def test_header_ignored_without_an_admin_check():
+    app, request_profiler = profiled_app()
+
+    app.test_client().get('/work', headers={'X-Profile': '1'})
+
+    assert profiled_requests(request_profiler) == 0
+
+
+def test_header_honoured_only_for_admins():
+    app, request_profiler = profiled_app()
+    request_profiler.authorize = lambda: request.headers.get('X-Admin-Token') == 'secret'
+    client = app.test_client()
+
+    client.get('/work', headers={'X-Profile': '1'})
+    client.get('/work', headers={'X-Profile': '1', 'X-Admin-Token': 'wrong'})
+    assert profiled_requests(request_profiler) == 0
+
+    client.get('/work', headers={'X-Profile': '1', 'X-Admin-Token': 'secret'})
+    assert profiled_requests(request_profiler) == 1
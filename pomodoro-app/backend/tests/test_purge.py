@@ -0,0 +1,114 @@
+"""
+Account deletion and the cascade triggers behind it
+"""
+
+import sqlite3
+
+import pytest
+
+import archive
+import timestamps
+from tests.conftest import login
+
+OLD_MS = timestamps.now_ms() - 200 * timestamps.DAY_MS
+
+
+def add_data(client, user_id, db_path):
+    """Hot, completed and archived sessions, timetables with entries, an idempotency key"""
+    for n in range(4):
+        session_id = client.post('/api/timer/sessions', json={'session_type': 'work', 'duration': 25},
+                                 headers={'Idempotency-Key': f'start-{n}'}).get_json()['session_id']
+        if n % 2:
+            assert client.put(f'/api/timer/sessions/{session_id}/complete').status_code == 200
+    for n in range(2):
+        response = client.post('/api/timetables', json={
+            'title': f'Plan {n}', 'date': '2024-05-01',
+            'entries': [{'start_time': '09:00', 'end_time': '10:00', 'subject': 'Maths'},
+                        {'start_time': '10:00', 'end_time': '10:15', 'subject': 'Break', 'is_break': True}],
+        })
+        assert response.status_code == 201
+    assert client.get('/api/timetables').status_code == 200
+
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        '''INSERT INTO timer_sessions (user_id, session_type, duration, completed, started_at, completed_at)
+           VALUES (?, 'work', 25, 1, ?, ?)''',
+        [(user_id, OLD_MS + n * 60000, OLD_MS + n * 60000 + 1500000) for n in range(3)]
+    )
+    conn.commit()
+    archive.archive_sessions(conn, now=timestamps.now_ms())
+    conn.commit()
+    conn.close()
+
+
+def user_tables(conn):
+    """Every table, partitions included, with a user_id column"""
+    return [
+        name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        if any(column[1] == 'user_id' for column in conn.execute(f'PRAGMA table_info("{name}")'))
+    ]
+
+
+def rows_by_table(conn, where, params=()):
+    counts = {
+        table: conn.execute(f'SELECT COUNT(*) FROM "{table}" WHERE {where}', params).fetchone()[0]
+        for table in user_tables(conn)
+    }
+    return {table: count for table, count in counts.items() if count}
+
+
+def orphans(conn):
+    found = rows_by_table(conn, 'user_id NOT IN (SELECT id FROM users)')
+    entries = conn.execute(
+        'SELECT COUNT(*) FROM timetable_entries WHERE timetable_id NOT IN (SELECT id FROM timetables)'
+    ).fetchone()[0]
+    if entries:
+        found['timetable_entries'] = entries
+    return found
+
+
+@pytest.fixture
+def two_users(app, client, db_path):
+    """Two users with data everywhere; the client ends up logged in as the first"""
+    other = app.test_client()
+    bob = login(other, 'bob')
+    add_data(other, bob, db_path)
+    ada = login(client, 'ada')
+    add_data(client, ada, db_path)
+    return ada, bob
+
+
+def test_deleting_a_user_row_cascades_everywhere(two_users, db_path):
+    ada, bob = two_users
+    conn = sqlite3.connect(db_path)
+    owned = rows_by_table(conn, 'user_id = ?', (ada,))
+    assert {'timer_sessions', 'timetables', 'session_rollups', 'focus_daily', 'focus_hourly',
+            'timetable_list_versions', 'idempotency_keys'} <= set(owned)
+    assert any(table.startswith('timer_sessions_archive_') for table in owned)
+    bob_before = rows_by_table(conn, 'user_id = ?', (bob,))
+
+    conn.execute('DELETE FROM users WHERE id = ?', (ada,))
+    conn.commit()
+
+    assert orphans(conn) == {}
+    assert rows_by_table(conn, 'user_id = ?', (bob,)) == bob_before
+    conn.close()
+
+
+def test_delete_account_endpoint(app, client, two_users, db_path):
+    ada, bob = two_users
+    app.config.update(PURGE_CHUNK_SIZE=2, PURGE_PAUSE_MS=0)
+
+    assert client.delete('/api/auth/me', json={'password': 'wrong'}).status_code == 401
+    response = client.delete('/api/auth/me', json={'password': 'secret123'})
+    assert response.status_code == 200
+    deleted = response.get_json()['deleted']
+    assert deleted == {'sessions': 4, 'archived_sessions': 3, 'timetables': 2, 'users': 1}
+    assert client.get('/api/auth/me').status_code == 401
+
+    conn = sqlite3.connect(db_path)
+    assert orphans(conn) == {}
+    assert rows_by_table(conn, 'user_id = ?', (ada,)) == {}
+    assert rows_by_table(conn, 'user_id = ?', (bob,))
+    conn.close()
+
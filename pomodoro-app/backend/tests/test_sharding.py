@@ -0,0 +1,199 @@
+"""
+Moving users between shards with ``sharding.rebalance``
+"""
+
+import os
+import sqlite3
+from collections import Counter, defaultdict
+
+import pytest
+
+import analytics
+import app as pomodoro
+import archive
+import metrics
+import purge
+import sharding
+import slowlog
+import startup
+import timestamps
+from tests.test_purge import rows_by_table
+
+USERS = 12
+NOW_MS = timestamps.now_ms()
+
+
+@pytest.fixture
+def seeded_db(db_path):
+    """An unsharded database with hot and archived sessions, timetables and rollups"""
+    startup.init_schema(db_path, pomodoro.create_schema)
+    conn = sqlite3.connect(db_path)
+    for user_id in range(1, USERS + 1):
+        conn.execute(
+            'INSERT INTO users (id, username, email, password_hash) VALUES (?, ?, ?, ?)',
+            (user_id, f'user{user_id}', f'user{user_id}@example.com', 'x')
+        )
+        for n in range(user_id + 3):
+            started_at = NOW_MS - (n * 47 % 365) * timestamps.DAY_MS - n * 60000
+            completed = n % 3 != 0
+            conn.execute(
+                '''INSERT INTO timer_sessions
+                   (user_id, session_type, duration, completed, started_at, completed_at)
+                   VALUES (?, ?, ?, ?, ?, ?)''',
+                (user_id, 'work' if n % 2 else 'break', 25 if n % 2 else 5, completed,
+                 started_at, started_at + 25 * 60000 if completed else None)
+            )
+        for n in range(user_id % 3):
+            timetable_id = conn.execute(
+                'INSERT INTO timetables (user_id, title, date) VALUES (?, ?, ?)',
+                (user_id, f'Plan {n}', f'2024-05-{n + 1:02d}')
+            ).lastrowid
+            conn.executemany(
+                '''INSERT INTO timetable_entries (timetable_id, start_time, end_time, subject)
+                   VALUES (?, ?, ?, ?)''',
+                [(timetable_id, f'{9 + hour}:00', f'{10 + hour}:00', f'Subject {hour}') for hour in range(3)]
+            )
+    conn.commit()
+    analytics.backfill(conn)
+    conn.commit()
+    archive.archive_sessions(conn, horizon_days=90, now=NOW_MS)
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def user_rows(conn):
+    """Per user: row counts and rollup sums held by ``conn``'s main database"""
+    rows = defaultdict(Counter)
+    queries = [
+        ('sessions', 'SELECT user_id, COUNT(*) FROM main.timer_sessions GROUP BY user_id'),
+        ('timetables', 'SELECT user_id, COUNT(*) FROM main.timetables GROUP BY user_id'),
+        ('entries', '''SELECT t.user_id, COUNT(*) FROM main.timetable_entries e
+                       JOIN main.timetables t ON t.id = e.timetable_id GROUP BY t.user_id'''),
+        ('session_rollups', '''SELECT user_id, SUM(sessions) + SUM(completed_sessions) * 1000
+                                      + SUM(completed_minutes) * 1000000
+                               FROM main.session_rollups GROUP BY user_id'''),
+        ('focus_daily', '''SELECT user_id, SUM(sessions) + SUM(completed_sessions) * 1000
+                                  + SUM(focus_minutes) * 1000000 + SUM(break_minutes) * 1000000000
+                           FROM main.focus_daily GROUP BY user_id'''),
+        ('focus_hourly', '''SELECT user_id, SUM(completed_sessions) + SUM(focus_minutes) * 1000
+                            FROM main.focus_hourly GROUP BY user_id'''),
+    ]
+    queries += [
+        ('archived', f'SELECT user_id, COUNT(*) FROM main.{table} GROUP BY user_id')
+        for _, table in archive.partition_tables(conn)
+    ]
+    for name, sql in queries:
+        for user_id, value in conn.execute(sql):
+            rows[user_id][name] += value
+    return rows
+
+
+def snapshot(db_path):
+    """(location -> per-user rows, per-user totals over all locations, user_shards)"""
+    locations = {}
+    conn = sqlite3.connect(db_path)
+    locations['main'] = user_rows(conn)
+    placements = dict(conn.execute('SELECT user_id, shard FROM user_shards'))
+    conn.close()
+    for shard in sharding.existing_shards(db_path):
+        conn = sharding.connect_shard(sharding.shard_path(db_path, shard), db_path)
+        locations[shard] = user_rows(conn)
+        conn.close()
+
+    totals = defaultdict(Counter)
+    for rows in locations.values():
+        for user_id, counts in rows.items():
+            totals[user_id].update(counts)
+    return locations, totals, placements
+
+
+def test_rebalance_moves_each_user_to_one_shard(seeded_db):
+    _, before, _ = snapshot(seeded_db)
+    assert len(before) == USERS
+    assert all(totals['archived'] and totals['session_rollups'] for totals in before.values())
+
+    for count in (2, 3):
+        sharding.rebalance(seeded_db, count)
+        locations, totals, placements = snapshot(seeded_db)
+
+        assert placements == {user_id: sharding.jump_hash(user_id, count) for user_id in range(1, USERS + 1)}
+        for user_id in range(1, USERS + 1):
+            holders = [location for location, rows in locations.items() if rows.get(user_id)]
+            assert holders == [placements[user_id]]
+        assert totals == before
+
+
+def test_rebalance_again_moves_nothing(seeded_db):
+    sharding.rebalance(seeded_db, 3)
+    locations, _, _ = snapshot(seeded_db)
+
+    result = sharding.rebalance(seeded_db, 3)
+
+    assert result['moved_users'] == 0 and result['placed_users'] == 0
+    assert snapshot(seeded_db)[0] == locations
+
+
+def shard_of(conn):
+    return os.path.basename(conn.execute('PRAGMA database_list').fetchone()[2])
+
+
+def test_cached_placements_follow_a_rebalance(seeded_db):
+    sharding.rebalance(seeded_db, 4)
+    router = sharding.ShardRouter(4)
+    router.bind(seeded_db)
+    users = range(1, USERS + 1)
+
+    for _ in range(2):
+        for user_id in users:
+            router.connect_user(user_id).close()
+    assert router.lookups == {'directory': USERS, 'cached': USERS}
+
+    # As if another process rebalanced
+    sharding.rebalance(seeded_db, 3)
+    for user_id in users:
+        conn = router.connect_user(user_id)
+        try:
+            assert shard_of(conn) == f'pomodoro.shard{sharding.jump_hash(user_id, 3)}.db'
+            assert user_rows(conn)[user_id]['sessions']
+        finally:
+            conn.close()
+    assert router.lookups['stale'] == USERS
+    assert router.lookups['directory'] == USERS
+
+
+def test_delete_account_leaves_nothing_on_the_shard(seeded_db):
+    sharding.rebalance(seeded_db, 2)
+    user_id = 5
+    directory = sqlite3.connect(seeded_db, isolation_level=None)
+    shard = sharding.connect_shard(
+        sharding.shard_path(seeded_db, sharding.jump_hash(user_id, 2)), seeded_db, isolation_level=None
+    )
+    try:
+        assert rows_by_table(shard, 'user_id = ?', (user_id,))
+
+        purge.delete_account(directory, user_id, seeded_db, data_conn=shard)
+
+        assert rows_by_table(shard, 'user_id = ?', (user_id,)) == {}
+        assert rows_by_table(directory, 'user_id = ?', (user_id,)) == {}
+    finally:
+        shard.close()
+        directory.close()
+
+
+def test_slow_log_explains_shard_queries_that_read_the_directory(seeded_db, monkeypatch):
+    sharding.rebalance(seeded_db, 2)
+    slow_log = slowlog.SlowQueryLog(threshold_ms=0)
+    monkeypatch.setattr(metrics, 'query_listeners', [slow_log])
+    conn = sharding.connect_shard(sharding.shard_path(seeded_db, 0), seeded_db)
+    try:
+        conn.execute(
+            'SELECT u.timezone, COUNT(*) FROM timer_sessions s JOIN users u ON u.id = s.user_id '
+            'WHERE s.user_id = ?', (1,)
+        ).fetchall()
+    finally:
+        conn.close()
+
+    (entry,) = [entry for entry in slow_log.summary()['recent'] if 'JOIN users' in entry['fingerprint']]
+    assert entry['plan']
+    assert any(step.startswith('SEARCH u ') for step in entry['plan'])
@@ -0,0 +1,112 @@
+"""
+Request coalescing and the per-user generations behind it
+"""
+
+import threading
+
+import pytest
+from flask import Flask, jsonify, session
+
+import singleflight
+
+
+@pytest.fixture
+def coalescing():
+    """A small app whose coalesced read blocks until ``release`` is set"""
+    app = Flask('coalescing')
+    app.config['SECRET_KEY'] = 'test'
+    group = singleflight.init_app(app)
+    state = {'runs': 0, 'version': 0, 'release': threading.Event(), 'started': threading.Event()}
+
+    @app.route('/login/<int:user_id>', methods=['POST'])
+    def login(user_id):
+        session['user_id'] = user_id
+        return jsonify({}), 200
+
+    @app.route('/read')
+    @singleflight.coalesce
+    def read():
+        state['runs'] += 1
+        version = state['version']
+        state['started'].set()
+        state['release'].wait(5)
+        return jsonify({'version': version}), 200
+
+    @app.route('/write', methods=['POST'])
+    def write():
+        state['version'] += 1
+        return jsonify({}), 201
+
+    return app, group, state
+
+
+def logged_in(app, user_id):
+    client = app.test_client()
+    client.post(f'/login/{user_id}')
+    return client
+
+
+def background_read(client, results):
+    thread = threading.Thread(target=lambda: results.append(client.get('/read').get_json()['version']))
+    thread.start()
+    return thread
+
+
+def wait_for_waiters(group, count):
+    for _ in range(500):
+        with group._lock:
+            if sum(flight.waiters for flight in group._flights.values()) >= count:
+                return
+        threading.Event().wait(0.01)
+    raise AssertionError('waiters never joined')
+
+
+def test_reads_after_a_write_do_not_join_earlier_ones(coalescing):
+    app, group, state = coalescing
+    # Logging in is a write too, so every client does it up front
+    first, second, writer, third = (logged_in(app, 1) for _ in range(4))
+    before, after = [], []
+
+    threads = [background_read(first, before)]
+    assert state['started'].wait(5)
+    threads.append(background_read(second, before))
+    wait_for_waiters(group, 1)
+
+    assert writer.post('/write').status_code == 201
+    state['started'].clear()
+    threads.append(background_read(third, after))
+    assert state['started'].wait(5)
+    state['release'].set()
+    for thread in threads:
+        thread.join(5)
+
+    assert before == [0, 0]
+    assert after == [1]
+    assert state['runs'] == 2
+
+
+def test_generations_are_dropped_once_a_users_reads_finish(coalescing):
+    app, group, state = coalescing
+    state['release'].set()
+
+    for user_id in range(1, 51):
+        client = logged_in(app, user_id)
+        client.post('/write')
+        client.get('/read')
+        client.post('/write')
+
+    assert group._generations == {}
+    assert group._user_flights == {}
+
+    # A write while a read runs still starts a new generation, until it ends
+    reader, writer = logged_in(app, 7), logged_in(app, 7)
+    state['release'].clear()
+    state['started'].clear()
+    thread = background_read(reader, [])
+    assert state['started'].wait(5)
+    writer.post('/write')
+    # Noted both before and after the write
+    assert group._generations == {7: 2}
+    state['release'].set()
+    thread.join(5)
+    assert group._generations == {}
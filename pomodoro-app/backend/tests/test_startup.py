@@ -0,0 +1,40 @@
+"""
+Startup stays within its budget and skips subsystems that are turned off
+"""
+
+import os
+import subprocess
+import sys
+
+import startup
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+OPTIONAL_MODULES = ('backup', 'replica', 'sharding')
+
+
+def imported_modules(**env):
+    """Local modules a fresh interpreter has loaded after importing the app"""
+    code = 'import sys, app; print(" ".join(sorted(sys.modules)))'
+    result = subprocess.run(
+        [sys.executable, '-c', code], cwd=BACKEND_DIR, capture_output=True, text=True,
+        env=dict(os.environ, **env), check=True,
+    )
+    return set(result.stdout.split())
+
+
+def test_respawn_is_within_the_startup_budget():
+    report = startup.profile()
+
+    assert report['respawn_ms'] <= startup.STARTUP_BUDGET_MS, report
+
+
+def test_optional_subsystems_are_not_imported_when_off():
+    env = {'REPLICA_ENABLED': '0', 'SHARD_COUNT': '0', 'BACKUP_ENABLED': '0'}
+    assert not imported_modules(**env) & set(OPTIONAL_MODULES)
+
+
+def test_optional_subsystems_are_imported_when_on(tmp_path):
+    modules = imported_modules(REPLICA_ENABLED='1', SHARD_COUNT='2', BACKUP_ENABLED='1',
+                               POMODORO_DB=str(tmp_path / 'pomodoro.db'))
+    assert set(OPTIONAL_MODULES) <= modules
@@ -0,0 +1,131 @@
+"""
+The SQLite and memory storage backends give the same answers
+"""
+
+import pytest
+
+import storage as storage_backends
+import timestamps
+
+# Sessions start eight days back and step six hours, so they straddle the last week
+STEP_MS = 6 * 60 * 60 * 1000
+
+
+class Clock:
+    """A now_ms() that moves only when told to"""
+
+    def __init__(self):
+        self.start = timestamps.now_ms() - 8 * timestamps.DAY_MS
+        self.now = self.start
+
+    def __call__(self):
+        return self.now
+
+    def restart(self):
+        self.now = self.start
+
+    def advance(self):
+        self.now += STEP_MS
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(timestamps, 'now_ms', clock)
+    return clock
+
+
+def plain(value):
+    """Records as dicts without created_at, which each backend stamps itself"""
+    if isinstance(value, list):
+        return [plain(item) for item in value]
+    if isinstance(value, dict):
+        return {key: plain(item) for key, item in value.items()}
+    if hasattr(value, 'to_dict'):
+        return {key: item for key, item in value.to_dict().items() if key != 'created_at'}
+    return value
+
+
+def reads(storage, user_ids, timetable_ids):
+    users, sessions, timetables = storage.users, storage.sessions, storage.timetables
+    results = {
+        'exists': [users.exists('ada'), users.exists(email='bob@example.com'),
+                   users.exists('nobody', 'nobody@example.com'), users.exists()],
+        'authenticate': [users.authenticate('ada', 'secret123'), users.authenticate('ada', 'wrong'),
+                         users.authenticate('nobody', 'secret123')],
+        'missing_user': users.get_by_id(999),
+    }
+    for user_id in user_ids:
+        results[user_id] = {
+            'user': users.get_by_id(user_id),
+            'sessions': sessions.get_user_sessions(user_id),
+            'latest_sessions': sessions.get_user_sessions(user_id, limit=3),
+            'stats': sessions.get_user_stats(user_id),
+            'timetables': timetables.get_user_timetables(user_id),
+            'details': [timetables.get_timetable_with_entries(timetable_id, user_id)
+                        for timetable_id in timetable_ids],
+        }
+    return plain(results)
+
+
+def workload(storage, clock):
+    """The same writes on any backend; returns what they returned and what reads see"""
+    clock.restart()
+    users, sessions, timetables = storage.users, storage.sessions, storage.timetables
+    writes = []
+    user_ids = [
+        users.create('ada', 'ada@example.com', 'secret123'),
+        users.create('bob', 'bob@example.com', 'secret123', 'Asia/Tokyo'),
+        users.create('cy', 'cy@example.com', 'secret123'),
+    ]
+    writes.append(users.set_timezone(user_ids[0], 'Europe/Berlin'))
+    writes.append(users.set_timezone(user_ids[0], 'Europe/Berlin'))
+
+    for n in range(12):
+        user_id = user_ids[n % 2]
+        clock.advance()
+        session_id = sessions.create(user_id, 'work' if n % 3 else 'break', 25 if n % 3 else 5)
+        writes.append(session_id)
+        if n % 4 != 3:
+            clock.advance()
+            writes.append(sessions.complete(session_id, user_id))
+        if n == 5:
+            # Someone else's session, then a second completion: no effect
+            writes.append(sessions.complete(session_id, user_ids[0]))
+            writes.append(sessions.complete(session_id, user_id))
+
+    timetable_ids = []
+    for n in range(5):
+        user_id = user_ids[n % 2]
+        timetable_id = timetables.create(user_id, f'Plan {n}', f'Day {n}', f'2024-05-{10 - n:02d}')
+        timetable_ids.append(timetable_id)
+        for hour in (11, 9, 10)[:n % 3 + 1]:
+            writes.append(timetables.add_entry(timetable_id, f'{hour:02d}:00', f'{hour:02d}:50',
+                                               f'Subject {hour}', hour == 10))
+    writes.append(timetables.delete(timetable_ids[2], user_ids[0]))
+    writes.append(timetables.delete(timetable_ids[1], user_ids[0]))  # bob's: stays
+    writes.append(timetables.delete(999, user_ids[0]))
+
+    return writes, reads(storage, user_ids + [999], timetable_ids + [999])
+
+
+def test_backends_agree_on_the_same_writes(tmp_path, clock):
+    sqlite_storage = storage_backends.open_storage('sqlite', str(tmp_path / 'parity.db'))
+    sqlite_writes, sqlite_reads = workload(sqlite_storage, clock)
+    memory_writes, memory_reads = workload(storage_backends.open_storage('memory'), clock)
+
+    assert memory_writes == sqlite_writes
+    assert memory_reads == sqlite_reads
+    # The workload really exercised something
+    stats = sqlite_reads[1]['stats']
+    assert 0 < stats['weekly_sessions'] < stats['total_sessions']
+    assert sqlite_reads[2]['details'][1]['entries']
+
+
+def test_memory_copy_of_a_database_reads_the_same(tmp_path, clock):
+    db_path = str(tmp_path / 'parity.db')
+    _, sqlite_reads = workload(storage_backends.open_storage('sqlite', db_path), clock)
+
+    memory = storage_backends.open_storage('memory', db_path)
+
+    assert reads(memory, [1, 2, 3, 999], [1, 2, 3, 4, 5, 999]) == sqlite_reads
@@ -0,0 +1,130 @@
+"""
+Upgrading a database from before epoch-millisecond timestamps
+"""
+
+import sqlite3
+import time
+from datetime import datetime
+
+import pytest
+
+import app as pomodoro
+import startup
+
+# The schema and the datetime.now() strings the app wrote before the upgrade
+BASELINE_SCHEMA = '''
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT UNIQUE NOT NULL,
+    email TEXT UNIQUE NOT NULL,
+    password_hash TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE timer_sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    session_type TEXT NOT NULL,
+    duration INTEGER NOT NULL,
+    completed BOOLEAN DEFAULT FALSE,
+    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    completed_at TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (id)
+);
+CREATE TABLE timetables (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT,
+    date DATE NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (id)
+);
+CREATE TABLE timetable_entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timetable_id INTEGER NOT NULL,
+    start_time TIME NOT NULL,
+    end_time TIME NOT NULL,
+    subject TEXT NOT NULL,
+    is_break BOOLEAN DEFAULT FALSE,
+    FOREIGN KEY (timetable_id) REFERENCES timetables (id)
+);
+'''
+
+SESSIONS = [
+    ('work', 25, 1, '2024-03-09 23:45:10.250000', '2024-03-10 00:10:10.250000'),
+    ('break', 5, 1, '2024-03-10 01:30:00', '2024-03-10 03:35:00'),  # spans a DST change
+    ('work', 25, 0, '2024-07-01 12:00:00.000001', None),
+]
+
+
+@pytest.fixture
+def server_timezone(monkeypatch):
+    """Run with a local time zone that is not UTC and has DST"""
+    monkeypatch.setenv('TZ', 'America/New_York')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+@pytest.fixture
+def baseline_db(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.execute("INSERT INTO users (username, email, password_hash) VALUES ('ada', 'ada@example.com', 'x')")
+    conn.executemany(
+        '''INSERT INTO timer_sessions (user_id, session_type, duration, completed, started_at, completed_at)
+           VALUES (1, ?, ?, ?, ?, ?)''',
+        SESSIONS
+    )
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def local_ms(value):
+    return None if value is None else round(datetime.fromisoformat(value).timestamp() * 1000)
+
+
+def test_text_timestamps_become_epoch_ms(server_timezone, baseline_db):
+    startup.init_schema(baseline_db, pomodoro.create_schema)
+
+    conn = sqlite3.connect(baseline_db)
+    rows = conn.execute(
+        '''SELECT typeof(started_at), started_at, completed_at FROM timer_sessions ORDER BY id'''
+    ).fetchall()
+    conn.close()
+
+    assert [row[0] for row in rows] == ['integer'] * len(SESSIONS)
+    assert [(row[1], row[2]) for row in rows] == [
+        (local_ms(started_at), local_ms(completed_at)) for *_, started_at, completed_at in SESSIONS
+    ]
+    # 23:45:10.25 EST is 04:45:10.25 UTC
+    assert rows[0][1] == 1710045910250
+
+
+def test_second_run_changes_nothing(server_timezone, baseline_db):
+    startup.init_schema(baseline_db, pomodoro.create_schema)
+    conn = sqlite3.connect(baseline_db)
+    # Sorted: the cascade triggers are recreated on every run, which moves them
+    first = sorted(conn.iterdump())
+    conn.close()
+
+    startup.init_schema(baseline_db, pomodoro.create_schema)
+    conn = sqlite3.connect(baseline_db)
+    second = sorted(conn.iterdump())
+    conn.close()
+
+    assert second == first
+
+
+def test_users_get_a_timezone(server_timezone, baseline_db):
+    startup.init_schema(baseline_db, pomodoro.create_schema)
+
+    conn = sqlite3.connect(baseline_db)
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(users)')}
+    timezone = conn.execute('SELECT timezone FROM users WHERE id = 1').fetchone()[0]
+    conn.close()
+
+    assert 'timezone' in columns
+    assert timezone == 'UTC'
@@ -0,0 +1,148 @@
+"""
+Timestamps and user time zones for PomodoroFlow
+
+``timer_sessions.started_at`` and ``completed_at`` hold UTC epoch
+milliseconds (integers), so range filters are integer index seeks and
+nothing depends on the server's local time. Anything bucketed by day or
+hour (stats, analytics) uses the user's IANA time zone from
+``users.timezone``.
+
+Databases from before this format stored naive local-time strings;
+``init_timestamp_schema`` converts them once, treating them as the server's
+local time, which is what ``datetime.now()`` wrote.
+"""
+
+import time
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+DEFAULT_TIMEZONE = 'UTC'
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+# SQL for the current time in epoch milliseconds, for column defaults
+SQL_NOW_MS = "(CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER))"
+
+# SQL converting a naive local-time string column to epoch milliseconds
+_SQL_TEXT_TO_MS = "CAST(round((julianday({column}, 'utc') - 2440587.5) * 86400000) AS INTEGER)"
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+@lru_cache(maxsize=512)
+def zone(name):
+    """ZoneInfo for ``name``; unknown or missing names fall back to UTC"""
+    if name and name != DEFAULT_TIMEZONE:
+        try:
+            return ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            pass
+    return timezone.utc
+
+
+def is_valid_timezone(name):
+    if not isinstance(name, str) or not name:
+        return False
+    try:
+        ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+    return True
+
+
+def to_datetime(ms, tz=None):
+    """Aware datetime for epoch milliseconds, in ``tz`` (UTC by default)"""
+    return datetime.fromtimestamp(ms / 1000, zone(tz))
+
+
+def local_day(ms, tz=None):
+    """'YYYY-MM-DD' of the day ``ms`` falls on in ``tz``"""
+    return to_datetime(ms, tz).strftime('%Y-%m-%d')
+
+
+def local_hour(ms, tz=None):
+    return to_datetime(ms, tz).hour
+
+
+def local_day_hour(ms, tz=None):
+    moment = to_datetime(ms, tz)
+    return moment.strftime('%Y-%m-%d'), moment.hour
+
+
+def local_today(tz=None):
+    return datetime.now(zone(tz)).date()
+
+
+def day_start_ms(day, tz=None):
+    """Epoch milliseconds of local midnight at the start of ``day`` in ``tz``"""
+    return int(datetime.combine(day, datetime.min.time(), zone(tz)).timestamp() * 1000)
+
+
+def parse_ms(value, tz=None):
+    """Epoch milliseconds for a date, datetime or ISO string.
+
+    Naive values are taken as local time in ``tz``; dates mean local
+    midnight.
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    elif isinstance(value, date) and not isinstance(value, datetime):
+        return day_start_ms(value, tz)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=zone(tz))
+    return int(value.timestamp() * 1000)
+
+
+def week_start_ms(tz=None, days=7):
+    """Start of the last ``days`` local days, today included"""
+    return day_start_ms(local_today(tz) - timedelta(days=days - 1), tz)
+
+
+def user_timezone(conn, user_id):
+    row = conn.execute('SELECT timezone FROM users WHERE id = ?', (user_id,)).fetchone()
+    return row[0] if row and row[0] else DEFAULT_TIMEZONE
+
+
+def register_functions(conn):
+    """Make ``local_day(ms, tz)`` and ``local_hour(ms, tz)`` callable from SQL"""
+    conn.create_function('local_day', 2, local_day, deterministic=True)
+    conn.create_function('local_hour', 2, local_hour, deterministic=True)
+
+
+def _convert_text_timestamps(conn, table):
+    """Rewrite text started_at/completed_at values in ``table`` as epoch milliseconds"""
+    for column in ('started_at', 'completed_at'):
+        conn.execute(
+            f'''UPDATE {table} SET {column} = {_SQL_TEXT_TO_MS.format(column=column)}
+                WHERE typeof({column}) = 'text' ''',
+        )
+
+
+def init_timestamp_schema(conn):
+    """Add users.timezone and convert text session timestamps, once.
+
+    Call after the archive schema and before the analytics schema: rollups
+    bucketed by the old local-time strings are dropped so they are rebuilt.
+    """
+    import archive  # archive imports this module
+
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(users)')}
+    if 'timezone' in columns:
+        return False
+
+    # Partitions first: each is converted and committed on its own, and the
+    # conversion is idempotent, so an interrupted migration just runs again
+    for _, table in archive.partition_tables(conn):
+        _convert_text_timestamps(conn, table)
+        conn.commit()
+
+    # The column doubles as the marker that the migration finished
+    _convert_text_timestamps(conn, 'main.timer_sessions')
+    conn.execute(f"ALTER TABLE users ADD COLUMN timezone TEXT NOT NULL DEFAULT '{DEFAULT_TIMEZONE}'")
+    conn.execute('DROP TABLE IF EXISTS focus_daily')
+    conn.execute('DROP TABLE IF EXISTS focus_hourly')
+    conn.commit()
+    return True
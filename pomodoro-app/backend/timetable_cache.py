@@ -0,0 +1,181 @@
+"""
+Denormalized timetable summaries and cached timetable lists for PomodoroFlow API
+
+``timetables`` carries ``entry_count``, ``first_start`` and ``last_end`` for
+its entries, kept current by triggers on ``timetable_entries``, so listing a
+user's timetables never touches the entries table.
+
+Every change to a user's timetables (including the summary updates above)
+bumps that user's row in ``timetable_list_versions``. Listings are cached per
+user in process together with the version they were built at; a request only
+has to read the version (a primary key lookup) to know whether the cached
+list is still good. Because the version lives in the database, writes made by
+other worker processes invalidate the cache too.
+"""
+
+import sqlite3
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 4096
+
+SUMMARY_COLUMNS = (
+    ('entry_count', 'INTEGER NOT NULL DEFAULT 0'),
+    ('first_start', 'TIME'),
+    ('last_end', 'TIME'),
+)
+
+_RECOMPUTE = '''UPDATE timetables SET
+        entry_count = (SELECT COUNT(*) FROM timetable_entries WHERE timetable_id = timetables.id),
+        first_start = (SELECT MIN(start_time) FROM timetable_entries WHERE timetable_id = timetables.id),
+        last_end = (SELECT MAX(end_time) FROM timetable_entries WHERE timetable_id = timetables.id)'''
+
+_BUMP = '''INSERT INTO timetable_list_versions (user_id, version) VALUES ({user}, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1'''
+
+TRIGGERS = {
+    'timetable_entries_summary_insert': f'''
+        AFTER INSERT ON timetable_entries BEGIN
+            UPDATE timetables SET
+                entry_count = entry_count + 1,
+                first_start = CASE WHEN first_start IS NULL OR NEW.start_time < first_start
+                                   THEN NEW.start_time ELSE first_start END,
+                last_end = CASE WHEN last_end IS NULL OR NEW.end_time > last_end
+                                THEN NEW.end_time ELSE last_end END
+            WHERE id = NEW.timetable_id;
+        END''',
+    'timetable_entries_summary_delete': f'''
+        AFTER DELETE ON timetable_entries BEGIN
+            {_RECOMPUTE} WHERE id = OLD.timetable_id;
+        END''',
+    'timetable_entries_summary_update': f'''
+        AFTER UPDATE OF timetable_id, start_time, end_time ON timetable_entries BEGIN
+            {_RECOMPUTE} WHERE id IN (OLD.timetable_id, NEW.timetable_id);
+        END''',
+    'timetables_list_version_insert': f'''
+        AFTER INSERT ON timetables BEGIN
+            {_BUMP.format(user='NEW.user_id')};
+        END''',
+    'timetables_list_version_update': f'''
+        AFTER UPDATE ON timetables BEGIN
+            {_BUMP.format(user='NEW.user_id')};
+            {_BUMP.format(user='OLD.user_id')};
+        END''',
+    'timetables_list_version_delete': f'''
+        AFTER DELETE ON timetables BEGIN
+            {_BUMP.format(user='OLD.user_id')};
+        END''',
+}
+
+
+def init_timetable_summary_schema(conn):
+    """Add and backfill the summary columns, version table, indexes and triggers"""
+    existing = {row[1] for row in conn.execute('PRAGMA table_info(timetables)')}
+    missing = [(name, decl) for name, decl in SUMMARY_COLUMNS if name not in existing]
+    for name, decl in missing:
+        conn.execute(f'ALTER TABLE timetables ADD COLUMN {name} {decl}')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS timetable_list_versions (
+        user_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )''')
+
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_timetables_user_date
+                    ON timetables(user_id, date)''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_timetable_entries_timetable_start
+                    ON timetable_entries(timetable_id, start_time)''')
+
+    for name, body in TRIGGERS.items():
+        conn.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {body}')
+
+    if missing:
+        backfill(conn)
+
+
+def backfill(conn):
+    """Recompute every timetable's summary from its entries"""
+    conn.execute(_RECOMPUTE)
+
+
+def list_version(conn, user_id):
+    row = conn.execute(
+        'SELECT version FROM timetable_list_versions WHERE user_id = ?',
+        (user_id,)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def max_list_version(conn):
+    try:
+        row = conn.execute('SELECT MAX(version) FROM timetable_list_versions').fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] or 0
+
+
+def advance_list_versions(conn, floor):
+    """Move every list version above ``floor``, e.g. after the data was replaced wholesale.
+
+    Listings cached at any version up to ``floor`` then no longer match.
+    """
+    try:
+        conn.execute('UPDATE timetable_list_versions SET version = version + ?', (floor + 1,))
+    except sqlite3.OperationalError:
+        pass
+
+
+class TimetableListCache:
+    """LRU of per-user timetable listings tagged with their list version"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # (db_path, user_id, kind) -> (version, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is None or cached[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return cached[1]
+
+    def put(self, key, version, value):
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, db_path, user_id):
+        """Drop every cached listing for a user"""
+        with self._lock:
+            for key in [key for key in self._entries if key[:2] == (db_path, user_id)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+cache = TimetableListCache()
+
+
+def cached_list(conn, db_path, user_id, kind, load):
+    """Return ``load()`` for a user's timetables, cached until they change.
+
+    ``kind`` separates listings built in different shapes (encoded response
+    bodies, record lists). The version is read before the listing so a
+    concurrent write can only make the cached value look stale, never fresh.
+    """
+    version = list_version(conn, user_id)
+    key = (db_path, user_id, kind)
+    value = cache.get(key, version)
+    if value is None:
+        value = load()
+        cache.put(key, version, value)
+    return value
@@ -2,7 +2,7 @@
 import React, { useState } from 'react';
 import { Link, useNavigate } from 'react-router-dom';
 import { Timer, Eye, EyeOff } from 'lucide-react';
-import { api } from '../../utils/api';
+import { api, browserTimeZone } from '../../utils/api';
 
 const Login = ({ onLogin }) => {
   const navigate = useNavigate();
@@ -29,7 +29,7 @@ const Login = ({ onLogin }) => {
 
     try {
       console.log('Attempting login with:', formData);
-      const response = await api.post('/auth/login', formData);
+      const response = await api.post('/auth/login', { ...formData, timezone: browserTimeZone() });
       console.log('Login response:', response.data);
       
       if (response.data.user) {
@@ -2,7 +2,7 @@
 import React, { useState } from 'react';
 import { Link, useNavigate } from 'react-router-dom';
 import { Timer, Eye, EyeOff } from 'lucide-react';
-import { api } from '../../utils/api';
+import { api, browserTimeZone } from '../../utils/api';
 
 const Register = ({ onRegister }) => {
   const navigate = useNavigate();
@@ -40,7 +40,8 @@ const Register = ({ onRegister }) => {
       const response = await api.post('/auth/register', {
         username: formData.username,
         email: formData.email,
-        password: formData.password
+        password: formData.password,
+        timezone: browserTimeZone()
       });
       onRegister(response.data.user);
       navigate('/');  // Redirect to home after registration
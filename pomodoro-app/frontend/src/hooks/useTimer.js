@@ -32,7 +32,7 @@ export const useTimer = () => {
         const response = await api.post('/timer/sessions', {
           session_type: sessionType,
           duration: Math.ceil(initialTime.current / 60),
-        });
+        }, { idempotent: true });
         setCurrentSessionId(response.data.session_id);
         setIsActive(true);
       } catch (error) {
@@ -44,13 +44,13 @@ const History = ({ user }) => {
     // Apply sorting
     switch (sortBy) {
       case 'oldest':
-        filtered.sort((a, b) => new Date(a.started_at) - new Date(b.started_at));
+        filtered.sort((a, b) => a.started_at - b.started_at);
         break;
       case 'duration':
         filtered.sort((a, b) => b.duration - a.duration);
         break;
       default: // recent
-        filtered.sort((a, b) => new Date(b.started_at) - new Date(a.started_at));
+        filtered.sort((a, b) => b.started_at - a.started_at);
     }
 
     return filtered;
@@ -73,8 +73,17 @@ const History = ({ user }) => {
     };
   };
 
-  const formatDate = (dateString) => {
-    const date = new Date(dateString);
+  // Sessions from the last seven local days, today included (as /api/stats counts them)
+  const getWeeklySessions = () => {
+    const weekStart = new Date();
+    weekStart.setHours(0, 0, 0, 0);
+    weekStart.setDate(weekStart.getDate() - 6);
+    return sessions.filter(s => s.started_at >= weekStart.getTime() && s.completed);
+  };
+
+  // Timestamps are epoch milliseconds
+  const formatDate = (timestamp) => {
+    const date = new Date(timestamp);
     return date.toLocaleDateString() + ' at ' + date.toLocaleTimeString([], {
       hour: '2-digit',
       minute: '2-digit'
@@ -92,6 +101,7 @@ const History = ({ user }) => {
 
   const stats = getSessionStats();
   const displaySessions = filteredAndSortedSessions();
+  const weeklySessions = getWeeklySessions();
 
   if (loading) {
     return (
@@ -304,45 +314,27 @@ const History = ({ user }) => {
           <div className="grid grid-cols-2 md:grid-cols-4 gap-4">
             <div className="text-center">
               <div className="text-xl font-bold text-primary-500">
-                {sessions.filter(s => {
-                  const sessionDate = new Date(s.started_at);
-                  const weekAgo = new Date();
-                  weekAgo.setDate(weekAgo.getDate() - 7);
-                  return sessionDate >= weekAgo && s.completed && s.session_type === 'work';
-                }).length}
+                {weeklySessions.filter(s => s.session_type === 'work').length}
               </div>
               <div className="text-sm text-gray-600 dark:text-gray-400">Work Sessions</div>
             </div>
             <div className="text-center">
               <div className="text-xl font-bold text-green-500">
-                {sessions.filter(s => {
-                  const sessionDate = new Date(s.started_at);
-                  const weekAgo = new Date();
-                  weekAgo.setDate(weekAgo.getDate() - 7);
-                  return sessionDate >= weekAgo && s.completed && s.session_type === 'break';
-                }).length}
+                {weeklySessions.filter(s => s.session_type === 'break').length}
               </div>
               <div className="text-sm text-gray-600 dark:text-gray-400">Break Sessions</div>
             </div>
             <div className="text-center">
               <div className="text-xl font-bold text-blue-500">
-                {formatDuration(sessions.filter(s => {
-                  const sessionDate = new Date(s.started_at);
-                  const weekAgo = new Date();
-                  weekAgo.setDate(weekAgo.getDate() - 7);
-                  return sessionDate >= weekAgo && s.completed && s.session_type === 'work';
-                }).reduce((total, session) => total + session.duration, 0))}
+                {formatDuration(weeklySessions
+                  .filter(s => s.session_type === 'work')
+                  .reduce((total, session) => total + session.duration, 0))}
               </div>
               <div className="text-sm text-gray-600 dark:text-gray-400">Focus Time</div>
             </div>
             <div className="text-center">
               <div className="text-xl font-bold text-orange-500">
-                {Math.round(sessions.filter(s => {
-                  const sessionDate = new Date(s.started_at);
-                  const weekAgo = new Date();
-                  weekAgo.setDate(weekAgo.getDate() - 7);
-                  return sessionDate >= weekAgo && s.completed;
-                }).length / 7)}
+                {Math.round(weeklySessions.length / 7)}
               </div>
               <div className="text-sm text-gray-600 dark:text-gray-400">Daily Average</div>
             </div>
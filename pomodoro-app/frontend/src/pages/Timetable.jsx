@@ -59,7 +59,7 @@ const Timetable = ({ user }) => {
         await api.post('/timetables', {
           ...formData,
           entries: entries,
-        });
+        }, { idempotent: true });
         setShowCreateForm(false);
         fetchTimetables();
         setFormData({
@@ -3,6 +3,9 @@ import axios from 'axios';
 
 const API_BASE_URL = 'http://localhost:8000/api';
 
+const MAX_RETRIES = 2;
+const RETRY_DELAY_MS = 500;
+
 const api = axios.create({
   baseURL: API_BASE_URL,
   withCredentials: true,
@@ -11,9 +14,20 @@ const api = axios.create({
   },
 });
 
+const newIdempotencyKey = () =>
+  globalThis.crypto?.randomUUID?.() ??
+  `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+
 // Add request interceptor for debugging
 api.interceptors.request.use(
   config => {
+    // One key per logical write for endpoints that deduplicate on it
+    // (callers pass { idempotent: true }); retries reuse the config and so
+    // the key, letting the backend return the first response instead of
+    // writing twice
+    if (config.idempotent && !config.headers['Idempotency-Key']) {
+      config.headers['Idempotency-Key'] = newIdempotencyKey();
+    }
     console.log('API Request:', config.method?.toUpperCase(), config.url, config.data);
     return config;
   },
@@ -30,6 +44,16 @@ api.interceptors.response.use(
     return response;
   },
   error => {
+    const config = error.config;
+    const retriable = !error.response || [502, 503, 504].includes(error.response.status);
+    // Other POSTs (register, login, logout) may have taken effect already
+    const safeToRepeat = config && (config.method !== 'post' || config.idempotent);
+    if (retriable && safeToRepeat && (config.retryCount ?? 0) < MAX_RETRIES) {
+      config.retryCount = (config.retryCount ?? 0) + 1;
+      const delay = RETRY_DELAY_MS * 2 ** (config.retryCount - 1);
+      return new Promise(resolve => setTimeout(resolve, delay)).then(() => api(config));
+    }
+
     console.error('API Response Error:', error.response?.status, error.response?.data);
     const errorMessage = error.response?.data?.error || 
                          error.response?.data?.message || 
@@ -38,4 +62,13 @@ api.interceptors.response.use(
   }
 );
 
-export { api };
\ No newline at end of file
+// IANA time zone of the browser, sent at login so stats use the user's days
+const browserTimeZone = () => {
+  try {
+    return Intl.DateTimeFormat().resolvedOptions().timeZone;
+  } catch {
+    return undefined;
+  }
+};
+
+export { api, browserTimeZone };
\ No newline at end of file
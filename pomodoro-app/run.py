@@ -17,14 +17,7 @@ def run_backend():
     backend_dir = Path(__file__).parent / "backend"
     os.chdir(backend_dir)
     
-    # Initialize database if it doesn't exist
-    try:
-        subprocess.run([sys.executable, "-c", "from app import init_db; init_db(); print('Database initialized')"], 
-                      check=True, capture_output=True)
-    except subprocess.CalledProcessError:
-        print("Warning: Could not initialize database")
-    
-    # Start Flask server
+    # Start Flask server (it creates the database schema on its first request)
     try:
         subprocess.run([sys.executable, "app.py"], check=True)
     except KeyboardInterrupt: